@@ -5,7 +5,7 @@ from code_executor import execute_python_code
 def run_agent_workflow(query: str, metadata: dict, netcdf_path: str) -> dict:
     """
     Executes a ReAct loop to answer the user's query using Python code.
-    Returns a dict with 'response' (text) and 'images' (list of base64).
+    Returns a dict with 'response' (text) and 'images' (artifact_store references).
     """
     context = format_metadata_context(metadata)
     
@@ -1,11 +1,7 @@
 import json
-from llm_service import client, MODEL
+from llm_service import client, MODEL, get_async_client
 
-def evaluate_plan(query: str, plan: dict, metadata: dict) -> dict:
-    """
-    Evaluates the proposed plan for safety and correctness.
-    Returns JSON with 'approved' (bool) and 'feedback' (str).
-    """
+def build_evaluation_messages(query: str, plan: dict) -> list:
     system_prompt = """You are a Lead Engineer evaluating a data analysis plan.
     Review the plan to ensure it answers the user's query and uses the available tools correctly.
     
@@ -25,20 +21,41 @@ def evaluate_plan(query: str, plan: dict, metadata: dict) -> dict:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"User Query: {query}\n\nProposed Plan:\n{json.dumps(plan, indent=2)}"}
     ]
-    
+    return messages
+
+def parse_evaluation(content: str) -> dict:
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+        
+    evaluation = json.loads(content)
+    if not isinstance(evaluation, dict):
+        raise ValueError(f"Expected a JSON object, got {type(evaluation).__name__}")
+    return evaluation
+
+def evaluate_plan(query: str, plan: dict, metadata: dict) -> dict:
+    """
+    Evaluates the proposed plan for safety and correctness.
+    Returns JSON with 'approved' (bool) and 'feedback' (str).
+    """
     try:
         response = client.chat.completions.create(
             model=MODEL,
-            messages=messages
+            messages=build_evaluation_messages(query, plan)
         )
-        content = response.choices[0].message.content
-        
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-            
-        return json.loads(content)
+        return parse_evaluation(response.choices[0].message.content)
     except Exception as e:
         # Fail open for prototype if evaluation crashes, but log it
         return {"approved": True, "feedback": f"Evaluation failed ({e}), proceeding with caution."}
+
+async def evaluate_plan_async(query: str, plan: dict, metadata: dict) -> dict:
+    """Async evaluate_plan (same prompt and fallback)."""
+    try:
+        response = await get_async_client().chat.completions.create(
+            model=MODEL,
+            messages=build_evaluation_messages(query, plan)
+        )
+        return parse_evaluation(response.choices[0].message.content)
+    except Exception as e:
+        return {"approved": True, "feedback": f"Evaluation failed ({e}), proceeding with caution."}
@@ -1,11 +1,24 @@
+import os
 import json
-from llm_service import client, MODEL
-from code_executor import execute_python_code
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from llm_service import client, MODEL, get_async_client
+from code_executor import execute_python_code, execute_python_code_isolated
 
-def generate_and_execute_code(query: str, plan: dict, netcdf_path: str, scenario_path: str = None) -> dict:
-    """
-    Generates Python code based on the approved plan and executes it.
-    """
+MAX_RETRIES = 3
+# Candidate programs generated and executed in parallel (first success wins).
+# 1 = classic generate -> run -> fix loop. Candidates run on the worker pool, so
+# EXECUTOR_WORKERS should be at least this large.
+CODEGEN_CANDIDATES = int(os.getenv("CODEGEN_CANDIDATES", "1"))
+# Extra candidates are sampled hotter so they differ from the first one
+CANDIDATE_TEMPERATURE = float(os.getenv("CODEGEN_CANDIDATE_TEMPERATURE", "0.8"))
+# Ask for all candidates in one request with `n` (OpenAI, vLLM); providers that
+# ignore it and answer once are topped up with separate requests
+CODEGEN_USE_N = os.getenv("CODEGEN_USE_N", "0") == "1"
+POLL_INTERVAL = 0.1
+
+def build_codegen_messages(plan: dict) -> list:
     system_prompt = """You are a Python Code Generator.
     Your task is to write Python code to execute the provided PLAN.
     
@@ -38,50 +51,232 @@ def generate_and_execute_code(query: str, plan: dict, netcdf_path: str, scenario
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Plan:\n{plan_str}\n\nWrite the code."}
     ]
+    return messages
+
+def extract_code(content: str) -> str:
+    # Clean code
+    if "```python" in content:
+        return content.split("```python")[1].split("```")[0].strip()
+    elif "```" in content:
+        return content.split("```")[1].split("```")[0].strip()
+    else:
+        return content.strip()
+
+def build_fix_prompt(error_msg: str) -> str:
+    return f"""The code failed with this error:
+            {error_msg}
+            
+            Analyze why, fix the code, and output the FULL corrected code block.
+            """
+
+def cancelled_result(reason: str = "Cancelled before execution.") -> dict:
+    return {"success": False, "cancelled": True, "stderr": reason, "stdout": "", "images": []}
+
+def is_success(result: dict) -> bool:
+    return result["success"] and not result["stderr"]
+
+def candidate_requests(n: int) -> list:
+    """create() kwargs per candidate request. The first is the ordinary (cacheable) call."""
+    if CODEGEN_USE_N:
+        return [{"n": n, "cache": False}]
+    return [{}] + [{"cache": False, "temperature": CANDIDATE_TEMPERATURE}] * (n - 1)
+
+def top_up_requests(request: dict, received: int, n: int) -> list:
+    # An `n` request answered with fewer choices than asked for
+    if request.get("n") and received < n:
+        return [{"cache": False, "temperature": CANDIDATE_TEMPERATURE}] * (n - received)
+    return []
+
+def candidate_contents(response) -> list:
+    return [choice.message.content for choice in response.choices if choice.message.content]
+
+def run_candidates(messages: list, n: int, netcdf_path: str, scenario_path: str = None,
+                   cancel_event=None, approval=None) -> dict:
+    """
+    Requests `n` programs concurrently and runs each in its own process as soon as
+    it arrives. The first clean run wins and the others are terminated.
+    Returns {"result": ...} for a winner / cancellation / generation failure, or
+    {"result": first_failure, "content": its_code} when every candidate failed.
+    """
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=2 * n, thread_name_prefix="codegen-candidate")
+    generate = lambda request: candidate_contents(
+        client.chat.completions.create(model=MODEL, messages=messages, **request)
+    )
+    generating = {pool.submit(generate, request): request for request in candidate_requests(n)}
+    running = {}
+    failures, errors = [], []
+    approved = approval is None
+    pending = set(generating)
+    try:
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                return {"result": cancelled_result("Cancelled during execution.")}
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in generating:
+                    try:
+                        contents = future.result()
+                    except Exception as e:
+                        errors.append(str(e))
+                        continue
+                    for request in top_up_requests(generating[future], len(contents), n):
+                        extra = pool.submit(generate, request)
+                        generating[extra] = request
+                        pending.add(extra)
+                    if not approved:
+                        if not approval():
+                            return {"result": cancelled_result("Plan was rejected; generated code was not executed.")}
+                        approved = True
+                    for content in contents:
+                        run = pool.submit(execute_python_code_isolated, extract_code(content),
+                                          netcdf_path, scenario_path, stop)
+                        running[run] = content
+                        pending.add(run)
+                else:
+                    result = future.result()
+                    if is_success(result):
+                        result["code_generated"] = extract_code(running[future])
+                        return {"result": result}
+                    failures.append((running[future], result))
+    finally:
+        stop.set()  # Terminates the losers
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if failures:
+        content, result = failures[0]
+        return {"result": result, "content": content}
+    return {"result": {"success": False, "stderr": f"Initial Code Gen Error: {'; '.join(errors)}",
+                       "stdout": "", "images": []}}
+
+async def run_candidates_async(messages: list, n: int, netcdf_path: str, scenario_path: str = None,
+                               approval=None, cancel_event=None) -> dict:
+    """Async run_candidates: requests go through the async client; cancel with Task.cancel() or `cancel_event`."""
+    stop = threading.Event()
+    async_client = get_async_client()
+
+    async def generate(request):
+        return candidate_contents(await async_client.chat.completions.create(model=MODEL, messages=messages, **request))
+
+    generating = {asyncio.ensure_future(generate(request)): request for request in candidate_requests(n)}
+    running = {}
+    failures, errors = [], []
+    approved = approval is None
+    pending = set(generating)
+    try:
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                return {"result": cancelled_result("Cancelled during execution.")}
+            done, pending = await asyncio.wait(pending, timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task in generating:
+                    try:
+                        contents = task.result()
+                    except Exception as e:
+                        errors.append(str(e))
+                        continue
+                    for request in top_up_requests(generating[task], len(contents), n):
+                        extra = asyncio.ensure_future(generate(request))
+                        generating[extra] = request
+                        pending.add(extra)
+                    if not approved:
+                        if not await approval():
+                            return {"result": cancelled_result("Plan was rejected; generated code was not executed.")}
+                        approved = True
+                    for content in contents:
+                        run = asyncio.ensure_future(asyncio.to_thread(
+                            execute_python_code_isolated, extract_code(content), netcdf_path, scenario_path, stop
+                        ))
+                        running[run] = content
+                        pending.add(run)
+                else:
+                    result = task.result()
+                    if is_success(result):
+                        result["code_generated"] = extract_code(running[task])
+                        return {"result": result}
+                    failures.append((running[task], result))
+    finally:
+        stop.set()
+        for task in pending:
+            task.cancel()
+
+    if failures:
+        content, result = failures[0]
+        return {"result": result, "content": content}
+    return {"result": {"success": False, "stderr": f"Initial Code Gen Error: {'; '.join(errors)}",
+                       "stdout": "", "images": []}}
+
+def generate_and_execute_code(query: str, plan: dict, netcdf_path: str, scenario_path: str = None,
+                              cancel_event=None, approval=None) -> dict:
+    """
+    Generates Python code based on the approved plan and executes it.
+
+    - cancel_event: threading.Event; once set, no further LLM call or execution
+      starts and a running execution is stopped (speculation, the UI's cancel).
+
+    For speculative runs (code generated while the plan is still being evaluated):
+    - approval: callable blocking until the verdict is known, returns True to run
+      the generated code. Nothing is executed before it says so.
+    """
+    messages = build_codegen_messages(plan)
     
-    max_retries = 3
+    max_retries = MAX_RETRIES
     current_code = None
-    
-    # Initial generation
-    try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages
-        )
-        current_code = response.choices[0].message.content
-    except Exception as e:
-        return {"success": False, "stderr": f"Initial Code Gen Error: {e}", "stdout": "", "images": []}
+
+    first_result = None
+
+    if cancel_event is not None and cancel_event.is_set():
+        return cancelled_result()
+
+    if CODEGEN_CANDIDATES > 1:
+        # Parallel candidates; if all of them fail, the first one goes through the fix loop
+        outcome = run_candidates(messages, CODEGEN_CANDIDATES, netcdf_path, scenario_path, cancel_event, approval)
+        if "content" not in outcome:
+            return outcome["result"]
+        current_code, first_result = outcome["content"], outcome["result"]
+    else:
+        # Initial generation
+        try:
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=messages
+            )
+            current_code = response.choices[0].message.content
+        except Exception as e:
+            return {"success": False, "stderr": f"Initial Code Gen Error: {e}", "stdout": "", "images": []}
+
+        if approval is not None and not approval():
+            return cancelled_result("Plan was rejected; generated code was not executed.")
 
     for attempt in range(max_retries):
-        # Clean code
-        if "```python" in current_code:
-            code_to_run = current_code.split("```python")[1].split("```")[0].strip()
-        elif "```" in current_code:
-            code_to_run = current_code.split("```")[1].split("```")[0].strip()
-        else:
-            code_to_run = current_code.strip()
+        if cancel_event is not None and cancel_event.is_set():
+            return cancelled_result("Cancelled during execution.")
+        code_to_run = extract_code(current_code)
             
-        # Execute
-        result = execute_python_code(code_to_run, netcdf_path, scenario_path)
+        # Execute (a failed candidate's run is reused)
+        if first_result is not None:
+            result, first_result = first_result, None
+        else:
+            result = execute_python_code(code_to_run, netcdf_path, scenario_path, cancel_event)
+        if result.get("cancelled"):
+            return result
         
         # If successful or no stderr, return result
-        if result["success"] and not result["stderr"]:
+        if is_success(result):
             result["code_generated"] = code_to_run
             return result
             
         # If failed, try to fix
         error_msg = result["stderr"]
         print(f"Attempt {attempt+1} failed: {error_msg}")
-        
+        # Don't replay code that is known not to run from the response cache
+        client.chat.completions.invalidate(model=MODEL, messages=messages)
+        if cancel_event is not None and cancel_event.is_set():
+            return cancelled_result("Cancelled during execution.")
+
         if attempt < max_retries - 1:
-            fix_prompt = f"""The code failed with this error:
-            {error_msg}
-            
-            Analyze why, fix the code, and output the FULL corrected code block.
-            """
-            
             messages.append({"role": "assistant", "content": current_code})
-            messages.append({"role": "user", "content": fix_prompt})
+            messages.append({"role": "user", "content": build_fix_prompt(error_msg)})
             
             try:
                 response = client.chat.completions.create(
@@ -97,3 +292,71 @@ def generate_and_execute_code(query: str, plan: dict, netcdf_path: str, scenario
             return result
 
     return {"success": False, "stderr": "Max retries exceeded", "stdout": "", "images": []}
+
+async def generate_and_execute_code_async(query: str, plan: dict, netcdf_path: str, scenario_path: str = None,
+                                          approval=None, cancel_event=None) -> dict:
+    """
+    Async generate_and_execute_code: LLM calls are awaited on the shared pool,
+    code runs in a worker thread so the event loop keeps serving other analyses.
+    Speculative runs pass `approval` (async callable -> bool). Cancel with
+    Task.cancel() or by setting `cancel_event` (threading.Event); both stop a
+    running execution.
+    """
+    async_client = get_async_client()
+    cancel_event = cancel_event or threading.Event()
+    messages = build_codegen_messages(plan)
+    first_result = None
+
+    if CODEGEN_CANDIDATES > 1:
+        outcome = await run_candidates_async(messages, CODEGEN_CANDIDATES, netcdf_path, scenario_path, approval,
+                                             cancel_event)
+        if "content" not in outcome:
+            return outcome["result"]
+        current_code, first_result = outcome["content"], outcome["result"]
+    else:
+        try:
+            response = await async_client.chat.completions.create(model=MODEL, messages=messages)
+            current_code = response.choices[0].message.content
+        except Exception as e:
+            return {"success": False, "stderr": f"Initial Code Gen Error: {e}", "stdout": "", "images": []}
+
+        if approval is not None and not await approval():
+            return cancelled_result("Plan was rejected; generated code was not executed.")
+
+    for attempt in range(MAX_RETRIES):
+        if cancel_event.is_set():
+            return cancelled_result("Cancelled during execution.")
+        code_to_run = extract_code(current_code)
+        if first_result is not None:
+            result, first_result = first_result, None
+        else:
+            try:
+                result = await asyncio.to_thread(execute_python_code, code_to_run, netcdf_path, scenario_path,
+                                                 cancel_event)
+            except asyncio.CancelledError:
+                cancel_event.set()  # The thread keeps waiting otherwise; this stops the worker job
+                raise
+            if result.get("cancelled"):
+                return result
+        
+        if is_success(result):
+            result["code_generated"] = code_to_run
+            return result
+            
+        error_msg = result["stderr"]
+        print(f"Attempt {attempt+1} failed: {error_msg}")
+        async_client.chat.completions.invalidate(model=MODEL, messages=messages)
+        
+        if attempt < MAX_RETRIES - 1:
+            messages.append({"role": "assistant", "content": current_code})
+            messages.append({"role": "user", "content": build_fix_prompt(error_msg)})
+            try:
+                response = await async_client.chat.completions.create(model=MODEL, messages=messages)
+                current_code = response.choices[0].message.content
+            except Exception as e:
+                return {"success": False, "stderr": f"Fix Gen Error: {e}", "stdout": "", "images": []}
+        else:
+            result["code_generated"] = code_to_run
+            return result
+
+    return {"success": False, "stderr": "Max retries exceeded", "stdout": "", "images": []}
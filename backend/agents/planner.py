@@ -1,14 +1,12 @@
 import json
-from llm_service import client, MODEL
+import asyncio
+from llm_service import client, MODEL, get_async_client
 # Import the formatter we just made
 from schema_registry import format_context_for_planner
 from semantic_layer import format_semantic_context
-from memory_service import find_similar_code
+from memory_service import find_similar_code, record_recipe_use
 
-def plan_task(query: str, metadata_bundle: dict) -> dict:
-    
-    # 1. Check Memory First
-    similar_task = find_similar_code(query)
+def build_planning_messages(query: str, metadata_bundle: dict, similar_task: dict = None) -> list:
     
     memory_context = ""
     if similar_task:
@@ -27,7 +25,8 @@ def plan_task(query: str, metadata_bundle: dict) -> dict:
         """
 
     # Generate the text using the new smart formatter
-    context_str = format_context_for_planner(metadata_bundle)
+    # (token-budgeted: variables most relevant to the query first)
+    context_str = format_context_for_planner(metadata_bundle, query=query)
     
     # Add Level 2 Context
     # Assume we pull 'concepts' from the metadata_bundle
@@ -76,18 +75,40 @@ def plan_task(query: str, metadata_bundle: dict) -> dict:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"User Query: {query}"}
     ]
+    return messages
+
+def parse_plan(content: str) -> dict:
+    # JSON Cleanup
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+        
+    return json.loads(content)
+
+def plan_task(query: str, metadata_bundle: dict) -> dict:
+    
+    # 1. Check Memory First (only recipes that fit this file's variables)
+    similar_task = find_similar_code(query, schema=metadata_bundle.get('baseline'))
+    if similar_task:
+        record_recipe_use(similar_task)
 
-    # ... (Rest of the standard API call logic remains the same)
+    messages = build_planning_messages(query, metadata_bundle, similar_task)
     try:
         response = client.chat.completions.create(model=MODEL, messages=messages)
-        content = response.choices[0].message.content
-        
-        # JSON Cleanup
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-            
-        return json.loads(content)
+        return parse_plan(response.choices[0].message.content)
+    except Exception as e:
+        return {"thought": f"Error: {e}", "steps": []}
+
+async def plan_task_async(query: str, metadata_bundle: dict) -> dict:
+    """Async plan_task. The memory lookup (embedding + search) runs in a worker thread."""
+    similar_task = await asyncio.to_thread(find_similar_code, query, schema=metadata_bundle.get('baseline'))
+    if similar_task:
+        await asyncio.to_thread(record_recipe_use, similar_task)
+
+    messages = build_planning_messages(query, metadata_bundle, similar_task)
+    try:
+        response = await get_async_client().chat.completions.create(model=MODEL, messages=messages)
+        return parse_plan(response.choices[0].message.content)
     except Exception as e:
         return {"thought": f"Error: {e}", "steps": []}
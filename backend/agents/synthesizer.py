@@ -1,9 +1,7 @@
-from llm_service import client, MODEL
+from llm_service import client, MODEL, get_async_client
+from llm_scheduler import PRIORITY_INTERACTIVE
 
-def synthesize_response(query: str, plan: dict, execution_result: dict) -> str:
-    """
-    Synthesizes the final natural language response based on execution results.
-    """
+def build_synthesis_messages(query: str, plan: dict, execution_result: dict) -> list:
     system_prompt = """You are a Data Analyst.
     Synthesize a final answer for the user based on the analysis results.
     
@@ -28,12 +26,53 @@ def synthesize_response(query: str, plan: dict, execution_result: dict) -> str:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": context}
     ]
-    
+    return messages
+
+def synthesize_response(query: str, plan: dict, execution_result: dict) -> str:
+    """
+    Synthesizes the final natural language response based on execution results.
+    """
     try:
         response = client.chat.completions.create(
             model=MODEL,
-            messages=messages
+            messages=build_synthesis_messages(query, plan, execution_result),
+            priority=PRIORITY_INTERACTIVE
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        return f"Error synthesizing response: {e}"
+
+async def synthesize_response_async(query: str, plan: dict, execution_result: dict) -> str:
+    """Async synthesize_response."""
+    try:
+        response = await get_async_client().chat.completions.create(
+            model=MODEL,
+            messages=build_synthesis_messages(query, plan, execution_result),
+            priority=PRIORITY_INTERACTIVE
         )
         return response.choices[0].message.content
     except Exception as e:
         return f"Error synthesizing response: {e}"
+
+def stream_synthesized_response(query: str, plan: dict, execution_result: dict):
+    """Yields the final answer token by token (same prompt as synthesize_response)."""
+    try:
+        yield from client.chat.completions.stream_text(
+            model=MODEL,
+            messages=build_synthesis_messages(query, plan, execution_result),
+            priority=PRIORITY_INTERACTIVE
+        )
+    except Exception as e:
+        yield f"Error synthesizing response: {e}"
+
+async def stream_synthesized_response_async(query: str, plan: dict, execution_result: dict):
+    """Async stream_synthesized_response."""
+    try:
+        async for text in get_async_client().chat.completions.stream_text(
+            model=MODEL,
+            messages=build_synthesis_messages(query, plan, execution_result),
+            priority=PRIORITY_INTERACTIVE
+        ):
+            yield text
+    except Exception as e:
+        yield f"Error synthesizing response: {e}"
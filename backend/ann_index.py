@@ -0,0 +1,162 @@
+import os
+import numpy as np
+
+# IVF (inverted file) index tuning knobs:
+#   MEMORY_ANN_LISTS      -> number of k-means cells (0 = auto, ~sqrt(N))
+#   MEMORY_ANN_NPROBE     -> cells scanned per query (higher = better recall, slower)
+#   MEMORY_ANN_MIN_SIZE   -> below this many rows search stays exact (brute force is faster anyway)
+ANN_LISTS = int(os.getenv("MEMORY_ANN_LISTS", "0"))
+ANN_NPROBE = int(os.getenv("MEMORY_ANN_NPROBE", "8"))
+ANN_MIN_SIZE = int(os.getenv("MEMORY_ANN_MIN_SIZE", "4096"))
+# Re-cluster once the store has grown this many times beyond the training size
+ANN_RETRAIN_FACTOR = float(os.getenv("MEMORY_ANN_RETRAIN_FACTOR", "4"))
+
+KMEANS_ITERATIONS = 10
+TRAIN_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK = 8192
+
+
+def select_top_k(scores, k):
+    """(index, score) pairs of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    ordered = candidates[np.argsort(-scores[candidates])]
+    return [(int(i), float(scores[i])) for i in ordered]
+
+
+class IVFIndex:
+    """
+    Pure-numpy IVF index over L2-normalised vectors (cosine similarity).
+
+    The index only keeps centroids and row ids per cell; candidate vectors are
+    fetched from the caller's matrix at query time, so the memory-mapped store
+    is never copied into RAM.
+    """
+
+    def __init__(self, n_lists=ANN_LISTS, n_probe=ANN_NPROBE, retrain_factor=ANN_RETRAIN_FACTOR, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+
+        self.centroids = None
+        self.trained_size = 0
+        self.count = 0  # Rows [0, count) are indexed
+        self._lists = []
+        self._arrays = []
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def needs_retrain(self, size):
+        return not self.trained or size > self.trained_size * self.retrain_factor
+
+    # --- TRAINING ---
+    def train(self, vectors):
+        """Spherical k-means on (a sample of) the rows, then assigns every row."""
+        n = len(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, n_lists * TRAIN_SAMPLES_PER_LIST)
+        sample_ids = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty cells with random samples so every list stays useful
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = n
+        self.count = 0
+        self._lists = [[] for _ in range(n_lists)]
+        self._arrays = [None] * n_lists
+        self.add(np.arange(n), vectors)
+
+    def _assign(self, vectors):
+        assignment = []
+        for start in range(0, len(vectors), ASSIGN_CHUNK):
+            chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK], dtype=np.float32)
+            assignment.append(np.argmax(chunk @ self.centroids.T, axis=1))
+        return np.concatenate(assignment) if assignment else np.zeros(0, dtype=np.int64)
+
+    # --- INSERTION ---
+    def add(self, ids, vectors):
+        """Incrementally assigns new rows to their nearest cell (no re-clustering)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        for row, cell in zip(ids.tolist(), self._assign(vectors).tolist()):
+            self._lists[cell].append(row)
+            self._arrays[cell] = None
+        self.count = max(self.count, int(ids.max()) + 1)
+
+    def _cell(self, cell):
+        if self._arrays[cell] is None:
+            self._arrays[cell] = np.asarray(self._lists[cell], dtype=np.int64)
+        return self._arrays[cell]
+
+    # --- SEARCH ---
+    def search(self, query, matrix, top_k=1, n_probe=None):
+        """
+        Returns (row, score) pairs for the best rows among the n_probe closest cells.
+        `query` must be normalised; `matrix` is the (memory-mapped) row source.
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        cell_scores = self.centroids @ query
+        cells = np.argpartition(-cell_scores, n_probe - 1)[:n_probe]
+
+        candidates = np.concatenate([self._cell(c) for c in cells])
+        if len(candidates) == 0:
+            return []
+        # Sorted ids keep reads from the memory map sequential
+        candidates.sort()
+        scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+        return [(int(candidates[i]), score) for i, score in select_top_k(scores, top_k)]
+
+    # --- PERSISTENCE ---
+    def save(self, path, **meta):
+        sizes = np.array([len(l) for l in self._lists], dtype=np.int64)
+        ids = np.concatenate([self._cell(c) for c in range(len(self._lists))]) if self._lists else np.zeros(0, dtype=np.int64)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            sizes=sizes,
+            ids=ids,
+            state=np.array([self.trained_size, self.count], dtype=np.int64),
+            **{f"meta_{k}": np.array(v) for k, v in meta.items()}
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Returns (index, meta) or (None, None) if the file is missing or unreadable."""
+        try:
+            with np.load(path) as data:
+                index = cls(**kwargs)
+                index.centroids = data["centroids"]
+                index.trained_size, index.count = (int(v) for v in data["state"])
+                offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+                ids = data["ids"]
+                index._lists = [ids[offsets[i]:offsets[i + 1]].tolist() for i in range(len(data["sizes"]))]
+                index._arrays = [None] * len(index._lists)
+                meta = {k[len("meta_"):]: data[k].item() for k in data.files if k.startswith("meta_")}
+            return index, meta
+        except (OSError, KeyError, ValueError):
+            return None, None
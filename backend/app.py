@@ -1,14 +1,47 @@
 import streamlit as st
 import os
 import shutil
+import threading
 from agent_workflow import run_agent_workflow
-from orchestrator import run_orchestrator
+from orchestrator import run_orchestrator, run_orchestrator_stream
 from profiling import check_compatibility
 from schema_registry import analyze_netcdf_schema
 from semantic_layer import resolve_concepts_for_schema # <--- New Import
+from llm_service import client, scheduler
+from worker_pool import EXECUTOR_WORKERS, get_worker_pool
+from artifact_store import artifact_store, is_ref
 
 st.set_page_config(page_title="NetCDF LLM Analyst", layout="wide")
 
+# Fork the code workers once per server process (no-op on later reruns)
+if EXECUTOR_WORKERS > 0:
+    get_worker_pool()
+
+def show_image(image, caption=None):
+    # Figures are artifact references, loaded from disk only when drawn
+    # (chat history keeps the short reference, not the PNG)
+    if not is_ref(image):
+        st.image(f"data:image/png;base64,{image}", caption=caption)  # Older sessions
+        return
+    path = artifact_store.path(image)
+    if path is None:
+        st.caption("🖼️ This figure is no longer in the artifact store.")
+    else:
+        st.image(path, caption=caption)
+
+def final_status(steps_log):
+    """Label and state of the workflow status box once the orchestrator is done."""
+    statuses = {step["stage"]: step["status"] for step in steps_log}
+    if "cancelled" in statuses.values():
+        return "⏹️ Analysis Cancelled", "error"
+    if statuses.get("Evaluation") == "rejected":
+        return "🚫 Plan Rejected", "error"
+    if statuses.get("Recipe Replay") == "complete":
+        return "♻️ Answered from a Saved Recipe", "complete"
+    if statuses.get("Execution") == "failed":
+        return "⚠️ Analysis Finished with Errors", "error"
+    return "✅ Analysis Complete!", "complete"
+
 st.title("🌍 NetCDF LLM Analyst")
 st.markdown("Upload NetCDF files and ask questions about them in natural language.")
 
@@ -140,6 +173,17 @@ with st.sidebar:
         for filename in st.session_state.metadata.keys():
             st.text(f"📄 {filename}")
 
+    # LLM response cache (shared on disk by all sessions)
+    if client.cache is not None:
+        stats = client.cache.summary()
+        st.caption(f"⚡ LLM cache: {stats['hits']} hits / {stats['misses']} misses, "
+                   f"~{stats['saved_seconds']:.0f}s saved ({stats['entries']} stored)")
+
+    # LLM scheduler (requests from all sessions queue here)
+    load = scheduler.summary()
+    st.caption(f"🚦 LLM queue: {load['in_flight']}/{load['max_in_flight']} running, {load['queued']} waiting, "
+               f"p95 wait {load['wait_ms_p95']:.0f}ms")
+
 # Main chat interface
 st.subheader("Chat Analysis")
 
@@ -184,7 +228,7 @@ if st.session_state.analysis:
 
         with col2:
             if "preview_image" in profile:
-                st.image(f"data:image/png;base64,{profile['preview_image']}", caption="Domain Bathymetry")
+                show_image(profile['preview_image'], caption="Domain Bathymetry")
             elif "preview_error" in profile:
                 st.warning(f"Could not generate preview: {profile['preview_error']}")
 
@@ -216,15 +260,15 @@ for message in st.session_state.messages:
         st.markdown(message["content"])
         # Display images if present
         if "images" in message:
-            for img_str in message["images"]:
-                st.image(f"data:image/png;base64,{img_str}")
+            for image in message["images"]:
+                show_image(image)
 
 # Chat input
 if prompt := st.chat_input("Ask about your data..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.rerun()
 
-from orchestrator import run_orchestrator
+from orchestrator import run_orchestrator, run_orchestrator_stream
 
 # ... (existing imports)
 
@@ -255,27 +299,45 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                 scen_name = os.path.basename(st.session_state.scenario_path)
                 metadata_bundle['scenario'] = st.session_state.metadata.get(scen_name)
             
-            # Run Orchestrator
+            # Run Orchestrator (streamed: stages update live, the answer renders token by token)
             try:
-                result = run_orchestrator(
+                # Set when the script stops (Stop button / rerun): kills the running code
+                cancel = threading.Event()
+                events = run_orchestrator_stream(
                     st.session_state.messages[-1]["content"], 
                     metadata_bundle, # <--- This is the dictionary of schemas
                     st.session_state.baseline_path, 
-                    st.session_state.scenario_path
+                    st.session_state.scenario_path,
+                    cancel_event=cancel
                 )
+                result = {}
                 
-                # Visualize Steps
-                for step in result.get("steps_log", []):
-                    status_container.write(f"**{step['stage']}**: {step['status']}")
-                    if step.get("output"):
-                        with status_container.expander(f"Details: {step['stage']}"):
-                            st.json(step["output"])
-                
-                status_container.update(label="✅ Analysis Complete!", state="complete", expanded=False)
+                def answer_tokens():
+                    try:
+                        for event in events:
+                            if event["type"] == "step":
+                                step = event["step"]
+                                if step["status"] == "running":
+                                    status_container.update(label=f"🤖 {step['stage']}...")
+                                    continue
+                                # Visualize Steps
+                                status_container.write(f"**{step['stage']}**: {step['status']}")
+                                if step.get("output"):
+                                    with status_container.expander(f"Details: {step['stage']}"):
+                                        st.json(step["output"])
+                            elif event["type"] == "token":
+                                yield event["text"]
+                            elif event["type"] == "done":
+                                result.update(event["result"])
+                                # Every run ends here, whichever stage it stopped at
+                                label, state = final_status(result["steps_log"])
+                                status_container.update(label=label, state=state, expanded=False)
+                    finally:
+                        cancel.set()
                 
-                st.markdown(result["response"])
-                for img_str in result["images"]:
-                    st.image(f"data:image/png;base64,{img_str}")
+                st.write_stream(answer_tokens())
+                for image in result["images"]:
+                    show_image(image)
                     
                 # Add assistant response to chat history
                 st.session_state.messages.append({
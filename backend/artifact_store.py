@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from file_lock import file_lock
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Figures produced by executed code are written here once and referred to by
+# content hash ("<sha256>.png") in results, chat history and API responses,
+# instead of travelling around (and sitting in session state) as base64 strings.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(BASE_DIR, "cache", "artifacts"))
+# Oldest (least recently written or served) artifacts are deleted beyond this size
+ARTIFACT_STORE_MB = int(os.getenv("ARTIFACT_STORE_MB", "512"))
+# Eviction scans the directory at most once per this many writes
+EVICT_EVERY = 20
+
+_REF = re.compile(r"^[0-9a-f]{64}\.(png|svg|jpg)$")
+_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml", "jpg": "image/jpeg"}
+
+
+def is_ref(value):
+    return isinstance(value, str) and bool(_REF.match(value))
+
+
+class ArtifactStore:
+    """
+    Content-addressed files on disk, sharded by the first two hex digits of their
+    sha256. Writing the same bytes twice stores them once. Shared by the server and
+    the pool workers (atomic renames; eviction runs under a file lock).
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, max_bytes=ARTIFACT_STORE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"writes": 0, "dedup": 0, "evicted": 0}
+
+    def _path(self, ref):
+        if not is_ref(ref):
+            raise ValueError(f"Not an artifact reference: {ref!r}")
+        return os.path.join(self.directory, ref[:2], ref)
+
+    def put(self, data: bytes, ext="png") -> str:
+        """Stores `data`, returns its reference."""
+        ref = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self._path(ref)
+        try:
+            os.utime(path)  # Recently used again
+        except FileNotFoundError:
+            pass  # New, or evicted (possibly by another process just now): write it
+        else:
+            with self._lock:
+                self.stats["dedup"] += 1
+            return ref
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.stats["writes"] += 1
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 1
+        if due:
+            self.evict()
+        return ref
+
+    def path(self, ref):
+        """Filesystem path of `ref`, or None if it is unknown or was evicted."""
+        try:
+            path = self._path(ref)
+        except ValueError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def get(self, ref):
+        """Contents of `ref`, or None if it is unknown or was evicted."""
+        path = self.path(ref)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # Evicted since path() looked
+
+    def touch(self, ref):
+        """Marks `ref` as recently used. Returns False if it is unknown or was evicted."""
+        path = self.path(ref)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def media_type(ref):
+        return _MEDIA_TYPES[ref.rsplit(".", 1)[1]]
+
+    def _files(self):
+        files = []
+        for shard in os.scandir(self.directory) if os.path.isdir(self.directory) else []:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if is_ref(entry.name):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def evict(self):
+        """Deletes the least recently used artifacts until the store fits max_bytes."""
+        if self.max_bytes <= 0:
+            return 0
+        removed = 0
+        with file_lock(os.path.join(self.directory, ".evict.lock")):
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self.stats["evicted"] += removed
+        return removed
+
+    def summary(self):
+        files = self._files()
+        with self._lock:
+            return dict(self.stats, files=len(files), mb=sum(size for _, size, _ in files) / 1e6)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,122 @@
+import argparse
+import cProfile
+import os
+import pstats
+import statistics
+import tempfile
+import time
+import numpy as np
+import xarray as xr
+from llm_standin import Recording, StandInServer
+
+# End-to-end run_orchestrator benchmark against the local LLM stand-in, so the
+# non-LLM work (schema, context, code execution, plotting, memory) can be
+# profiled on a machine with no network. The app modules are imported only
+# after the environment points them at the stand-in.
+
+DEFAULT_QUERIES = [
+    "Plot the water surface elevation at the last time step",
+    "What is the maximum depth?",
+    "Show the mean elevation over time",
+]
+
+def synthetic_schism_file(path, n_nodes=20000, n_times=24, seed=0):
+    """A SCHISM-like out2d file: node coordinates, depth and elevation over time."""
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(-76, -75, n_nodes), rng.uniform(38, 39, n_nodes)
+    depth = rng.uniform(0, 30, n_nodes)
+    elev = np.sin(np.arange(n_times)[:, None] / 4 + x[None, :]) * rng.uniform(0.5, 1.5, n_nodes)
+    xr.Dataset(
+        {
+            "elev": (("time", "nSCHISM_hgrid_node"), elev.astype(np.float32), {"long_name": "Water surface elevation", "units": "m"}),
+            "depth": (("nSCHISM_hgrid_node",), depth.astype(np.float32), {"long_name": "Bathymetry", "units": "m"}),
+            "SCHISM_hgrid_node_x": (("nSCHISM_hgrid_node",), x),
+            "SCHISM_hgrid_node_y": (("nSCHISM_hgrid_node",), y),
+        },
+        coords={"time": np.arange(n_times) * 3600.0},
+    ).to_netcdf(path)
+    return path
+
+def point_app_at(base_url, workdir, llm_cache=False):
+    """Environment for the app modules: local provider = stand-in, throwaway stores."""
+    os.environ["LLM_PROVIDER"] = "local"
+    os.environ["LM_STUDIO_BASE_URL"] = base_url
+    os.environ["LLM_CACHE"] = "1" if llm_cache else "0"
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_responses.sqlite")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embeddings.sqlite")
+    os.environ["MEMORY_STORE_DIR"] = os.path.join(workdir, "memory_store")
+
+def run_benchmark(netcdf_path, queries, repeats=1):
+    """
+    Runs every query `repeats` times through the streaming orchestrator and
+    returns {stage: [seconds]} plus the wall time of each full run.
+    """
+    from schema_registry import analyze_netcdf_schema
+    from semantic_layer import resolve_concepts_for_schema
+    from orchestrator import run_orchestrator_stream
+
+    timings = {"Schema": []}
+    totals = []
+    for _ in range(repeats):
+        for query in queries:
+            run_start = time.perf_counter()
+            schema = analyze_netcdf_schema(netcdf_path)
+            bundle = {"schema": schema, "concepts": resolve_concepts_for_schema(schema),
+                      "filename": os.path.basename(netcdf_path)}
+            timings["Schema"].append(time.perf_counter() - run_start)
+
+            stage_start = {}
+            for event in run_orchestrator_stream(query, {"baseline": bundle}, netcdf_path):
+                if event["type"] != "step":
+                    continue
+                step = event["step"]
+                if step["status"] == "running":
+                    stage_start[step["stage"]] = time.perf_counter()
+                elif step["stage"] in stage_start:
+                    elapsed = time.perf_counter() - stage_start.pop(step["stage"])
+                    timings.setdefault(step["stage"], []).append(elapsed)
+            totals.append(time.perf_counter() - run_start)
+    return timings, totals
+
+def print_results(timings, totals, stats):
+    print(f"{'stage':<12} {'runs':<6} {'mean ms':<10} {'p50 ms':<10} {'max ms':<10}")
+    for stage, values in list(timings.items()) + [("Total", totals)]:
+        print(f"{stage:<12} {len(values):<6} {statistics.mean(values) * 1000:<10.1f} "
+              f"{statistics.median(values) * 1000:<10.1f} {max(values) * 1000:<10.1f}")
+    print(f"LLM stand-in: {stats}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of run_orchestrator.")
+    parser.add_argument("--file", help="NetCDF file to analyse (default: synthetic SCHISM-like file)")
+    parser.add_argument("--nodes", type=int, default=20000, help="Nodes in the synthetic file")
+    parser.add_argument("--query", action="append", help="Query to run (repeatable); default: a small fixed set")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--recording", help="Replay this recording (misses get synthetic answers)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Artificial seconds per LLM answer")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Artificial seconds per streamed chunk")
+    parser.add_argument("--recorded-latency", action="store_true", help="Replay with the recorded latencies")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache on")
+    parser.add_argument("--profile", help="Write cProfile stats here and print the top functions")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="orchestrator_bench_")
+    # A missing recording file is fine: everything is answered synthetically
+    recording = Recording(args.recording or os.path.join(workdir, "recording.jsonl"))
+    server = StandInServer(("127.0.0.1", 0), "replay", recording, latency=args.latency,
+                           chunk_latency=args.chunk_latency, recorded_latency=args.recorded_latency).start()
+    point_app_at(server.base_url, workdir, args.llm_cache)
+
+    netcdf_path = args.file or synthetic_schism_file(os.path.join(workdir, "out2d_bench.nc"), args.nodes)
+    queries = args.query or DEFAULT_QUERIES
+    print(f"Benchmarking {len(queries)} queries x {args.repeats} on {netcdf_path} via {server.base_url}...")
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    timings, totals = run_benchmark(netcdf_path, queries, args.repeats)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(args.profile).sort_stats("cumulative").print_stats(25)
+    print_results(timings, totals, server.stats)
+    server.shutdown()
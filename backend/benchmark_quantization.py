@@ -0,0 +1,77 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from quantization import STORAGE_DTYPES
+from vector_store import VectorStore
+
+def synthetic_vectors(n, dim, seed=0):
+    """Clustered unit vectors, roughly shaped like sentence embeddings of similar questions."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 50), dim))
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def run_benchmark(vectors, n_queries=100, top_k=10, seed=0):
+    """
+    Builds one store per storage type from the same vectors and reports
+    recall@k against exact float32 search, with and without full-precision rescoring.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.1 * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    records = [{"query": str(i)} for i in range(len(vectors))]
+
+    # Ground truth: exact float32 scan
+    truth = [set(np.argsort(-(vectors @ (q / np.linalg.norm(q))))[:top_k].tolist()) for q in queries]
+
+    results = []
+    for dtype in STORAGE_DTYPES:
+        directory = tempfile.mkdtemp()
+        try:
+            # ann_min_size=0 keeps this a pure storage-precision comparison (exact scan)
+            store = VectorStore(directory, dtype=dtype, ann_min_size=0)
+            start = time.perf_counter()
+            store.add_many(vectors, records)
+            load_s = time.perf_counter() - start
+            matrix = store.matrix()
+            footprint = matrix.nbytes
+
+            for rescore in ([False, True] if dtype != "float32" else [False]):
+                recalls = []
+                start = time.perf_counter()
+                for q, expected in zip(queries, truth):
+                    hits = store.search(q, top_k=top_k, exact=True, rescore=rescore)
+                    recalls.append(len({int(r["query"]) for r, _ in hits} & expected) / top_k)
+                ms = (time.perf_counter() - start) / len(queries) * 1000
+                results.append({
+                    "dtype": dtype, "rescore": rescore, "recall": float(np.mean(recalls)),
+                    "ms_per_query": ms, "search_bytes": footprint, "build_s": load_s
+                })
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def print_results(results, top_k):
+    print(f"{'dtype':<8} {'rescore':<8} {'recall@' + str(top_k):<10} {'ms/query':<10} {'search MB':<10}")
+    for r in results:
+        print(f"{r['dtype']:<8} {str(r['rescore']):<8} {r['recall']:<10.4f} {r['ms_per_query']:<10.2f} "
+              f"{r['search_bytes'] / 1e6:<10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall / footprint of quantised recipe vectors vs float32.")
+    parser.add_argument("--store", help="Existing vector store directory to sample vectors from")
+    parser.add_argument("-n", type=int, default=20000, help="Synthetic vectors (ignored with --store)")
+    parser.add_argument("--dim", type=int, default=2560, help="Synthetic dimension (qwen3-embedding-4b is 2560)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.store and os.path.exists(args.store):
+        vectors = np.asarray(VectorStore(args.store).full_matrix(), dtype=np.float32)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+    print(f"Benchmarking {len(vectors)} x {vectors.shape[1]} vectors, {args.queries} queries...")
+    print_results(run_benchmark(vectors, args.queries, args.k), args.k)
@@ -0,0 +1,66 @@
+import argparse
+import io
+import time
+import tracemalloc
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import matplotlib.tri as tri
+from rasterize import RASTER_WIDTH, draw_raster
+
+def synthetic_mesh(n_nodes, seed=0):
+    """Jittered quad grid split into triangles (~2 triangles per node), with a smooth field on it."""
+    rng = np.random.default_rng(seed)
+    nx = max(2, int(np.sqrt(2 * n_nodes)))
+    ny = max(2, n_nodes // nx)
+    gx, gy = np.meshgrid(np.linspace(0, 2, nx), np.linspace(0, 1, ny))
+    step = 1 / nx
+    x = gx.ravel() + rng.uniform(-0.2, 0.2, gx.size) * step
+    y = gy.ravel() + rng.uniform(-0.2, 0.2, gy.size) * step
+    idx = np.arange(nx * ny).reshape(ny, nx)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, 1:].ravel(), idx[1:, :-1].ravel()
+    triangles = np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)])
+    values = np.sin(5 * x) * np.cos(7 * y)
+    return tri.Triangulation(x, y, triangles), values
+
+def render(draw):
+    """Time and peak Python-side memory of one figure, PNG included (the draw is where tripcolor pays)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fig, ax = plt.subplots(figsize=(10, 8))
+    mappable = draw(ax)
+    fig.colorbar(mappable, ax=ax)
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def run_benchmark(node_counts, width=RASTER_WIDTH, skip_tripcolor_above=None):
+    results = []
+    for n in node_counts:
+        triangulation, values = synthetic_mesh(n)
+        paths = {"raster": lambda ax: draw_raster(ax, triangulation, values, width=width)}
+        if skip_tripcolor_above is None or n <= skip_tripcolor_above:
+            paths["tripcolor"] = lambda ax: ax.tripcolor(triangulation, values, shading="flat")
+        for name, draw in paths.items():
+            seconds, peak = render(draw)
+            results.append({"nodes": len(triangulation.x), "triangles": len(triangulation.triangles),
+                            "path": name, "seconds": seconds, "peak_mb": peak / 1e6})
+    return results
+
+def print_results(results):
+    print(f"{'nodes':>10} {'triangles':>10} {'path':<10} {'seconds':>8} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['nodes']:>10} {r['triangles']:>10} {r['path']:<10} {r['seconds']:>8.2f} {r['peak_mb']:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="plot_unstructured: tripcolor vs the vectorised rasterizer.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[50_000, 250_000, 1_000_000])
+    parser.add_argument("--width", type=int, default=RASTER_WIDTH, help="Raster width in pixels")
+    parser.add_argument("--skip-tripcolor-above", type=int, help="Only time the rasterizer on bigger meshes")
+    args = parser.parse_args()
+    print_results(run_benchmark(args.nodes, args.width, args.skip_tripcolor_above))
@@ -1,23 +1,91 @@
 import io
 import contextlib
-import base64
 import matplotlib.pyplot as plt
 import matplotlib.tri as tri
 import xarray as xr
 import numpy as np
 import scipy
 import os
+import builtins
+import functools
+import sys
+import threading
+from dataset_cache import dataset_cache
+from figure_capture import FigureCapture, capturing
+from out_of_core import auto_chunks, dask_scheduler, describe_chunks
+from mesh import has_connectivity, mesh_triangulation
+from rasterize import draw_raster, use_raster
+from worker_pool import EXECUTOR_WORKERS, get_worker_pool, limit_result
 
-def plot_unstructured(variable, x, y, title="Unstructured Mesh Plot", cmap=None):
+class _ThreadStream:
+    """sys.stdout / sys.stderr stand-in writing to the stream set by the current thread, if any."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "target", None) or self._stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+_stream_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _capture_output(stdout, stderr):
+    """
+    contextlib.redirect_stdout / redirect_stderr for the current thread only, so
+    executions running side by side (async orchestrator, Streamlit sessions) keep
+    their output apart. Threads started by the executed code print to the console.
+    """
+    streams = []
+    with _stream_lock:
+        for name in ("stdout", "stderr"):
+            if not isinstance(getattr(sys, name), _ThreadStream):
+                setattr(sys, name, _ThreadStream(getattr(sys, name)))
+            streams.append(getattr(sys, name))
+    previous = [getattr(stream._local, "target", None) for stream in streams]
+    streams[0]._local.target, streams[1]._local.target = stdout, stderr
+    try:
+        yield
+    finally:
+        for stream, target in zip(streams, previous):
+            stream._local.target = target
+
+def _find_triangulation(x, y, faces, mesh_datasets):
+    try:
+        if faces is not None:
+            return mesh_triangulation(x, y, faces=faces)
+        for ds in mesh_datasets:
+            if has_connectivity(ds, np.size(x)):
+                return mesh_triangulation(x, y, ds=ds)
+    except Exception as e:
+        print(f"Note: mesh connectivity unusable ({e}); triangulating x/y instead.")
+    return None
+
+def plot_unstructured(variable, x, y, title="Unstructured Mesh Plot", cmap=None, faces=None, mesh_datasets=()):
     """
     Robust plotting for SCHISM/Unstructured grids.
     Automatically detects if a Diverging Colormap (Red-Blue) is needed for difference plots.
+    The mesh comes from `faces` or the SCHISM_hgrid_face_nodes of the first of
+    `mesh_datasets` with as many nodes as x (generated code gets the datasets it
+    opened), cached in mesh.triangulation_cache; otherwise matplotlib triangulates x/y.
+    Large meshes (rasterize.RASTER_MIN_TRIANGLES) are drawn as a rasterized image.
     """
     # 1. Sanitize Inputs: Convert xarray/DataArray to numpy
     if hasattr(variable, 'values'): variable = variable.values
     if hasattr(x, 'values'): x = x.values
     if hasattr(y, 'values'): y = y.values
 
+    triangulation = _find_triangulation(x, y, faces, mesh_datasets)
+
     # 2. Handle Time Dimension: If (Time, Node), take the last time step
     if variable.ndim > 1:
         print(f"Note: Variable has dimensions {variable.shape}. Plotting final time step.")
@@ -46,9 +114,14 @@ def plot_unstructured(variable, x, y, title="Unstructured Mesh Plot", cmap=None)
         plt.figure(figsize=(10, 8))
         
         # Plot with automatic or calculated vmin/vmax
-        plt.tripcolor(x, y, variable, shading='flat', cmap=cmap, vmin=vmin, vmax=vmax)
+        if use_raster(triangulation):
+            mappable = draw_raster(plt.gca(), triangulation, variable, cmap=cmap, vmin=vmin, vmax=vmax)
+        elif triangulation is not None:
+            mappable = plt.tripcolor(triangulation, variable, shading='flat', cmap=cmap, vmin=vmin, vmax=vmax)
+        else:
+            mappable = plt.tripcolor(x, y, variable, shading='flat', cmap=cmap, vmin=vmin, vmax=vmax)
         
-        plt.colorbar(label="Value")
+        plt.colorbar(mappable, label="Value")
         plt.title(title)
         plt.xlabel("Longitude")
         plt.ylabel("Latitude")
@@ -64,48 +137,97 @@ def plot_unstructured(variable, x, y, title="Unstructured Mesh Plot", cmap=None)
         print(f"Error in plot_unstructured: {e}")
         return None
 
-def execute_python_code(code_string: str, netcdf_path: str, scenario_path: str = None) -> dict:
+def execute_python_code(code_string: str, netcdf_path: str, scenario_path: str = None,
+                        cancel_event=None) -> dict:
     """
     Executes Python code in a controlled environment with access to the NetCDF file(s).
-    Returns a dict with 'stdout', 'stderr', and 'images' (list of base64 strings).
+    Returns a dict with 'stdout', 'stderr', and 'images' (artifact_store references
+    of the PNG figures, e.g. "3fa9...c1.png").
+    Runs on the warm worker pool (worker_pool) unless EXECUTOR_WORKERS=0, in which
+    case it runs in the calling thread; in-process executions may run concurrently
+    (figures and output are captured per execution, see FigureCapture).
+
+    On the pool, the time / CPU / memory limits of worker_pool apply (a result that
+    hit one has a "limit" key and a hint in stderr), and setting `cancel_event`
+    stops the run. In-process runs are only checked for cancellation before they start.
     """
+    if EXECUTOR_WORKERS > 0:
+        return execute_python_code_isolated(code_string, netcdf_path, scenario_path, cancel_event)
+    if cancel_event is not None and cancel_event.is_set():
+        return {"stdout": "", "stderr": "Cancelled.", "images": [], "success": False, "cancelled": True}
+    return _execute_python_code(code_string, netcdf_path, scenario_path)
+
+def execute_python_code_isolated(code_string: str, netcdf_path: str, scenario_path: str = None,
+                                 cancel_event=None) -> dict:
+    """
+    execute_python_code on a worker process of the pool (worker_pool), whatever
+    EXECUTOR_WORKERS says. Setting `cancel_event` kills the worker running the job
+    and returns a result with "cancelled": True.
+    """
+    return get_worker_pool().run(code_string, netcdf_path, scenario_path, cancel_event)
+
+class _CachedXarray:
+    """
+    What `xr` / `import xarray` resolve to inside generated code: plain xarray,
+    except that open_dataset(path) without options is served by dataset_cache.
+    The header and most generated programs open the same files on every attempt,
+    so they reuse one decoded handle. Leases are returned when the run ends.
+    Files too big for memory come back dask-chunked (out_of_core).
+    """
+
+    def __init__(self):
+        self.leases = []
+        self.announced = set()
+        self.datasets = []  # Opened so far; plot_unstructured looks for mesh connectivity here
+
+    def __getattr__(self, name):
+        return getattr(xr, name)
+
+    def open_dataset(self, filename_or_obj, *args, **kwargs):
+        if args or kwargs or not isinstance(filename_or_obj, (str, os.PathLike)):
+            return xr.open_dataset(filename_or_obj, *args, **kwargs)
+        path = os.fspath(filename_or_obj)
+        chunks = auto_chunks(path)
+        key, ds = dataset_cache.acquire(path, chunks=chunks)
+        if chunks and path not in self.announced:
+            self.announced.add(path)
+            print(f"System: {os.path.basename(path)} is opened out-of-core (dask chunks: "
+                  f"{describe_chunks(chunks)}). Operations are lazy; reduce first, then use "
+                  f".values / .compute() on the small result.")
+        self.leases.append(key)
+        self.datasets.append(ds)
+        return ds
+
+    def release(self):
+        while self.leases:
+            dataset_cache.release(self.leases.pop())
+
+def _execution_builtins(cached_xr):
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        module = builtins.__import__(name, globals, locals, fromlist, level)
+        return cached_xr if name == "xarray" and level == 0 else module
+    return dict(vars(builtins), __import__=_import)
+
+def _execute_python_code(code_string: str, netcdf_path: str, scenario_path: str = None) -> dict:
     # Capture stdout/stderr
     stdout_capture = io.StringIO()
     stderr_capture = io.StringIO()
     
-    images = []
+    cached_xr = _CachedXarray()
+    figures = FigureCapture()
     
     # Pre-defined environment
     local_env = {
-        "xr": xr,
+        "xr": cached_xr,
         "np": np,
         "plt": plt,
         "scipy": scipy,
         "tri": tri, 
         "netcdf_path": netcdf_path,
         "scenario_path": scenario_path,
-        "plot_unstructured": plot_unstructured,
+        "plot_unstructured": functools.partial(plot_unstructured, mesh_datasets=cached_xr.datasets),
         "print": lambda *args, **kwargs: print(*args, file=stdout_capture, **kwargs)
     }
-    
-    # Store original functions to restore later
-    original_savefig = plt.savefig
-    original_show = plt.show
-    
-    # Custom savefig to capture images
-    def custom_savefig(*args, **kwargs):
-        buf = io.BytesIO()
-        try:
-            plt.gcf().savefig(buf, format='png')
-            buf.seek(0)
-            img_str = base64.b64encode(buf.read()).decode('utf-8')
-            images.append(img_str)
-        except Exception as e:
-            print(f"Error saving plot: {e}", file=stdout_capture)
-        plt.close()
-        
-    local_env["plt"].savefig = custom_savefig
-    local_env["plt"].show = custom_savefig
 
     # Inject the loading logic automatically. 
     # NOTE: We use the variable 'netcdf_path' directly from local_env, 
@@ -115,7 +237,7 @@ import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
 
-# AUTO-GENERATED LOADING
+# AUTO-GENERATED LOADING (shared handles, see dataset_cache)
 ds = xr.open_dataset(netcdf_path)
 ds_base = ds
 ds_comp = None
@@ -130,8 +252,10 @@ print("System: Comparison Datasets Loaded.")
     full_code = header_code + "\n" + code_string
 
     try:
-        with contextlib.redirect_stdout(stdout_capture), contextlib.redirect_stderr(stderr_capture):
-            exec(full_code, {}, local_env)
+        # Figures (pyplot, xarray / pandas .plot()) and output of this thread only
+        with _capture_output(stdout_capture, stderr_capture), capturing(figures):
+            with dask_scheduler():
+                exec(full_code, {"__builtins__": _execution_builtins(cached_xr)}, local_env)
             
         # CRITICAL FIX: Truncate Output to prevent LLM Context overflow
         output_text = stdout_capture.getvalue()
@@ -141,17 +265,17 @@ print("System: Comparison Datasets Loaded.")
         return {
             "stdout": output_text,
             "stderr": stderr_capture.getvalue(),
-            "images": images,
+            "images": figures.images,
             "success": True
         }
+    except MemoryError as e:
+        return limit_result("memory", f"Out of memory: {e or 'allocation failed'}", stdout_capture.getvalue())
     except Exception as e:
         return {
             "stdout": stdout_capture.getvalue(),
             "stderr": str(e),
-            "images": images,
+            "images": figures.images,
             "success": False
         }
     finally:
-        # Restore original functions
-        plt.savefig = original_savefig
-        plt.show = original_show
+        cached_xr.release()
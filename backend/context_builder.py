@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Prompt budgets (approximate tokens) for the schema / metadata part of a prompt
+PLANNER_CONTEXT_TOKENS = int(os.getenv("PLANNER_CONTEXT_TOKENS", "1500"))
+METADATA_CONTEXT_TOKENS = int(os.getenv("METADATA_CONTEXT_TOKENS", "1500"))
+# Global attribute values are cut to this many characters (history/provenance strings get huge)
+MAX_ATTR_CHARS = 160
+CONTEXT_CACHE_SIZE = 256
+
+STOPWORDS = {
+    "a", "an", "and", "at", "by", "for", "from", "how", "in", "is", "it", "me", "of", "on", "or",
+    "plot", "show", "the", "to", "what", "which", "with", "over", "all", "data", "file", "calculate"
+}
+
+_context_cache = OrderedDict()
+_context_cache_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Token estimate (~4 characters per token for English/code with cl100k-style
+    tokenizers). Budgets are soft limits, so an estimate is enough and needs no
+    tokenizer download.
+    """
+    return (len(text) + 3) // 4
+
+
+def terms(text):
+    """Lower-case word pieces; splits snake_case, kebab-case and camelCase names."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    return {t for t in re.split(r"[^a-z0-9]+", text.lower()) if len(t) >= 2}
+
+
+def query_terms(query):
+    return terms(query or "") - STOPWORDS
+
+
+def relevance(q_terms, name, description=""):
+    """Scores one variable against the query: name hits weigh more than description hits."""
+    if not q_terms:
+        return 0.0
+    name_terms = terms(name)
+    desc_terms = terms(description)
+    score = 0.0
+    for q in q_terms:
+        if q in name_terms:
+            score += 3
+        elif any(len(t) >= 3 and (q.startswith(t) or t.startswith(q)) for t in name_terms):
+            score += 2  # 'velocity' ~ 'vel', 'temp' ~ 'temperature'
+        if q in desc_terms:
+            score += 1
+    return score
+
+
+def rank_names(q_terms, entries):
+    """entries: [(name, description)] -> names, most relevant first (stable for ties)."""
+    scored = [(-relevance(q_terms, name, desc), i, name) for i, (name, desc) in enumerate(entries)]
+    return [name for _, _, name in sorted(scored)]
+
+
+def fit_lines(lines, budget):
+    """Longest prefix of lines that fits in `budget` tokens. Returns (kept, remaining budget)."""
+    kept = []
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    return kept, budget
+
+
+def grouped_variable_lines(ranked, variables, describe, budget):
+    """
+    Renders variables grouped by their dims tuple, so shared dimension lists are
+    written once. Variables are admitted in rank order until the budget runs out;
+    the rest are listed by name (as far as the budget allows).
+    """
+    groups = OrderedDict()
+    shown = 0
+    for name in ranked:
+        dims = tuple(variables[name].get("dims", []))
+        line = describe(name, variables[name])
+        cost = count_tokens(line) + 1 + (0 if dims in groups else count_tokens(f"Dims {dims}:") + 1)
+        if cost > budget:
+            break
+        groups.setdefault(dims, []).append(line)
+        budget -= cost
+        shown += 1
+
+    lines = []
+    for dims, group in groups.items():
+        lines.append(f"Dims ({', '.join(dims)}):" if dims else "Scalars:")
+        lines.extend(group)
+
+    omitted = ranked[shown:]
+    if omitted:
+        names, count = [], 0
+        for name in omitted:
+            cost = count_tokens(name) + 1
+            if cost > budget - 10:
+                break
+            names.append(f"`{name}`")
+            budget -= cost
+            count += 1
+        more = len(omitted) - count
+        summary = f"Other variables: {', '.join(names)}" if names else "Other variables omitted"
+        lines.append(summary + (f" (+{more} more)" if more else ""))
+    return lines
+
+
+def dimension_sizes(variables):
+    """{dim: size} collected from the variables' dims/shape pairs."""
+    sizes = OrderedDict()
+    for meta in variables.values():
+        for dim, size in zip(meta.get("dims", []), meta.get("shape", [])):
+            sizes.setdefault(dim, size)
+    return sizes
+
+
+def short_attr(value):
+    text = str(value).replace("\n", " ")
+    return text if len(text) <= MAX_ATTR_CHARS else text[:MAX_ATTR_CHARS] + "..."
+
+
+def memoize_context(kind, payload, query, budget, build):
+    """
+    Returns build() memoized per (content hash, query terms, budget). Suggestion
+    buttons and follow-up questions on the same file reuse the formatted context.
+    """
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    key = (kind, digest, tuple(sorted(query_terms(query))), budget)
+    with _context_cache_lock:
+        if key in _context_cache:
+            _context_cache.move_to_end(key)
+            return _context_cache[key]
+    context = build()
+    with _context_cache_lock:
+        _context_cache[key] = context
+        while len(_context_cache) > CONTEXT_CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return context
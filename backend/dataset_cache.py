@@ -0,0 +1,168 @@
+import contextlib
+import os
+import threading
+from collections import OrderedDict
+import xarray as xr
+
+# Open xarray datasets kept around between executions, schema extraction and
+# profiling, so the same file is not re-opened and its coordinates / indexes
+# re-decoded on every call. Handles in use are never closed; idle ones are closed
+# least-recently-used first once more than this many are open. 0 = no caching.
+DATASET_CACHE_SIZE = int(os.getenv("DATASET_CACHE_SIZE", "8"))
+# Read into memory once per handle: coordinates and the SCHISM mesh (node x/y,
+# connectivity), which nearly every analysis and plot reads again. Variables
+# bigger than this stay lazy like the data.
+SHARED_VARIABLES = ("SCHISM_hgrid_node_x", "SCHISM_hgrid_node_y", "SCHISM_hgrid_face_nodes")
+SHARED_MAX_MB = int(os.getenv("DATASET_SHARED_MAX_MB", "256"))
+
+
+def file_key(path, chunks=None):
+    """(real path, mtime, size, chunks): a rewritten or replaced file gets a fresh handle."""
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_mtime_ns, st.st_size, tuple(sorted(chunks.items())) if chunks else None)
+
+
+def _open(path, chunks=None):
+    ds = xr.open_dataset(path, cache=False, chunks=chunks or None)
+    names = [name for name in ds.coords if name not in ds.indexes]
+    names += [name for name in SHARED_VARIABLES if name in ds.variables and name not in names]
+    for name in names:
+        variable = ds.variables[name]
+        if variable.size * variable.dtype.itemsize <= SHARED_MAX_MB * 1024 * 1024:
+            variable.load()  # In place: every shallow copy handed out shares the loaded values
+    return ds
+
+
+class _Entry:
+    def __init__(self):
+        self.ds = None
+        self.error = None
+        self.refs = 0
+        self.stale = False
+        self.opened = threading.Event()
+
+
+class DatasetCache:
+    """
+    Process-wide cache of open datasets keyed by file_key(), with reference
+    counting. acquire() hands out a shallow copy of the cached dataset: callers
+    can add or drop variables (or even close() it) without affecting anyone else,
+    while the file handle, decoded indexes, coordinates and mesh variables
+    (SHARED_VARIABLES) are shared. Other data is opened with cache=False, so values
+    read by one caller are not pinned in memory. A file opened with dask `chunks`
+    (out_of_core) is a separate entry.
+    Files are opened outside the cache lock: opening one file never holds up
+    callers of another, and concurrent callers of the same file wait for one open.
+    """
+
+    def __init__(self, max_open=DATASET_CACHE_SIZE):
+        self.max_open = max_open
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def acquire(self, path, chunks=None):
+        """Returns (key, dataset). Hand the key back to release() when done."""
+        key = file_key(path, chunks)
+        with self._lock:
+            entry = self._entries.get(key)
+            opening = entry is None
+            if opening:
+                self.stats["misses"] += 1
+                entry = _Entry()
+                entry.stale = self.max_open <= 0
+                self._entries[key] = entry
+            else:
+                self.stats["hits"] += 1
+            entry.refs += 1
+            self._entries.move_to_end(key)
+
+        if opening:
+            try:
+                entry.ds = _open(path, chunks)
+            except BaseException as e:
+                entry.error = e
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                raise
+            finally:
+                entry.opened.set()
+            with self._lock:
+                self._forget_older_versions(key)
+                self._evict()
+        else:
+            entry.opened.wait()
+            if entry.error is not None:
+                raise entry.error
+        return key, entry.ds.copy(deep=False)
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0 and entry.stale:
+                self._close(key)
+            self._evict()
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """`with dataset_cache.open(path) as ds:` - a shared, reference-counted dataset."""
+        key, ds = self.acquire(path)
+        try:
+            yield ds
+        finally:
+            self.release(key)
+
+    def _forget_older_versions(self, key):
+        # Same path, different mtime/size: the file changed under us
+        for other in [k for k in self._entries if k[0] == key[0] and k[1:3] != key[1:3]]:
+            self._entries[other].stale = True
+            if self._entries[other].refs <= 0:
+                self._close(other)
+
+    def _evict(self):
+        idle = [key for key, entry in self._entries.items() if entry.refs <= 0 and entry.ds is not None]
+        for key in idle[:max(0, len(self._entries) - self.max_open)]:
+            self._close(key)
+            self.stats["evictions"] += 1
+
+    def _close(self, key):
+        entry = self._entries.pop(key)
+        if entry.ds is None:
+            return
+        try:
+            entry.ds.close()
+        except Exception as e:
+            print(f"Warning: could not close {key[0]}: {e}")
+
+    def summary(self):
+        with self._lock:
+            in_use = sum(1 for entry in self._entries.values() if entry.refs > 0)
+            return dict(self.stats, open=len(self._entries), in_use=in_use)
+
+    def reset(self):
+        """
+        Forgets every entry without closing it, with a fresh lock: for a newly
+        started worker process, where any handles (and the lock's state) would
+        belong to the process it was created from.
+        """
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def clear(self):
+        """Closes every idle handle (handles in use close when released)."""
+        with self._lock:
+            for key in list(self._entries):
+                self._entries[key].stale = True
+                if self._entries[key].refs <= 0:
+                    self._close(key)
+
+
+dataset_cache = DatasetCache()
+
+def open_cached_dataset(path):
+    """Shortcut for dataset_cache.open(path)."""
+    return dataset_cache.open(path)
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(BASE_DIR, "cache", "embeddings.sqlite"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+def normalize_text(text):
+    """Whitespace/unicode normalisation so trivially different strings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (embedding model, normalised text).
+    Tier 1: in-process LRU dict. Tier 2: SQLite file shared by all workers.
+    Pass path=None for a memory-only cache.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_items=EMBEDDING_CACHE_SIZE):
+        self.path = path
+        self.max_items = max_items
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB, created REAL)"
+                )
+
+    def _connect(self):
+        # sqlite connections cannot be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    def get(self, model, text):
+        """Returns the cached vector (list of floats) or None."""
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector
+
+        if self.path:
+            try:
+                row = self._connect().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Embedding cache read failed: {e}")
+                row = None
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return vector
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, model, text, vector):
+        key = cache_key(model, text)
+        vector = list(vector)
+        self._remember(key, vector)
+        if self.path:
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created) VALUES (?, ?, ?, ?, ?)",
+                        (key, model, len(vector), blob, time.time())
+                    )
+            except sqlite3.Error as e:
+                print(f"Embedding cache write failed: {e}")
@@ -0,0 +1,143 @@
+import contextlib
+import functools
+import io
+import threading
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from artifact_store import artifact_store
+
+# pyplot's figure management. Every other pyplot function (plot, title, colorbar,
+# subplots, matshow, ...) and the plotting of xarray / pandas find their figure
+# through these, so routing them per thread is enough to keep executions apart.
+_ROUTED = ("figure", "gcf", "close", "get_fignums", "fignum_exists", "savefig", "show")
+# savefig(...) options passed on when rendering a capture (always PNG)
+_SAVE_KWARGS = ("dpi", "bbox_inches", "pad_inches", "facecolor", "edgecolor", "transparent")
+
+_active = threading.local()
+_route_lock = threading.Lock()
+
+
+def new_figure(**kwargs):
+    """A Figure on its own Agg canvas, never registered with pyplot's global figure manager."""
+    fig = Figure(**{key: value for key, value in kwargs.items() if value is not None})
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class FigureCapture:
+    """
+    The figures of one execution: pyplot's figure(), gcf(), close(), show() and
+    savefig(), with the open figures and the current one kept here instead of in
+    pyplot's process-wide figure manager. Figures live on their own Agg canvas;
+    show() and savefig() render them into artifact_store and append the reference
+    to `images`. Active for the calling thread inside capturing(), so executions
+    running in threads of one process never draw on, or capture, each other's plots.
+    """
+
+    def __init__(self):
+        self.images = []
+        self._figures = {}  # num -> Figure, in creation order
+        self._current = None
+        self._next_num = 1
+
+    def figure(self, num=None, figsize=None, dpi=None, *, clear=False, FigureClass=None, **kwargs):
+        if isinstance(num, Figure):
+            fig = num
+        elif num is not None and num in self._figures:
+            fig = self._figures[num]
+            if clear:
+                fig.clear()
+        else:
+            if num is None:
+                while self._next_num in self._figures:
+                    self._next_num += 1
+                num = self._next_num
+            if isinstance(num, int):
+                self._next_num = max(self._next_num, num + 1)
+            fig = new_figure(figsize=figsize, dpi=dpi, **kwargs)
+        if not any(f is fig for f in self._figures.values()):
+            self._figures[num if num is not None else id(fig)] = fig
+        self._current = fig
+        return fig
+
+    def gcf(self):
+        return self._current if self._current is not None else self.figure()
+
+    def get_fignums(self):
+        return sorted(num for num in self._figures if isinstance(num, int))
+
+    def fignum_exists(self, num):
+        return num in self._figures
+
+    def close(self, fig=None):
+        if isinstance(fig, str) and fig == "all":
+            closing = list(self._figures)
+        elif fig is None:
+            closing = [num for num, f in self._figures.items() if f is self._current]
+        elif isinstance(fig, Figure):
+            closing = [num for num, f in self._figures.items() if f is fig]
+        else:
+            closing = [fig] if fig in self._figures else []
+        for num in closing:
+            self._figures.pop(num)
+        if self._current is not None and not any(f is self._current for f in self._figures.values()):
+            self._current = next(reversed(self._figures.values()), None)
+
+    def _capture(self, fig, target=None, **kwargs):
+        buf = io.BytesIO()
+        try:
+            fig.savefig(buf, format="png", **{key: kwargs[key] for key in _SAVE_KWARGS if key in kwargs})
+        except Exception as e:
+            print(f"Error saving plot: {e}")
+            return
+        self.images.append(artifact_store.put(buf.getvalue()))
+        # File names are ignored (nothing is written next to the server), but a
+        # buffer passed by the caller gets the PNG
+        if hasattr(target, "write"):
+            target.write(buf.getvalue())
+
+    def savefig(self, fname=None, **kwargs):
+        """Captures the current figure and closes it."""
+        self._capture(self.gcf(), fname, **kwargs)
+        self.close()
+
+    def show(self, *args, **kwargs):
+        """Captures every open figure, oldest first, and closes them."""
+        for fig in list(self._figures.values()):
+            self._capture(fig)
+        self.close("all")
+
+
+def _routed(name, original):
+    @functools.wraps(original)
+    def call(*args, **kwargs):
+        capture = getattr(_active, "capture", None)
+        return (original if capture is None else getattr(capture, name))(*args, **kwargs)
+    call._figure_capture = True
+    return call
+
+
+def route_pyplot():
+    """
+    Replaces pyplot's figure management with per-thread dispatchers (once per
+    process): threads inside capturing() use their FigureCapture, all others
+    plain pyplot.
+    """
+    with _route_lock:
+        for name in _ROUTED:
+            original = getattr(plt, name)
+            if not getattr(original, "_figure_capture", False):
+                setattr(plt, name, _routed(name, original))
+
+
+@contextlib.contextmanager
+def capturing(capture):
+    """pyplot figures of the current thread go to `capture` for the duration."""
+    route_pyplot()
+    previous = getattr(_active, "capture", None)
+    _active.capture = capture
+    try:
+        yield capture
+    finally:
+        _active.capture = previous
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from openai.types.chat import ChatCompletion
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "cache", "llm_responses.sqlite"))
+# Entries older than this are treated as misses and purged (seconds, 0 = never expire)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used responses are evicted beyond this many entries
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Housekeeping (expiry + size cap) runs once every this many writes
+PURGE_EVERY = 50
+# create() arguments meant for the layers below (llm_scheduler), not the model
+ROUTING_KWARGS = ("priority",)
+
+def request_key(kwargs):
+    """Hash of everything that shapes the answer: model, messages and sampling params."""
+    request = {k: v for k, v in kwargs.items() if k not in ROUTING_KWARGS}
+    payload = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of chat completion responses, shared by all workers.
+    Stores each response as JSON together with the latency it originally cost,
+    so stats can report how much waiting the hits saved.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, latency REAL, created REAL, last_used REAL)"
+            )
+
+    def _connect(self):
+        # sqlite connections cannot be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def get(self, key):
+        """Returns the cached response dict or None (missing or expired)."""
+        try:
+            row = self._connect().execute(
+                "SELECT response, latency, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"LLM cache read failed: {e}")
+            row = None
+
+        now = time.time()
+        if row is None or (self.ttl and now - row[2] > self.ttl):
+            self._count("misses")
+            return None
+
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            pass  # Only affects eviction order
+        self._count("hits")
+        self._count("saved_seconds", row[1] or 0.0)
+        return json.loads(row[0])
+
+    def put(self, key, model, response, latency):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, latency, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, json.dumps(response), latency, now, now)
+                )
+        except sqlite3.Error as e:
+            print(f"LLM cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY == 1
+        if purge:
+            self.purge()
+
+    def purge(self):
+        """Drops expired entries and trims the table to max_entries (least recently used first)."""
+        try:
+            with self._connect() as conn:
+                if self.ttl:
+                    conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+                if self.max_entries:
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+        except sqlite3.Error as e:
+            print(f"LLM cache purge failed: {e}")
+
+    def delete(self, key):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"LLM cache delete failed: {e}")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def summary(self):
+        """Hit/miss counters for this process plus the number of stored responses."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self)
+        return stats
+
+
+class _CachedCompletions:
+    def __init__(self, completions, cache):
+        self._completions = completions
+        self._cache = cache
+
+    def create(self, cache=True, **kwargs):
+        """
+        Same signature as client.chat.completions.create. Streaming calls and
+        cache=False bypass the cache; everything else is served from it when possible.
+        """
+        if self._cache is None or not cache or kwargs.get("stream"):
+            return self._completions.create(**kwargs)
+
+        key = request_key(kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate(cached)
+
+        start = time.perf_counter()
+        response = self._completions.create(**kwargs)
+        self._store(key, kwargs, response, time.perf_counter() - start)
+        return response
+
+    def _store(self, key, kwargs, response, latency):
+        # Empty answers are usually transient failures; don't pin them
+        if response.choices and response.choices[0].message.content:
+            self._cache.put(key, kwargs.get("model"), response.model_dump(mode="json"), latency)
+
+    def _store_streamed(self, key, kwargs, text, latency):
+        """Caches a streamed answer as a regular completion, so both paths share entries."""
+        if text:
+            self._cache.put(key, kwargs.get("model"), {
+                "id": "streamed", "object": "chat.completion", "created": int(time.time()),
+                "model": kwargs.get("model") or "",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}]
+            }, latency)
+
+    def stream_text(self, cache=True, **kwargs):
+        """
+        Yields the answer's text as it is generated (create(stream=True) under the hood).
+        A cached answer is yielded in one piece; a completed stream is cached.
+        """
+        key = request_key(kwargs)
+        use_cache = self._cache is not None and cache
+        cached = self._cache.get(key) if use_cache else None
+        if cached is not None:
+            yield cached["choices"][0]["message"]["content"]
+            return
+
+        start = time.perf_counter()
+        parts = []
+        for chunk in self._completions.create(stream=True, **kwargs):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+        if use_cache:
+            self._store_streamed(key, kwargs, "".join(parts), time.perf_counter() - start)
+
+    def invalidate(self, **kwargs):
+        """Forgets the cached answer to these create() arguments (e.g. code that failed to run)."""
+        if self._cache is not None:
+            self._cache.delete(request_key(kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _AsyncCachedCompletions(_CachedCompletions):
+    async def create(self, cache=True, **kwargs):
+        """Async twin of _CachedCompletions.create; SQLite work runs off the event loop."""
+        if self._cache is None or not cache or kwargs.get("stream"):
+            return await self._completions.create(**kwargs)
+
+        key = request_key(kwargs)
+        cached = await asyncio.to_thread(self._cache.get, key)
+        if cached is not None:
+            return ChatCompletion.model_validate(cached)
+
+        start = time.perf_counter()
+        response = await self._completions.create(**kwargs)
+        await asyncio.to_thread(self._store, key, kwargs, response, time.perf_counter() - start)
+        return response
+
+    async def stream_text(self, cache=True, **kwargs):
+        """Async twin of _CachedCompletions.stream_text."""
+        key = request_key(kwargs)
+        use_cache = self._cache is not None and cache
+        cached = await asyncio.to_thread(self._cache.get, key) if use_cache else None
+        if cached is not None:
+            yield cached["choices"][0]["message"]["content"]
+            return
+
+        start = time.perf_counter()
+        parts = []
+        async for chunk in await self._completions.create(stream=True, **kwargs):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+        if use_cache:
+            await asyncio.to_thread(self._store_streamed, key, kwargs, "".join(parts), time.perf_counter() - start)
+
+
+class _CachedChat:
+    completions_class = _CachedCompletions
+
+    def __init__(self, chat, cache):
+        self._chat = chat
+        self.completions = self.completions_class(chat.completions, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class _AsyncCachedChat(_CachedChat):
+    completions_class = _AsyncCachedCompletions
+
+
+class CachedClient:
+    """
+    Wraps an OpenAI client so chat.completions.create goes through a ResponseCache.
+    Every other attribute (embeddings, models, ...) is passed straight through.
+    cache=None disables caching but keeps the same interface.
+    """
+    chat_class = _CachedChat
+
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.chat = self.chat_class(client.chat, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncCachedClient(CachedClient):
+    """CachedClient for AsyncOpenAI: `await client.chat.completions.create(...)`."""
+    chat_class = _AsyncCachedChat
@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Lower number = served first
+PRIORITY_INTERACTIVE = 0  # Answers a user is watching stream in (synthesis, metadata chat)
+PRIORITY_AGENT = 1        # Planner / evaluator / code generation / embeddings
+PRIORITY_BACKGROUND = 2   # Suggestions and other work nobody is waiting on yet
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_AGENT: "agent", PRIORITY_BACKGROUND: "background"}
+
+# Requests allowed to wait for a slot; beyond this new work is shed (lowest priority first)
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+# Seconds a request may wait for a slot before giving up (0 = wait forever)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "0"))
+# Recent waits kept for the wait-time percentiles
+WAIT_SAMPLES = 1000
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised when a request is shed (queue full) or waits longer than the queue timeout."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "event", "loop", "future", "granted", "shed", "cancelled")
+
+    def __init__(self, priority, seq, loop=None):
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.shed = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Admission control for one LLM provider, shared by every thread and event loop
+    in the process. At most `max_in_flight` requests run at once; the rest queue by
+    (priority, arrival). When `max_queue` requests are already waiting, a new one
+    either displaces the lowest-priority waiter or, if it ranks no higher, is
+    rejected with SchedulerBusy - callers fail fast instead of piling up.
+    """
+
+    def __init__(self, max_in_flight, max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT, name="llm"):
+        self.name = name
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._queue = []
+        self._queued = 0
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.stats = {"completed": 0, "rejected": 0, "timed_out": 0}
+
+    # --- SLOT BOOKKEEPING (callers hold self._lock) ---
+    def _enqueue_locked(self, waiter):
+        if self.max_queue and self._queued >= self.max_queue:
+            live = [w for w in self._queue if not (w.cancelled or w.shed)]
+            worst = max(live)
+            if worst.priority <= waiter.priority:
+                self.stats["rejected"] += 1
+                raise SchedulerBusy(f"{self.name}: {self._queued} requests already queued")
+            self._shed_locked(worst)
+        heapq.heappush(self._queue, waiter)
+        self._queued += 1
+
+    def _shed_locked(self, waiter):
+        waiter.shed = True
+        self._queued -= 1
+        self.stats["rejected"] += 1
+        self._wake(waiter)
+
+    def _grant_locked(self):
+        while self._queue and self._in_flight < self.max_in_flight:
+            waiter = heapq.heappop(self._queue)
+            if waiter.cancelled or waiter.shed:
+                continue
+            self._queued -= 1
+            self._in_flight += 1
+            waiter.granted = True
+            self._wake(waiter)
+
+    def _wake(self, waiter):
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+
+    def _resolve(self, waiter):
+        # Runs on the waiter's event loop
+        if waiter.future.cancelled():
+            if waiter.granted:
+                self.release()
+        elif not waiter.future.done():
+            waiter.future.set_result(None)
+
+    def _withdraw(self, waiter, timed_out=False):
+        """Gives up on a queued request. Returns True if it already holds a slot."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            if not (waiter.cancelled or waiter.shed):
+                waiter.cancelled = True
+                self._queued -= 1
+                if timed_out:
+                    self.stats["timed_out"] += 1
+            return False
+
+    def _admitted(self, waiter, start):
+        if waiter.shed:
+            raise SchedulerBusy(f"{self.name}: shed for higher-priority work")
+        with self._lock:
+            self._waits.append((waiter.priority, time.perf_counter() - start))
+
+    # --- PUBLIC API ---
+    def acquire(self, priority=PRIORITY_AGENT):
+        """Blocks until a slot is free (or raises SchedulerBusy). Pair with release()."""
+        start = time.perf_counter()
+        with self._lock:
+            waiter = _Waiter(priority, next(self._seq))
+            self._enqueue_locked(waiter)
+            self._grant_locked()
+        if not waiter.event.wait(self.queue_timeout or None):
+            if not self._withdraw(waiter, timed_out=True):
+                raise SchedulerBusy(f"{self.name}: no slot within {self.queue_timeout:.0f}s")
+        self._admitted(waiter, start)
+
+    async def acquire_async(self, priority=PRIORITY_AGENT):
+        """acquire() for coroutines: waits on a future instead of blocking the loop."""
+        start = time.perf_counter()
+        with self._lock:
+            waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop())
+            self._enqueue_locked(waiter)
+            self._grant_locked()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            if not self._withdraw(waiter, timed_out=True):
+                raise SchedulerBusy(f"{self.name}: no slot within {self.queue_timeout:.0f}s")
+            await waiter.future
+        except asyncio.CancelledError:
+            # A slot granted to a request that was cancelled meanwhile goes straight back
+            if self._withdraw(waiter) and not waiter.future.cancelled():
+                if waiter.future.done():
+                    self.release()
+                else:
+                    waiter.future.cancel()  # _resolve releases it
+            raise
+        self._admitted(waiter, start)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.stats["completed"] += 1
+            self._grant_locked()
+
+    def summary(self):
+        """Queue depth, in-flight count and wait-time percentiles (ms) for dashboards."""
+        with self._lock:
+            waits = list(self._waits)
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._queue:
+                if not (waiter.cancelled or waiter.shed):
+                    queued[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+            stats = dict(self.stats, in_flight=self._in_flight, max_in_flight=self.max_in_flight,
+                         queued=self._queued, queued_by_priority=queued)
+        ms = sorted(w * 1000 for _, w in waits)
+        stats["wait_ms_mean"] = sum(ms) / len(ms) if ms else 0.0
+        stats["wait_ms_p95"] = ms[min(len(ms) - 1, int(len(ms) * 0.95))] if ms else 0.0
+        return stats
+
+
+# --- CLIENT WRAPPERS ---
+# Same layering as llm_cache: ScheduledClient(OpenAI) sits under CachedClient, so
+# cache hits never wait for a slot. create() takes an extra `priority=` argument.
+
+class _ScheduledEndpoint:
+    def __init__(self, endpoint, scheduler):
+        self._endpoint = endpoint
+        self._scheduler = scheduler
+
+    def create(self, priority=PRIORITY_AGENT, **kwargs):
+        self._scheduler.acquire(priority)
+        try:
+            response = self._endpoint.create(**kwargs)
+        except BaseException:
+            self._scheduler.release()
+            raise
+        if kwargs.get("stream"):
+            return self._hold_while_streaming(response)
+        self._scheduler.release()
+        return response
+
+    def _hold_while_streaming(self, stream):
+        # The slot stays taken until the stream is drained or closed
+        try:
+            yield from stream
+        finally:
+            self._scheduler.release()
+
+    def __getattr__(self, name):
+        return getattr(self._endpoint, name)
+
+
+class _AsyncScheduledEndpoint(_ScheduledEndpoint):
+    async def create(self, priority=PRIORITY_AGENT, **kwargs):
+        await self._scheduler.acquire_async(priority)
+        try:
+            response = await self._endpoint.create(**kwargs)
+        except BaseException:
+            self._scheduler.release()
+            raise
+        if kwargs.get("stream"):
+            return self._hold_while_streaming(response)
+        self._scheduler.release()
+        return response
+
+    async def _hold_while_streaming(self, stream):
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self._scheduler.release()
+
+
+class _ScheduledChat:
+    def __init__(self, chat, scheduler, endpoint_class):
+        self._chat = chat
+        self.completions = endpoint_class(chat.completions, scheduler)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class ScheduledClient:
+    """
+    Wraps an OpenAI client so chat.completions.create and embeddings.create wait
+    for a slot on `scheduler`. Everything else is passed straight through.
+    """
+    endpoint_class = _ScheduledEndpoint
+
+    def __init__(self, client, scheduler):
+        self._client = client
+        self.scheduler = scheduler
+        self.chat = _ScheduledChat(client.chat, scheduler, self.endpoint_class)
+        self.embeddings = self.endpoint_class(client.embeddings, scheduler)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncScheduledClient(ScheduledClient):
+    """ScheduledClient for AsyncOpenAI."""
+    endpoint_class = _AsyncScheduledEndpoint
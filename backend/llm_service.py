@@ -1,7 +1,22 @@
 import os
-from openai import OpenAI
+import asyncio
+import threading
+import weakref
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 import json
 from dotenv import load_dotenv
+from llm_cache import CachedClient, AsyncCachedClient, ResponseCache
+from llm_scheduler import (
+    AsyncScheduledClient, LLMScheduler, ScheduledClient, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+)
+from context_builder import (
+    METADATA_CONTEXT_TOKENS, count_tokens, fit_lines, grouped_variable_lines, memoize_context,
+    query_terms, rank_names, short_attr
+)
+try:
+    import httpx
+except ImportError:  # Newer openai releases ship on the httpx2 fork
+    import httpx2 as httpx
 
 load_dotenv()
 
@@ -10,41 +25,140 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 LM_STUDIO_BASE_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "auto").lower() # auto, openrouter, local
 
-def get_client():
+# Shared HTTP connection pool. Every analysis makes 4+ sequential calls to the same
+# host, so keeping connections alive skips a TCP/TLS handshake per call.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))  # Local models can take minutes per answer
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Requests running at once per provider. LM Studio serves one or two efficiently;
+# hosted APIs take many. Everything beyond this queues by priority (llm_scheduler).
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "0"))  # 0 = provider default
+LOCAL_MAX_IN_FLIGHT = 2
+REMOTE_MAX_IN_FLIGHT = 16
+
+def get_provider():
+    """Returns (base_url, api_key, model) for the configured provider."""
     if LLM_PROVIDER == "openrouter":
         if not OPENROUTER_API_KEY:
             raise ValueError("LLM_PROVIDER is 'openrouter' but OPENROUTER_API_KEY is not set.")
-        return OpenAI(base_url="https://openrouter.ai/api/v1", api_key=OPENROUTER_API_KEY), os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
+        return "https://openrouter.ai/api/v1", OPENROUTER_API_KEY, os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
     
     elif LLM_PROVIDER == "local":
-        return OpenAI(base_url=LM_STUDIO_BASE_URL, api_key="lm-studio"), os.getenv("LOCAL_LLM_MODEL", "local-model")
+        return LM_STUDIO_BASE_URL, "lm-studio", os.getenv("LOCAL_LLM_MODEL", "local-model")
     
     else: # "auto"
         if OPENROUTER_API_KEY:
-            return OpenAI(base_url="https://openrouter.ai/api/v1", api_key=OPENROUTER_API_KEY), os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
+            return "https://openrouter.ai/api/v1", OPENROUTER_API_KEY, os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
         else:
-            return OpenAI(base_url=LM_STUDIO_BASE_URL, api_key="lm-studio"), os.getenv("LOCAL_LLM_MODEL", "local-model")
+            return LM_STUDIO_BASE_URL, "lm-studio", os.getenv("LOCAL_LLM_MODEL", "local-model")
+
+def _http_options():
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    }
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(base_url=None):
+    """The process-wide LLMScheduler for a provider (sync and async clients share it)."""
+    base_url = base_url or get_provider()[0]
+    with _schedulers_lock:
+        scheduler = _schedulers.get(base_url)
+        if scheduler is None:
+            default = REMOTE_MAX_IN_FLIGHT if base_url.startswith("https://") else LOCAL_MAX_IN_FLIGHT
+            scheduler = LLMScheduler(LLM_MAX_IN_FLIGHT or default, name=base_url)
+            _schedulers[base_url] = scheduler
+    return scheduler
+
+def get_client():
+    base_url, api_key, model = get_provider()
+    raw = OpenAI(base_url=base_url, api_key=api_key, http_client=DefaultHttpxClient(**_http_options()))
+    return ScheduledClient(raw, get_scheduler(base_url)), model
 
 client, MODEL = get_client()
+scheduler = client.scheduler
+
+# Identical prompts (same suggestion button on the same file) are answered from disk.
+# Set LLM_CACHE=0 to always call the model.
+response_cache = ResponseCache() if os.getenv("LLM_CACHE", "1") != "0" else None
+client = CachedClient(client, response_cache)
 
-def format_metadata_context(metadata: dict) -> str:
+# --- ASYNC CLIENT ---
+# httpx connection pools belong to the event loop that opened them, so each loop
+# (FastAPI's, or one asyncio.run per script) gets its own pooled client.
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+def get_async_client():
+    """
+    Returns the AsyncOpenAI client (with the same response cache) for the running
+    event loop. Concurrent analyses share its connection pool instead of a thread each.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        async_client = _async_clients.get(loop)
+        if async_client is None:
+            base_url, api_key, _ = get_provider()
+            raw = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=DefaultAsyncHttpxClient(**_http_options()))
+            async_client = AsyncCachedClient(AsyncScheduledClient(raw, get_scheduler(base_url)), response_cache)
+            _async_clients[loop] = async_client
+    return async_client
+
+def format_metadata_context(metadata: dict, query: str = "", token_budget: int = None) -> str:
+    """
+    Compact metadata context: attributes one per line (long values cut), dimension
+    sizes once, variables grouped by dims and ranked by relevance to `query`,
+    all within `token_budget` (default METADATA_CONTEXT_TOKENS). Memoized per file.
+    """
+    budget = token_budget or METADATA_CONTEXT_TOKENS
+    return memoize_context("metadata", metadata, query, budget,
+                           lambda: _build_metadata_context(metadata, query, budget))
+
+def _describe_data_var(name, meta):
+    attrs = meta.get("attrs", {})
+    label = attrs.get("long_name") or attrs.get("standard_name") or ""
+    units = f" [{attrs['units']}]" if attrs.get("units") else ""
+    return f"- {name} ({meta.get('dtype', '?')}){units}" + (f": {label}" if label else "")
+
+def _format_file_metadata(file_meta: dict, query: str, budget: int) -> str:
+    context = ""
+    attrs = file_meta.get("attrs", {})
+    if attrs:
+        lines, budget = fit_lines([f"  {k}: {short_attr(v)}" for k, v in attrs.items()],
+                                  budget // 4)  # Attributes get at most a quarter of the budget
+        context += "Global Attributes:\n" + "\n".join(lines) + "\n"
+        if len(lines) < len(attrs):
+            context += f"  (+{len(attrs) - len(lines)} more attributes)\n"
+    dims = file_meta.get("dims", {})
+    context += "Dimensions: " + ", ".join(f"{k}={v}" for k, v in dims.items()) + "\n"
+    variables = file_meta.get("data_vars", {})
+    ranked = rank_names(query_terms(query), [
+        (name, " ".join(str(v) for v in meta.get("attrs", {}).values())) for name, meta in variables.items()
+    ])
+    lines = grouped_variable_lines(ranked, variables, _describe_data_var, budget - count_tokens(context))
+    context += "Variables:\n" + "\n".join(lines) + "\n"
+    return context
+
+def _build_metadata_context(metadata: dict, query: str, budget: int) -> str:
     # Check if this is a multi-file dict
     if "files" in metadata:
+        files = metadata["files"]
         context = "NetCDF Files Metadata:\n"
-        for filename, file_meta in metadata["files"].items():
+        for filename, file_meta in files.items():
             context += f"\n--- File: {filename} ---\n"
-            context += f"Global Attributes: {json.dumps(file_meta.get('attrs', {}), indent=2)}\n"
-            context += f"Dimensions: {json.dumps(file_meta.get('dims', {}), indent=2)}\n"
-            context += f"Variables: {json.dumps(file_meta.get('data_vars', {}), indent=2)}\n"
+            context += _format_file_metadata(file_meta, query, budget // max(1, len(files)))
         return context
     else:
         # Single file fallback
-        return f"""
-        NetCDF File Metadata:
-        Global Attributes: {json.dumps(metadata.get('attrs', {}), indent=2)}
-        Dimensions: {json.dumps(metadata.get('dims', {}), indent=2)}
-        Variables: {json.dumps(metadata.get('data_vars', {}), indent=2)}
-        """
+        return "NetCDF File Metadata:\n" + _format_file_metadata(metadata, query, budget)
 
 def generate_suggestions(metadata: dict) -> dict:
     """
@@ -79,7 +193,8 @@ def generate_suggestions(metadata: dict) -> dict:
     try:
         response = client.chat.completions.create(
             model=MODEL,
-            messages=messages
+            messages=messages,
+            priority=PRIORITY_BACKGROUND
         )
         content = response.choices[0].message.content
         
@@ -97,8 +212,8 @@ def generate_suggestions(metadata: dict) -> dict:
             "suggestions": ["What variables are in this file?", "Show me the dimensions.", "Describe the attributes."]
         }
 
-def chat_with_context(query: str, metadata: dict) -> str:
-    context = format_metadata_context(metadata)
+def build_chat_messages(query: str, metadata: dict) -> list:
+    context = format_metadata_context(metadata, query=query)
     
     system_prompt = """You are a helpful assistant that analyzes NetCDF file metadata. 
     User will provide metadata about a scientific dataset. 
@@ -109,12 +224,24 @@ def chat_with_context(query: str, metadata: dict) -> str:
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Here is the file metadata:\n{context}\n\nUser Query: {query}"}
     ]
-    
+    return messages
+
+def chat_with_context(query: str, metadata: dict) -> str:
     try:
         response = client.chat.completions.create(
             model=MODEL,
-            messages=messages
+            messages=build_chat_messages(query, metadata),
+            priority=PRIORITY_INTERACTIVE
         )
         return response.choices[0].message.content
     except Exception as e:
         return f"Error communicating with LLM: {str(e)}"
+
+def stream_chat_with_context(query: str, metadata: dict):
+    """Yields chat_with_context's answer as it is generated."""
+    try:
+        yield from client.chat.completions.stream_text(
+            model=MODEL, messages=build_chat_messages(query, metadata), priority=PRIORITY_INTERACTIVE
+        )
+    except Exception as e:
+        yield f"Error communicating with LLM: {str(e)}"
@@ -0,0 +1,257 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# OpenAI-compatible stand-in for OpenRouter / LM Studio.
+#   record -> forwards every request to --upstream and appends the pair to the recording
+#   replay -> answers from the recording; misses get a synthetic, role-aware answer
+# Point the app at it with LLM_PROVIDER=local LM_STUDIO_BASE_URL=http://127.0.0.1:<port>/v1
+RECORDING_FILE = os.getenv("LLM_STANDIN_RECORDING", "llm_recording.jsonl")
+EMBEDDING_DIM = 2560  # qwen3-embedding-4b, the default LOCAL_EMBEDDING_MODEL
+STREAM_CHUNK_CHARS = 16
+
+# Request fields that do not change the answer (a recording made with one model replays for any)
+IGNORED_FIELDS = {"stream", "stream_options", "model", "user"}
+
+def request_key(endpoint, body):
+    relevant = {k: v for k, v in body.items() if k not in IGNORED_FIELDS}
+    payload = json.dumps([endpoint, relevant], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Touches the dataset and the plotting path, like a typical generated recipe
+SYNTHETIC_CODE = """```python
+print(ds)
+var = list(ds.data_vars)[0]
+print(f"mean {var}: {float(ds[var].mean())}")
+ds[var].plot()
+plt.show()
+```"""
+
+
+def synthetic_chat_answer(messages):
+    """Plausible answers per agent, recognised by the system prompt, so the pipeline runs end to end."""
+    system = messages[0].get("content", "") if messages else ""
+    if "Planner" in system:
+        return json.dumps({"thought": "Summarise the dataset.", "steps": ["Print the dataset summary"]})
+    if "Lead Engineer" in system:
+        return json.dumps({"approved": True, "feedback": "Plan looks good."})
+    if "Code Generator" in system:
+        return SYNTHETIC_CODE
+    if "summary" in system and "suggestions" in system:
+        return json.dumps({"summary": "Synthetic summary.", "suggestions": ["Show the dimensions."]})
+    return "Synthetic answer: the analysis completed."
+
+
+def synthetic_embedding(text, dim=EMBEDDING_DIM):
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % 2**32
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class Recording:
+    """Append-only JSONL of {key, endpoint, request, response, latency}; last entry per key wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def add(self, entry):
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mode="replay", recording=None, upstream=None, api_key=None,
+                 latency=0.0, chunk_latency=0.0, recorded_latency=False, embedding_dim=EMBEDDING_DIM):
+        super().__init__(address, StandInHandler)
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown mode '{mode}'. Use 'record' or 'replay'.")
+        if mode == "record" and not upstream:
+            raise ValueError("Record mode needs an upstream base URL.")
+        self.mode = mode
+        self.recording = recording if recording is not None else Recording(RECORDING_FILE)
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.api_key = api_key
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.recorded_latency = recorded_latency
+        self.embedding_dim = embedding_dim
+        self.stats = {"requests": 0, "replayed": 0, "synthetic": 0, "recorded": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def start(self):
+        """Serves on a daemon thread (for benchmarks / tests). Returns self."""
+        threading.Thread(target=self.serve_forever, name="llm-standin", daemon=True).start()
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "standin", "object": "model", "owned_by": "local"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        server = self.server
+        server.count("requests")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            endpoint = "chat.completions"
+        elif self.path.endswith("/embeddings"):
+            endpoint = "embeddings"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        key = request_key(endpoint, body)
+        entry = server.recording.get(key)
+        if server.mode == "record" and entry is None:
+            try:
+                entry = self._record(endpoint, key, body)
+            except urllib.error.HTTPError as e:
+                self._send_json(e.code, {"error": {"message": f"Upstream error: {e.reason}"}})
+                return
+            except OSError as e:
+                self._send_json(502, {"error": {"message": f"Upstream unreachable: {e}"}})
+                return
+        elif entry is not None:
+            server.count("replayed")
+
+        if entry is not None:
+            response = entry["response"]
+            delay = entry.get("latency", 0.0) if server.recorded_latency else server.latency
+        else:
+            server.count("synthetic")
+            response = self._synthetic(endpoint, body)
+            delay = server.latency
+
+        if server.mode == "replay" and delay:
+            time.sleep(delay)
+        if endpoint == "chat.completions" and body.get("stream"):
+            self._send_stream(response)
+        else:
+            self._send_json(200, response)
+
+    def _record(self, endpoint, key, body):
+        """Forwards the request upstream (always non-streamed, so one JSON body is captured)."""
+        server = self.server
+        upstream_body = dict(body)
+        upstream_body.pop("stream", None)
+        upstream_body.pop("stream_options", None)
+        request = urllib.request.Request(
+            f"{server.upstream}/{endpoint.replace('.', '/')}",
+            data=json.dumps(upstream_body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {server.api_key or 'standin'}"}
+        )
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=600) as response:
+            payload = json.loads(response.read())
+        entry = {"key": key, "endpoint": endpoint, "request": upstream_body, "response": payload,
+                 "latency": time.perf_counter() - start}
+        server.recording.add(entry)
+        server.count("recorded")
+        return entry
+
+    def _synthetic(self, endpoint, body):
+        model = body.get("model", "standin")
+        if endpoint == "embeddings":
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return {"object": "list", "model": model, "data": [
+                {"object": "embedding", "index": i, "embedding": synthetic_embedding(text, self.server.embedding_dim)}
+                for i, text in enumerate(inputs)
+            ], "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+        return {
+            "id": "standin", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": synthetic_chat_answer(body.get("messages", []))}}]
+        }
+
+    def _send_stream(self, response):
+        """Replays a completion as server-sent events, chunk by chunk."""
+        content = response["choices"][0]["message"]["content"] or ""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": response.get("id", "standin"), "object": "chat.completion.chunk",
+                "created": response.get("created", 0), "model": response.get("model", "standin")}
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": content[start:start + STREAM_CHUNK_CHARS]}}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.server.chunk_latency:
+                time.sleep(self.server.chunk_latency)
+        final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible record/replay stand-in for offline runs.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--port", type=int, default=1235)
+    parser.add_argument("--recording", default=RECORDING_FILE, help="JSONL file of captured request/response pairs")
+    parser.add_argument("--upstream", help="Real endpoint for record mode, e.g. http://localhost:1234/v1")
+    parser.add_argument("--api-key", default=os.getenv("OPENROUTER_API_KEY"), help="Upstream API key (record mode)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each replayed answer")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--recorded-latency", action="store_true", help="Replay with the latency measured while recording")
+    args = parser.parse_args()
+
+    server = StandInServer(("127.0.0.1", args.port), args.mode, Recording(args.recording), args.upstream,
+                           args.api_key, args.latency, args.chunk_latency, args.recorded_latency)
+    print(f"LLM stand-in ({args.mode}) on {server.base_url}, recording: {args.recording} "
+          f"({len(server.recording.entries)} entries)")
+    print(f"Use: LLM_PROVIDER=local LM_STUDIO_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stats: {server.stats}")
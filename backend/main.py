@@ -1,12 +1,24 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 import shutil
 import os
+import json
+import threading
 from typing import List, Optional
 import uvicorn
 from nc_processor import extract_metadata
-from llm_service import analyze_nc_metadata, chat_with_context
+from llm_service import chat_with_context, stream_chat_with_context, scheduler
+from schema_registry import analyze_netcdf_schema
+from semantic_layer import resolve_concepts_for_schema
+from orchestrator import run_orchestrator_stream_async
+from worker_pool import EXECUTOR_WORKERS, get_worker_pool
+from artifact_store import artifact_store
+
+# Fork the code workers now, while the process is small and single-threaded
+if EXECUTOR_WORKERS > 0:
+    get_worker_pool()
 
 app = FastAPI(title="NetCDF LLM Prototype")
 
@@ -21,14 +33,25 @@ app.add_middleware(
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Cancel events of the analyses currently streaming, by run_id
+running_analyses = {}
+
 # Store metadata in memory for this prototype
 # In a real app, use a database
 metadata_store = {}
+# Schema bundles + paths for the multi-agent workflow (same shape the Streamlit app uses)
+schema_store = {}
 
 class ChatRequest(BaseModel):
     query: str
     file_id: str
 
+class AnalyzeRequest(BaseModel):
+    query: str
+    file_id: str
+    scenario_id: Optional[str] = None
+    run_id: Optional[str] = None  # Client-chosen id for POST /analyze/{run_id}/cancel
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
@@ -39,6 +62,12 @@ async def upload_file(file: UploadFile = File(...)):
         # Extract metadata
         metadata = extract_metadata(file_path)
         metadata_store[file.filename] = metadata
+        schema = analyze_netcdf_schema(file_path)
+        if "error" not in schema:
+            schema_store[file.filename] = {
+                "path": os.path.abspath(file_path),
+                "bundle": {"schema": schema, "concepts": resolve_concepts_for_schema(schema), "filename": file.filename}
+            }
         
         return {"filename": file.filename, "metadata": metadata}
     except Exception as e:
@@ -53,5 +82,85 @@ async def chat(request: ChatRequest):
     response = chat_with_context(request.query, metadata)
     return {"response": response}
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same answer as /chat, sent as plain text chunks while the model generates it."""
+    if request.file_id not in metadata_store:
+        raise HTTPException(status_code=404, detail="File not found or not processed")
+    
+    metadata = metadata_store[request.file_id]
+    # Sync generator: Starlette iterates it in a worker thread
+    return StreamingResponse(stream_chat_with_context(request.query, metadata), media_type="text/plain")
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalyzeRequest):
+    """
+    Runs the multi-agent workflow and streams newline-delimited JSON events:
+    {"type": "step", ...} per stage, {"type": "token", ...} per answer chunk,
+    then {"type": "done", "result": {...}} with the images as artifact
+    references, fetched separately from GET /artifacts/{ref}.
+    """
+    if request.file_id not in schema_store:
+        raise HTTPException(status_code=404, detail="File not found or not processed")
+    if request.scenario_id and request.scenario_id not in schema_store:
+        raise HTTPException(status_code=404, detail="Scenario file not found or not processed")
+
+    baseline = schema_store[request.file_id]
+    metadata_bundle = {"baseline": baseline["bundle"]}
+    scenario_path = None
+    if request.scenario_id:
+        metadata_bundle["scenario"] = schema_store[request.scenario_id]["bundle"]
+        scenario_path = schema_store[request.scenario_id]["path"]
+
+    cancel = threading.Event()
+    if request.run_id:
+        running_analyses[request.run_id] = cancel
+
+    async def events():
+        try:
+            async for event in run_orchestrator_stream_async(
+                request.query, metadata_bundle, baseline["path"], scenario_path, cancel_event=cancel
+            ):
+                yield json.dumps(event, default=str) + "\n"
+        finally:
+            # Also reached when the client disconnects: stop any code still running
+            cancel.set()
+            if request.run_id:
+                running_analyses.pop(request.run_id, None)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/analyze/{run_id}/cancel")
+async def cancel_analysis(run_id: str):
+    """Stops a running /analyze/stream request (its running code is killed)."""
+    cancel = running_analyses.get(run_id)
+    if cancel is None:
+        raise HTTPException(status_code=404, detail="No running analysis with this id")
+    cancel.set()
+    return {"cancelled": run_id}
+
+@app.get("/artifacts/{ref}")
+async def get_artifact(ref: str):
+    """A figure from the artifact store. Content-addressed, so it never changes."""
+    # Read in one go: eviction (any process) may delete the file at any point after
+    data = artifact_store.get(ref)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Artifact not found (unknown or evicted)")
+    artifact_store.touch(ref)
+    return Response(data, media_type=artifact_store.media_type(ref),
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Queue depth, in-flight requests and wait times of the LLM scheduler."""
+    return scheduler.summary()
+
+@app.get("/executor/stats")
+async def executor_stats():
+    """Jobs, cancellations, crashes and restarts of the code worker pool."""
+    if EXECUTOR_WORKERS <= 0:
+        return {"workers": 0}
+    return get_worker_pool().summary()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
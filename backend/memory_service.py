@@ -1,98 +1,248 @@
 import json
 import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from llm_service import client  # Re-use your existing client for embeddings
+from vector_store import VectorStore, make_key
+from embedding_cache import EmbeddingCache
+from schema_registry import schema_fingerprint, schema_overlap
 
 # Ensure the memory file is in the same directory as this script for simplicity
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Legacy JSON recipe book. Only read once to migrate into the vector store.
 MEMORY_FILE = os.path.join(BASE_DIR, "code_memory.json")
+# One vector store per embedding model lives side by side under this directory
+MEMORY_STORE_DIR = os.getenv("MEMORY_STORE_DIR", os.path.join(BASE_DIR, "memory_store"))
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-qwen3-embedding-4b"
+# The model that produced the embeddings in code_memory.json
+LEGACY_EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+
+# Schema-aware retrieval: recipes whose variables are missing from the current file
+# (e.g. 'elev' vs 'zeta') are dropped below MIN_OVERLAP and ranked down by WEIGHT.
+SCHEMA_MIN_OVERLAP = float(os.getenv("MEMORY_SCHEMA_MIN_OVERLAP", "0.5"))
+SCHEMA_WEIGHT = float(os.getenv("MEMORY_SCHEMA_WEIGHT", "0.5"))
+# Extra candidates fetched per requested recipe so filtering still leaves top_k
+SCHEMA_CANDIDATES = 4
+# Recipes this close to the question (and fully covered by the file's variables)
+# are re-run as they are, without the LLM chain (orchestrator fast path)
+REPLAY_THRESHOLD = float(os.getenv("MEMORY_REPLAY_THRESHOLD", "0.97"))
+
+_stores = {}
+_store_lock = threading.Lock()
+
+# Repeat queries (suggestion buttons, plan -> save) are served from here
+embedding_cache = EmbeddingCache()
+
+def get_embedding_model():
+    # CRITICAL UPDATE: Use the exact ID from your LM Studio
+    return os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
 
 def get_embedding(text):
-    """Generates a vector embedding for the text."""
+    """Generates a vector embedding for the text (cached per model + normalised text)."""
+    embedding_model = get_embedding_model()
+
+    cached = embedding_cache.get(embedding_model, text)
+    if cached is not None:
+        return cached
+
     try:
-        # CRITICAL UPDATE: Use the exact ID from your LM Studio
-        embedding_model = os.getenv("LOCAL_EMBEDDING_MODEL", "text-embedding-qwen3-embedding-4b")
-        
         response = client.embeddings.create(
             input=text,
             model=embedding_model
         )
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        embedding_cache.put(embedding_model, text, embedding)
+        return embedding
     except Exception as e:
         print(f"Embedding Error: {e}")
-        # Fallback for testing/offline mode
+        # Fallback for testing/offline mode (never cached, so we retry the API next time)
         # Create a deterministic vector based on the hash of the text
         import hashlib
         hash_val = int(hashlib.sha256(text.encode('utf-8')).hexdigest(), 16)
         np.random.seed(hash_val % 2**32)
         return np.random.rand(1536).tolist()
 
+def get_embeddings(texts, model=None, batch_size=64, concurrency=4):
+    """
+    Embeds many texts with batched requests (many inputs per embeddings.create call),
+    running at most `concurrency` requests at once. Cached texts are not re-sent.
+    Raises on API errors: bulk jobs should stop rather than store fallback vectors.
+    """
+    model = model or get_embedding_model()
+    results = [embedding_cache.get(model, text) for text in texts]
+    missing = [i for i, vec in enumerate(results) if vec is None]
+
+    def embed_batch(indices):
+        response = client.embeddings.create(input=[texts[i] for i in indices], model=model)
+        # The API may return items out of order; 'index' refers to the input position
+        for item in sorted(response.data, key=lambda d: d.index):
+            i = indices[item.index]
+            results[i] = item.embedding
+            embedding_cache.put(model, texts[i], item.embedding)
+
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            list(pool.map(embed_batch, batches))
+    return results
+
+def model_slug(model):
+    """Directory name for an embedding model's vector set."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+
+def _migrate_flat_layout():
+    """Moves a store written directly into MEMORY_STORE_DIR into its per-model directory."""
+    header_path = os.path.join(MEMORY_STORE_DIR, "store.json")
+    if not os.path.exists(header_path):
+        return
+    with open(header_path, "r") as f:
+        model = json.load(f).get("model") or LEGACY_EMBEDDING_MODEL
+    target = os.path.join(MEMORY_STORE_DIR, model_slug(model))
+    if os.path.exists(target):
+        return
+    os.makedirs(target)
+    for name in os.listdir(MEMORY_STORE_DIR):
+        path = os.path.join(MEMORY_STORE_DIR, name)
+        if os.path.isfile(path):
+            shutil.move(path, os.path.join(target, name))
+    print(f"Memory: Moved existing store into {target}.")
+
+def list_stores():
+    """Returns {model: store} for every vector set on disk."""
+    stores = {}
+    if os.path.isdir(MEMORY_STORE_DIR):
+        for name in sorted(os.listdir(MEMORY_STORE_DIR)):
+            header_path = os.path.join(MEMORY_STORE_DIR, name, "store.json")
+            if os.path.exists(header_path):
+                with open(header_path, "r") as f:
+                    model = json.load(f).get("model") or name
+                stores[model] = get_store(model)
+    return stores
+
+def get_store(model=None):
+    """
+    Opens the recipe vector store for an embedding model (default: the configured one).
+    Each model keeps its own vector set, so retrieval never scans incompatible vectors.
+    code_memory.json is migrated into the store of the model that produced it.
+    """
+    model = model or get_embedding_model()
+    with _store_lock:
+        store = _stores.get(model)
+        if store is None:
+            if not _stores:
+                _migrate_flat_layout()
+            directory = os.path.join(MEMORY_STORE_DIR, model_slug(model))
+            store = VectorStore(directory, model=model)
+            if model == LEGACY_EMBEDDING_MODEL and len(store) == 0 and os.path.exists(MEMORY_FILE):
+                imported = store.import_json(MEMORY_FILE, model=model)
+                if imported:
+                    print(f"Memory: Migrated {imported} recipes from {MEMORY_FILE} into {directory}.")
+            _stores[model] = store
+    return store
+
 def load_memory():
-    if os.path.exists(MEMORY_FILE):
-        try:
-            with open(MEMORY_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
-    return []
-
-def save_memory_entry(query, code, plan_summary):
-    """Saves a successful execution to the recipe book."""
-    memories = load_memory()
+    """Returns all stored recipes (query / code / plan), without embeddings."""
+    return get_store().all_records()
+
+def save_memory_entry(query, code, plan_summary, schema=None):
+    """
+    Saves a successful execution to the recipe book.
+    Appends one line to the store's write log (constant cost, safe across workers).
+    `schema` (from analyze_netcdf_schema) tags the recipe with the variables it ran against.
+    """
+    store = get_store()
     
-    # Avoid duplicates (simple check)
-    for mem in memories:
-        if mem["query"] == query and mem["code"] == code:
-            return
+    # Avoid duplicates (hash index, checked again under the store lock on append)
+    key = make_key(query, code)
+    if store.contains(key):
+        return
 
     entry = {
+        "key": key,
         "query": query,
         "code": code,
         "plan": plan_summary,
-        "embedding": get_embedding(query) # Store vector for fast search
+        "created": time.time()  # Eviction age for recipes that are never retrieved
     }
+    if schema:
+        entry["schema"] = schema_fingerprint(schema, code=code)
     
-    memories.append(entry)
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memories, f, indent=2)
-
-def find_similar_code(current_query, threshold=0.75):
-    """Finds the most relevant past code snippet."""
-    memories = load_memory()
-    if not memories:
-        return None
+    try:
+        store.append(get_embedding(query), entry)  # Store vector for fast search
+    except ValueError as e:
+        print(f"Warning: Could not store memory entry: {e}")
+
+def _rank_by_schema(hits, schema):
+    """
+    Drops recipes written for incompatible variables and re-ranks the rest by
+    similarity * (1 - SCHEMA_WEIGHT * (1 - overlap)). Recipes saved without a
+    schema fingerprint are kept as they are.
+    """
+    ranked = []
+    for mem, score in hits:
+        fingerprint = mem.get("schema")
+        if not fingerprint:
+            ranked.append((mem, score, score))
+            continue
+        overlap = schema_overlap(fingerprint, schema)
+        if overlap < SCHEMA_MIN_OVERLAP:
+            continue
+        ranked.append((mem, score, score * (1 - SCHEMA_WEIGHT * (1 - overlap))))
+    ranked.sort(key=lambda hit: -hit[2])
+    return [(mem, score) for mem, score, _ in ranked]
+
+def search_similar_code(current_query, top_k=5, threshold=0.0, schema=None):
+    """
+    Returns up to top_k (recipe, score) pairs with score >= threshold, best first.
+    Large memories are searched through the store's IVF index.
+    With a `schema`, recipes are filtered / re-ranked by variable overlap with it.
+    Lookups don't count as use: call record_recipe_use() for the recipe that is
+    actually replayed or shown to the planner.
+    """
+    store = get_store()
+    if len(store) == 0:
+        return []
         
     query_vec = get_embedding(current_query)
     if not query_vec:
-        return None
+        return []
 
-    best_match = None
-    best_score = -1
+    hits = store.search(query_vec, top_k=top_k * SCHEMA_CANDIDATES if schema else top_k)
+    hits = [(mem, score) for mem, score in hits if score >= threshold]
+    if schema:
+        hits = _rank_by_schema(hits, schema)[:top_k]
+    return hits
 
-    for mem in memories:
-        if not mem.get("embedding"): continue
-        
-        # Cosine Similarity calculation
-        vec_a = np.array(query_vec)
-        vec_b = np.array(mem["embedding"])
-        
-        norm_a = np.linalg.norm(vec_a)
-        norm_b = np.linalg.norm(vec_b)
-        
-        if norm_a == 0 or norm_b == 0:
-            continue
-            
-        # Dimension check
-        if vec_a.shape != vec_b.shape:
-            print(f"Warning: Embedding dimension mismatch ({vec_a.shape} vs {vec_b.shape}). Skipping memory entry.")
-            continue
-            
-        score = np.dot(vec_a, vec_b) / (norm_a * norm_b)
-        
-        if score > best_score:
-            best_score = score
-            best_match = mem
+def record_recipe_use(recipe):
+    """Counts one use of a retrieved recipe (hit count / last used drive eviction)."""
+    try:
+        get_store().record_hits([recipe.get("key")])
+    except OSError as e:
+        print(f"Warning: Could not record memory usage: {e}")
+
+def find_replayable_recipe(current_query, schema, threshold=None):
+    """
+    Returns (recipe, score) when a stored recipe can answer the question as is:
+    similarity >= threshold (default REPLAY_THRESHOLD) and every variable its code
+    references exists in `schema`. Recipes saved without a schema fingerprint
+    can't be checked and are never replayed.
+    """
+    threshold = REPLAY_THRESHOLD if threshold is None else threshold
+    current = set(schema_fingerprint(schema)["variables"])
+    for mem, score in search_similar_code(current_query, top_k=1, threshold=threshold, schema=schema):
+        used = (mem.get("schema") or {}).get("used")
+        if used and set(used) <= current:
+            return mem, score
+    return None
 
-    if best_score >= threshold:
-        return best_match
+def find_similar_code(current_query, threshold=0.75, schema=None):
+    """Finds the most relevant past code snippet (compatible with `schema`, if given)."""
+    hits = search_similar_code(current_query, top_k=1, threshold=threshold, schema=schema)
+    if hits:
+        return hits[0][0]
     return None
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import matplotlib.tri as tri
+
+# Triangulations of unstructured (SCHISM) meshes, built once from the file's own
+# connectivity instead of a Delaunay triangulation of x/y on every plot (slow on
+# million-node meshes, and it bridges concave coastlines and islands).
+MESH_CACHE_SIZE = int(os.getenv("MESH_CACHE_SIZE", "4"))
+
+FACE_NODES = "SCHISM_hgrid_face_nodes"
+NODE_DIM = "nSCHISM_hgrid_node"
+
+
+def faces_to_triangles(face_nodes, n_nodes, start_index=None):
+    """
+    (n_faces, 3 or 4) node indices -> (n_triangles, 3) zero-based triangles.
+    Quads are split along their 0-2 diagonal; fill values (NaN, negative or out
+    of range, e.g. the 4th node of a triangle) are masked. `start_index` is the
+    CF attribute; if missing, 1-based indexing is assumed when the indices span 1..n_nodes.
+    """
+    faces = np.asarray(face_nodes, dtype=np.float64)
+    if faces.ndim != 2 or faces.shape[1] < 3:
+        raise ValueError(f"Expected (faces, 3|4) connectivity, got shape {faces.shape}")
+    valid = np.isfinite(faces)
+    if start_index is None:
+        used = faces[valid]
+        start_index = 1 if used.size and used.min() >= 1 and used.max() == n_nodes else 0
+    faces = np.where(valid, faces - start_index, -1)
+    valid &= (faces >= 0) & (faces < n_nodes)
+    faces = faces.astype(np.int64)
+
+    first = valid[:, :3].all(axis=1)
+    triangles = [faces[first][:, :3]]
+    if faces.shape[1] > 3:
+        quads = first & valid[:, 3]
+        triangles.append(faces[quads][:, [0, 2, 3]])
+    return np.concatenate(triangles)
+
+
+def _digest(*arrays):
+    h = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(str((array.dtype, array.shape)).encode())
+        h.update(array.data)
+    return h.hexdigest()
+
+
+def mesh_identity(ds):
+    """Identity of the mesh in `ds`: its source file (path, mtime, size) when it has one."""
+    source = ds.encoding.get("source")
+    if source and os.path.exists(source):
+        st = os.stat(source)
+        return (os.path.realpath(source), st.st_mtime_ns, st.st_size)
+    return _digest(ds[FACE_NODES].values)
+
+
+class TriangulationCache:
+    """
+    Two LRU maps: mesh identity -> triangles (the expensive part: reading and
+    cleaning the connectivity), and (mesh identity, coordinates) -> Triangulation,
+    so lon/lat and projected x/y of the same mesh each get their own object while
+    matplotlib's lazily computed edges / trifinder are kept between plots.
+    """
+
+    def __init__(self, max_items=MESH_CACHE_SIZE):
+        self.max_items = max_items
+        self._triangles = OrderedDict()
+        self._triangulations = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _remember(self, store, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_items:
+            store.popitem(last=False)
+
+    def triangles(self, key, build):
+        with self._lock:
+            if key in self._triangles:
+                self._triangles.move_to_end(key)
+                return self._triangles[key]
+        triangles = build()
+        with self._lock:
+            self._remember(self._triangles, key, triangles)
+        return triangles
+
+    def triangulation(self, key, x, y, build_triangles):
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        full_key = (key, _digest(x, y))
+        with self._lock:
+            if full_key in self._triangulations:
+                self.stats["hits"] += 1
+                self._triangulations.move_to_end(full_key)
+                return self._triangulations[full_key]
+            self.stats["misses"] += 1
+        triangulation = tri.Triangulation(x, y, self.triangles(key, build_triangles))
+        with self._lock:
+            self._remember(self._triangulations, full_key, triangulation)
+        return triangulation
+
+    def reset(self):
+        """Empties the cache with a fresh lock (in a newly started worker process)."""
+        self._lock = threading.Lock()
+        self._triangles = OrderedDict()
+        self._triangulations = OrderedDict()
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, meshes=len(self._triangles), triangulations=len(self._triangulations))
+
+
+triangulation_cache = TriangulationCache()
+
+def has_connectivity(ds, n_nodes=None):
+    if ds is None or FACE_NODES not in ds:
+        return False
+    return n_nodes is None or ds.sizes.get(NODE_DIM) == n_nodes
+
+def mesh_triangulation(x, y, ds=None, faces=None):
+    """
+    Cached Triangulation of nodes x/y using the connectivity of `ds`
+    (SCHISM_hgrid_face_nodes) or explicit `faces`. None if neither is available,
+    in which case callers fall back to matplotlib's Delaunay triangulation.
+    """
+    n_nodes = np.size(x)
+    if faces is not None:
+        faces = np.asarray(faces)
+        return triangulation_cache.triangulation(
+            _digest(faces), x, y, lambda: faces_to_triangles(faces, n_nodes)
+        )
+    if not has_connectivity(ds, n_nodes):
+        return None
+    face_nodes = ds[FACE_NODES]
+    return triangulation_cache.triangulation(
+        mesh_identity(ds), x, y,
+        lambda: faces_to_triangles(face_nodes.values, n_nodes, face_nodes.attrs.get("start_index"))
+    )
@@ -1,5 +1,6 @@
 import xarray as xr
 import numpy as np
+from dataset_cache import open_cached_dataset
 
 def convert_to_serializable(obj):
     """Recursively convert numpy types to native Python types."""
@@ -20,24 +21,22 @@ def extract_metadata(file_path: str) -> dict:
     Opens a NetCDF file and extracts metadata about variables, dimensions, and attributes.
     """
     try:
-        ds = xr.open_dataset(file_path)
-        
-        metadata = {
-            "dims": dict(ds.sizes),
-            "coords": list(ds.coords.keys()),
-            "data_vars": {},
-            "attrs": ds.attrs
-        }
-        
-        for var_name, da in ds.data_vars.items():
-            metadata["data_vars"][var_name] = {
-                "dims": da.dims,
-                "attrs": da.attrs,
-                "dtype": str(da.dtype),
-                "shape": da.shape
+        with open_cached_dataset(file_path) as ds:
+            metadata = {
+                "dims": dict(ds.sizes),
+                "coords": list(ds.coords.keys()),
+                "data_vars": {},
+                "attrs": ds.attrs
             }
+        
+            for var_name, da in ds.data_vars.items():
+                metadata["data_vars"][var_name] = {
+                    "dims": da.dims,
+                    "attrs": da.attrs,
+                    "dtype": str(da.dtype),
+                    "shape": da.shape
+                }
             
-        ds.close()
-        return convert_to_serializable(metadata)
+            return convert_to_serializable(metadata)
     except Exception as e:
         raise Exception(f"Failed to process NetCDF file: {str(e)}")
@@ -1,58 +1,359 @@
-from agents.planner import plan_task
-from agents.evaluator import evaluate_plan
-from agents.executor import generate_and_execute_code
-from agents.synthesizer import synthesize_response
-from memory_service import save_memory_entry
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from agents.planner import plan_task, plan_task_async
+from agents.evaluator import evaluate_plan, evaluate_plan_async
+from agents.executor import generate_and_execute_code, generate_and_execute_code_async
+from agents.synthesizer import stream_synthesized_response, stream_synthesized_response_async
+from memory_service import save_memory_entry, find_replayable_recipe, record_recipe_use
+from code_executor import execute_python_code
 
-def run_orchestrator(query: str, metadata: dict, netcdf_path: str, scenario_path: str = None) -> dict:
+# The evaluator almost always approves, so code generation starts at the same time
+# as evaluation instead of after it (one LLM round trip off the critical path).
+SPECULATIVE_CODEGEN = os.getenv("SPECULATIVE_CODEGEN", "1") != "0"
+# What a rejected plan means:
+#   advisory -> log a warning and run the plan anyway (speculative work is kept)
+#   strict   -> stop; speculative code is cancelled and never executed
+PLAN_APPROVAL = os.getenv("PLAN_APPROVAL", "advisory").lower()
+# Repeat questions re-run their saved recipe directly (memory_service.REPLAY_THRESHOLD)
+# and only fall back to the agent chain if that fails
+RECIPE_REPLAY = os.getenv("RECIPE_REPLAY", "1") != "0"
+
+# Speculative generate-and-execute runs for the sync orchestrator
+_speculation_pool = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATION_WORKERS", "8")),
+                                       thread_name_prefix="speculative-codegen")
+
+def is_rejected(evaluation: dict) -> bool:
+    return PLAN_APPROVAL == "strict" and not evaluation.get("approved", True)
+
+def rejection_message(evaluation: dict) -> str:
+    return f"The analysis plan was rejected by the reviewer: {evaluation.get('feedback', 'no feedback given')}"
+
+def replay_succeeded(exec_result: dict) -> bool:
+    # Same bar as the executor: ran to the end without writing to stderr
+    return exec_result["success"] and not exec_result["stderr"]
+
+def is_cancelled(cancel_event) -> bool:
+    return cancel_event is not None and cancel_event.is_set()
+
+class LinkedEvent:
     """
-    Manages the multi-agent workflow: Plan -> Evaluate -> Execute -> Synthesize.
-    Returns a dict with 'response', 'images', and 'steps' (for UI visualization).
+    Cancel event of speculative work: reads as set once it or the caller's
+    `parent` event is set, but set() only stops the speculation, never the
+    caller's analysis (or whatever else shares its event).
+    """
+
+    def __init__(self, parent=None):
+        self._own = threading.Event()
+        self._parent = parent
+
+    def is_set(self) -> bool:
+        return self._own.is_set() or is_cancelled(self._parent)
+
+    def set(self):
+        self._own.set()
+
+    def wait(self, timeout=None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._own.wait(0.05 if remaining is None else min(0.05, remaining))
+        return True
+
+def cancellation_events(steps_log: list) -> list:
+    """Closing events of an analysis stopped through its cancel_event."""
+    message = "The analysis was cancelled."
+    events = []
+    if steps_log and steps_log[-1]["status"] == "running":
+        steps_log[-1]["status"] = "cancelled"
+        events.append({"type": "step", "step": steps_log[-1]})
+    events.append({"type": "token", "text": message})
+    events.append({"type": "done", "result": {"response": message, "images": [], "steps_log": steps_log}})
+    return events
+
+def replay_message(recipe: dict, score: float, exec_result: dict) -> str:
+    message = (f"Answered with the saved analysis for a near-identical question "
+               f"(\"{recipe['query']}\", similarity {score:.2f}), re-run on this file.")
+    if exec_result["stdout"].strip():
+        message += f"\n\n```\n{exec_result['stdout'].strip()}\n```"
+    return message
+
+# Events yielded by the streaming orchestrators:
+#   {"type": "step", "step": {...}}    -> a stage started ("running") or finished (same dict, updated)
+#   {"type": "token", "text": "..."}   -> next piece of the final answer
+#   {"type": "done", "result": {...}}  -> same dict run_orchestrator returns
+# Setting `cancel_event` (threading.Event) stops the running code and ends the
+# stream with a "cancelled" step and a short answer.
+
+def run_orchestrator_stream(query: str, metadata: dict, netcdf_path: str, scenario_path: str = None,
+                            cancel_event=None):
+    """
+    Manages the multi-agent workflow: Plan -> Evaluate -> Execute -> Synthesize,
+    yielding stage updates as they happen and the answer token by token.
     """
     steps_log = []
-    
+
+    def start(stage):
+        steps_log.append({"stage": stage, "status": "running"})
+        return {"type": "step", "step": steps_log[-1]}
+
+    def finish(status="complete", output=None):
+        steps_log[-1]["status"] = status
+        if output is not None:
+            steps_log[-1]["output"] = output
+        return {"type": "step", "step": steps_log[-1]}
+
+    # 0. Fast path: re-run the saved recipe of a near-identical question
+    if RECIPE_REPLAY and not scenario_path:
+        replay = find_replayable_recipe(query, metadata.get("baseline"))
+        if replay:
+            recipe, score = replay
+            yield start("Recipe Replay")
+            exec_result = execute_python_code(recipe["code"], netcdf_path, cancel_event=cancel_event)
+            if replay_succeeded(exec_result):
+                record_recipe_use(recipe)
+                yield finish(output={"query": recipe["query"], "score": score, "stdout": exec_result["stdout"]})
+                message = replay_message(recipe, score, exec_result)
+                yield {"type": "token", "text": message}
+                yield {"type": "done", "result": {
+                    "response": message, "images": exec_result["images"], "steps_log": steps_log
+                }}
+                return
+            if is_cancelled(cancel_event):
+                for event in cancellation_events(steps_log):
+                    yield event
+                return
+            # Fall back to the full chain
+            yield finish("failed", {"stdout": exec_result["stdout"], "stderr": exec_result["stderr"]})
+
     # 1. Planning
-    steps_log.append({"stage": "Planning", "status": "running"})
+    yield start("Planning")
     plan = plan_task(query, metadata)
-    steps_log[-1]["status"] = "complete"
-    steps_log[-1]["output"] = plan
-    
-    # 2. Evaluation
-    steps_log.append({"stage": "Evaluation", "status": "running"})
-    evaluation = evaluate_plan(query, plan, metadata)
-    steps_log[-1]["status"] = "complete"
-    steps_log[-1]["output"] = evaluation
-    
+    yield finish(output=plan)
+    if is_cancelled(cancel_event):
+        for event in cancellation_events(steps_log):
+            yield event
+        return
+
+    # 2. Evaluation (code generation starts alongside it when speculating).
+    # No yield between starting the speculation and releasing its verdict.
+    yield start("Evaluation")
+    speculation = None
+    if SPECULATIVE_CODEGEN:
+        cancel = LinkedEvent(cancel_event)
+        verdict = threading.Event()
+        # Strict policy: the generated code waits for the verdict before it runs
+        approval = (lambda: verdict.wait() and not cancel.is_set()) if PLAN_APPROVAL == "strict" else None
+        speculation = _speculation_pool.submit(
+            generate_and_execute_code, query, plan, netcdf_path, scenario_path, cancel_event=cancel, approval=approval
+        )
+    rejected = True
+    try:
+        evaluation = evaluate_plan(query, plan, metadata)
+        rejected = is_rejected(evaluation)
+    finally:
+        # Always release the speculation (stopped unless the plan went through)
+        if speculation is not None:
+            if rejected:
+                cancel.set()
+            verdict.set()
+    yield finish("rejected" if rejected else "complete", evaluation)
+
+    if rejected:
+        message = rejection_message(evaluation)
+        yield {"type": "token", "text": message}
+        yield {"type": "done", "result": {"response": message, "images": [], "steps_log": steps_log}}
+        return
+
     if not evaluation.get("approved", True):
         # In a real system, we would loop back to planner with feedback.
         # For prototype, we'll just warn and proceed or stop.
         # Let's proceed but note the warning.
         steps_log.append({"stage": "Warning", "status": "warning", "output": "Plan was flagged but proceeding."})
-    
+        yield {"type": "step", "step": steps_log[-1]}
+
     # 3. Execution
-    steps_log.append({"stage": "Execution", "status": "running"})
-    exec_result = generate_and_execute_code(query, plan, netcdf_path, scenario_path)
-    steps_log[-1]["status"] = "complete" if exec_result["success"] else "failed"
-    steps_log[-1]["output"] = {"stdout": exec_result.get("stdout"), "stderr": exec_result.get("stderr")}
-    
+    yield start("Execution")
+    if speculation is not None:
+        exec_result = speculation.result()
+    else:
+        exec_result = generate_and_execute_code(query, plan, netcdf_path, scenario_path, cancel_event=cancel_event)
+    if is_cancelled(cancel_event):
+        for event in cancellation_events(steps_log):
+            yield event
+        return
+    yield finish("complete" if exec_result["success"] else "failed",
+                 {"stdout": exec_result.get("stdout"), "stderr": exec_result.get("stderr")})
+
     # === NEW: MEMORY STORAGE ===
     if exec_result["success"]:
         # If the code ran without crashing, we assume it's a "good recipe"
         # We save the code associated with this query
         code_to_save = exec_result.get("code_generated", "")
         if code_to_save:
-            save_memory_entry(query, code_to_save, plan.get("thought", ""))
+            save_memory_entry(query, code_to_save, plan.get("thought", ""), schema=metadata.get("baseline"))
             # Log learning
             steps_log.append({"stage": "Learning", "status": "complete", "output": "Saved successful code to memory."})
+            yield {"type": "step", "step": steps_log[-1]}
     # ===========================
-    
-    # 4. Synthesis
-    steps_log.append({"stage": "Synthesis", "status": "running"})
-    final_response = synthesize_response(query, plan, exec_result)
-    steps_log[-1]["status"] = "complete"
-    
-    return {
-        "response": final_response,
+
+    # 4. Synthesis (streamed)
+    yield start("Synthesis")
+    parts = []
+    for text in stream_synthesized_response(query, plan, exec_result):
+        parts.append(text)
+        yield {"type": "token", "text": text}
+    yield finish()
+
+    yield {"type": "done", "result": {
+        "response": "".join(parts),
+        "images": exec_result.get("images", []),
+        "steps_log": steps_log
+    }}
+
+def run_orchestrator(query: str, metadata: dict, netcdf_path: str, scenario_path: str = None,
+                     cancel_event=None) -> dict:
+    """
+    Manages the multi-agent workflow: Plan -> Evaluate -> Execute -> Synthesize.
+    Returns a dict with 'response', 'images', and 'steps' (for UI visualization).
+    """
+    for event in run_orchestrator_stream(query, metadata, netcdf_path, scenario_path, cancel_event):
+        if event["type"] == "done":
+            return event["result"]
+
+async def run_orchestrator_stream_async(query: str, metadata: dict, netcdf_path: str, scenario_path: str = None,
+                                        cancel_event=None):
+    """
+    Async run_orchestrator_stream (same events). LLM calls share one pooled
+    AsyncOpenAI client and blocking work (memory, code execution) runs in worker
+    threads, so one process can serve many analyses concurrently.
+    """
+    steps_log = []
+
+    def start(stage):
+        steps_log.append({"stage": stage, "status": "running"})
+        return {"type": "step", "step": steps_log[-1]}
+
+    def finish(status="complete", output=None):
+        steps_log[-1]["status"] = status
+        if output is not None:
+            steps_log[-1]["output"] = output
+        return {"type": "step", "step": steps_log[-1]}
+
+    # 0. Fast path: re-run the saved recipe of a near-identical question
+    if RECIPE_REPLAY and not scenario_path:
+        replay = await asyncio.to_thread(find_replayable_recipe, query, metadata.get("baseline"))
+        if replay:
+            recipe, score = replay
+            yield start("Recipe Replay")
+            exec_result = await asyncio.to_thread(execute_python_code, recipe["code"], netcdf_path,
+                                                  cancel_event=cancel_event)
+            if replay_succeeded(exec_result):
+                await asyncio.to_thread(record_recipe_use, recipe)
+                yield finish(output={"query": recipe["query"], "score": score, "stdout": exec_result["stdout"]})
+                message = replay_message(recipe, score, exec_result)
+                yield {"type": "token", "text": message}
+                yield {"type": "done", "result": {
+                    "response": message, "images": exec_result["images"], "steps_log": steps_log
+                }}
+                return
+            if is_cancelled(cancel_event):
+                for event in cancellation_events(steps_log):
+                    yield event
+                return
+            # Fall back to the full chain
+            yield finish("failed", {"stdout": exec_result["stdout"], "stderr": exec_result["stderr"]})
+
+    # 1. Planning
+    yield start("Planning")
+    plan = await plan_task_async(query, metadata)
+    yield finish(output=plan)
+    if is_cancelled(cancel_event):
+        for event in cancellation_events(steps_log):
+            yield event
+        return
+
+    # 2. Evaluation (code generation starts alongside it when speculating)
+    yield start("Evaluation")
+    speculation = None
+    if SPECULATIVE_CODEGEN:
+        verdict = asyncio.get_running_loop().create_future()
+        cancel = LinkedEvent(cancel_event)
+
+        async def approval():
+            return await verdict
+
+        speculation = asyncio.create_task(generate_and_execute_code_async(
+            query, plan, netcdf_path, scenario_path, approval=approval if PLAN_APPROVAL == "strict" else None,
+            cancel_event=cancel
+        ))
+    rejected = True
+    try:
+        evaluation = await evaluate_plan_async(query, plan, metadata)
+        rejected = is_rejected(evaluation)
+    finally:
+        # Always release the speculation (stopped unless the plan went through)
+        if speculation is not None:
+            if rejected:
+                cancel.set()
+                speculation.cancel()
+            verdict.set_result(not rejected)
+    yield finish("rejected" if rejected else "complete", evaluation)
+
+    if rejected:
+        message = rejection_message(evaluation)
+        yield {"type": "token", "text": message}
+        yield {"type": "done", "result": {"response": message, "images": [], "steps_log": steps_log}}
+        return
+
+    if not evaluation.get("approved", True):
+        steps_log.append({"stage": "Warning", "status": "warning", "output": "Plan was flagged but proceeding."})
+        yield {"type": "step", "step": steps_log[-1]}
+
+    # 3. Execution
+    yield start("Execution")
+    if speculation is not None:
+        exec_result = await speculation
+    else:
+        exec_result = await generate_and_execute_code_async(query, plan, netcdf_path, scenario_path,
+                                                            cancel_event=cancel_event)
+    if is_cancelled(cancel_event):
+        for event in cancellation_events(steps_log):
+            yield event
+        return
+    yield finish("complete" if exec_result["success"] else "failed",
+                 {"stdout": exec_result.get("stdout"), "stderr": exec_result.get("stderr")})
+
+    if exec_result["success"]:
+        code_to_save = exec_result.get("code_generated", "")
+        if code_to_save:
+            await asyncio.to_thread(
+                save_memory_entry, query, code_to_save, plan.get("thought", ""), schema=metadata.get("baseline")
+            )
+            steps_log.append({"stage": "Learning", "status": "complete", "output": "Saved successful code to memory."})
+            yield {"type": "step", "step": steps_log[-1]}
+
+    # 4. Synthesis (streamed)
+    yield start("Synthesis")
+    parts = []
+    async for text in stream_synthesized_response_async(query, plan, exec_result):
+        parts.append(text)
+        yield {"type": "token", "text": text}
+    yield finish()
+
+    yield {"type": "done", "result": {
+        "response": "".join(parts),
         "images": exec_result.get("images", []),
         "steps_log": steps_log
-    }
+    }}
+
+async def run_orchestrator_async(query: str, metadata: dict, netcdf_path: str, scenario_path: str = None,
+                                 cancel_event=None) -> dict:
+    """Async run_orchestrator: returns the same dict once the stream is done."""
+    async for event in run_orchestrator_stream_async(query, metadata, netcdf_path, scenario_path, cancel_event):
+        if event["type"] == "done":
+            return event["result"]
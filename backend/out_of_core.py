@@ -0,0 +1,140 @@
+import contextlib
+import functools
+import os
+import xarray as xr
+import worker_pool
+
+try:
+    import dask
+except ImportError:  # Optional: without dask every file is opened in memory
+    dask = None
+
+# Out-of-core mode for generated code: the header opens files as dask arrays with
+# chunks chosen from the file size, SCHISM dimension names and the memory at hand,
+# so reductions (.max(), .mean(dim=...)) stream through the file chunk by chunk.
+#   auto -> only files too big to load comfortably (OUT_OF_CORE_FRACTION of the budget)
+#   1    -> always
+#   0    -> never
+OUT_OF_CORE = os.getenv("OUT_OF_CORE", "auto").lower()
+OUT_OF_CORE_FRACTION = float(os.getenv("OUT_OF_CORE_FRACTION", "0.25"))
+# Upper bound for one chunk of the largest variable
+DASK_CHUNK_MB = int(os.getenv("DASK_CHUNK_MB", "128"))
+# Threads of the local dask scheduler per execution (0 = cores shared out between pool workers)
+DASK_THREADS = int(os.getenv("DASK_THREADS", "0"))
+
+TIME_DIM = "time"
+NODE_DIM = "nSCHISM_hgrid_node"
+LAYER_DIM = "nSCHISM_vgrid_layers"
+
+
+def available_memory():
+    """Bytes of RAM available to one execution (None if unknown)."""
+    limits = []
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    limits.append(int(line.split()[1]) * 1024)
+    except OSError:
+        try:
+            limits.append(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+        except (ValueError, OSError, AttributeError):
+            pass
+    # The per-execution cap of the worker pool
+    if worker_pool.EXEC_MEMORY_LIMIT_MB > 0:
+        limits.append(worker_pool.EXEC_MEMORY_LIMIT_MB * 1024 * 1024)
+    return min(limits) if limits else None
+
+
+def scheduler_threads():
+    if DASK_THREADS > 0:
+        return DASK_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, worker_pool.EXECUTOR_WORKERS))
+
+
+def use_out_of_core(path):
+    if dask is None or OUT_OF_CORE == "0":
+        return False
+    if OUT_OF_CORE != "auto":
+        return True
+    budget = available_memory()
+    return budget is not None and os.path.getsize(path) > OUT_OF_CORE_FRACTION * budget
+
+
+def _split_order(sizes):
+    # Time steps first (most analyses reduce over or select in time), then nodes;
+    # the vertical layers stay whole as long as possible (profiles, depth averages)
+    order = [dim for dim in (TIME_DIM, NODE_DIM) if dim in sizes]
+    order += sorted((dim for dim in sizes if dim not in (TIME_DIM, NODE_DIM, LAYER_DIM)),
+                    key=lambda dim: -sizes[dim])
+    if LAYER_DIM in sizes:
+        order.append(LAYER_DIM)
+    return order
+
+
+def choose_chunks(ds, target_bytes):
+    """
+    Chunk sizes for `ds` so that one chunk of its largest variable stays under
+    `target_bytes`. Dimensions are split in _split_order(); the ones not listed
+    stay whole. Returns {} when the largest variable already fits.
+    """
+    largest = max(ds.data_vars.values(), key=lambda da: da.size * da.dtype.itemsize, default=None)
+    if largest is None:
+        return {}
+    sizes = dict(largest.sizes)
+    remaining = largest.size * largest.dtype.itemsize
+    chunks = {}
+    for dim in _split_order(sizes):
+        if remaining <= target_bytes:
+            break
+        per_index = remaining / sizes[dim]
+        chunks[dim] = max(1, min(sizes[dim], int(target_bytes // per_index)))
+        remaining = per_index * chunks[dim]
+    return chunks
+
+
+def target_chunk_bytes():
+    target = DASK_CHUNK_MB * 1024 * 1024
+    budget = available_memory()
+    if budget:
+        # Every scheduler thread holds a few chunks at once (input, temporaries, result)
+        target = min(target, budget // (4 * scheduler_threads()))
+    return max(1024 * 1024, target)
+
+
+def auto_chunks(path):
+    """
+    Chunks to open `path` with, or None for in-memory. Decided before the file is
+    opened for use, from a header-only open that is not kept (so a big file is
+    never also held as a plain, eagerly decoded handle).
+    """
+    if not use_out_of_core(path):
+        return None
+    st = os.stat(path)
+    chunks = _header_chunks(path, st.st_mtime_ns, st.st_size, target_chunk_bytes())
+    return dict(chunks) or None
+
+
+@functools.lru_cache(maxsize=64)
+def _header_chunks(path, mtime_ns, size, target_bytes):
+    # Metadata only: opening is lazy and nothing is decoded into memory
+    with xr.open_dataset(path) as ds:
+        return tuple(choose_chunks(ds, target_bytes).items())
+
+
+@contextlib.contextmanager
+def dask_scheduler():
+    """
+    Local threaded dask scheduler for the duration of one execution. dask.config
+    is process-wide, but concurrent in-process executions all set the same values.
+    """
+    if dask is None:
+        yield
+        return
+    with dask.config.set(scheduler="threads", num_workers=scheduler_threads()):
+        yield
+
+
+def describe_chunks(chunks):
+    return ", ".join(f"{dim}={size}" for dim, size in chunks.items()) or "whole variables"
+
@@ -4,18 +4,27 @@ import json
 import os
 import numpy as np
 import io
-import base64
+from artifact_store import artifact_store
+from dataset_cache import dataset_cache
+from figure_capture import new_figure
+from mesh import mesh_triangulation
+from rasterize import draw_raster, use_raster
 
 def generate_profile(netcdf_path):
     """
     Generates a deterministic profile of the NetCDF file.
-    Returns a dictionary with metadata, stats, and a base64 encoded preview image.
+    Returns a dictionary with metadata, stats, and the preview image (artifact_store reference).
     """
     try:
-        ds = xr.open_dataset(netcdf_path)
+        key, ds = dataset_cache.acquire(netcdf_path)
     except Exception as e:
         return {"error": f"Could not open file: {e}"}
-    
+    try:
+        return _profile(ds, netcdf_path)
+    finally:
+        dataset_cache.release(key)
+
+def _profile(ds, netcdf_path):
     # 1. Basic Metadata
     summary = {
         "filename": os.path.basename(netcdf_path),
@@ -57,14 +66,21 @@ def generate_profile(netcdf_path):
                 y = ds[y_var]
                 depth = ds['depth']
                 
-                fig = plt.figure(figsize=(8, 6))
+                fig = new_figure(figsize=(8, 6))  # Not in pyplot's global figure list: safe from any thread
                 ax = fig.add_subplot(111)
                 # Use tricontourf for unstructured, or contourf for structured if needed
                 # For SCHISM, it's unstructured, but xarray might not handle it directly without triangulation
                 # We'll try a simple scatter if triangulation is complex, or tricontourf if we assume triangles
                 
                 try:
-                    ax.tricontourf(x, y, depth, levels=20, cmap='viridis_r') # _r for reverse (deep is dark)
+                    # The mesh's own connectivity (cached) when the file has it, else Delaunay on x/y
+                    triangulation = mesh_triangulation(x.values, y.values, ds=ds)
+                    if use_raster(triangulation):
+                        draw_raster(ax, triangulation, depth.values, cmap='viridis_r')
+                    elif triangulation is not None:
+                        ax.tricontourf(triangulation, depth, levels=20, cmap='viridis_r')
+                    else:
+                        ax.tricontourf(x, y, depth, levels=20, cmap='viridis_r') # _r for reverse (deep is dark)
                     fig.colorbar(plt.cm.ScalarMappable(cmap='viridis_r'), ax=ax, label='Depth (m)')
                     ax.set_title('Model Domain & Bathymetry')
                 except:
@@ -75,14 +91,10 @@ def generate_profile(netcdf_path):
                 # Save to buffer
                 buf = io.BytesIO()
                 fig.savefig(buf, format='png')
-                buf.seek(0)
-                img_str = base64.b64encode(buf.read()).decode('utf-8')
-                summary['preview_image'] = img_str
-                plt.close(fig)
+                summary['preview_image'] = artifact_store.put(buf.getvalue())
         except Exception as e:
             summary['preview_error'] = str(e)
 
-    ds.close()
     return summary
 
 def check_compatibility(file1_path, file2_path):
@@ -90,9 +102,12 @@ def check_compatibility(file1_path, file2_path):
     Checks if two NetCDF files are compatible for direct comparison (subtraction).
     Returns a tuple: (is_compatible: bool, message: str)
     """
+    leases = []
     try:
-        ds1 = xr.open_dataset(file1_path)
-        ds2 = xr.open_dataset(file2_path)
+        key1, ds1 = dataset_cache.acquire(file1_path)
+        leases.append(key1)
+        key2, ds2 = dataset_cache.acquire(file2_path)
+        leases.append(key2)
         
         # Check 1: Topology (Node count)
         # SCHISM usually uses 'nSCHISM_hgrid_node'
@@ -117,8 +132,8 @@ def check_compatibility(file1_path, file2_path):
     except Exception as e:
         return False, f"Error checking compatibility: {e}"
     finally:
-        if 'ds1' in locals(): ds1.close()
-        if 'ds2' in locals(): ds2.close()
+        for key in leases:
+            dataset_cache.release(key)
 
 if __name__ == "__main__":
     # Test run
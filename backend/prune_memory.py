@@ -0,0 +1,29 @@
+import argparse
+from memory_service import get_store, list_stores
+from vector_store import EVICTION_POLICIES
+
+def prune(model=None, max_entries=None, threshold=None, policy=None):
+    """
+    Merges near-duplicate recipes and enforces the size cap on one vector set.
+    Unset options fall back to MEMORY_MAX_ENTRIES / MEMORY_DEDUPE_THRESHOLD /
+    MEMORY_EVICTION_POLICY. Returns the store's prune stats.
+    """
+    store = get_store(model)
+    before = len(store)
+    stats = store.prune(max_entries=max_entries, threshold=threshold, policy=policy)
+    print(f"- {store.model or model}: {before} -> {stats['kept']} recipes "
+          f"({stats['merged']} merged, {stats['evicted']} evicted)")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the code memory: merge near-duplicates, evict unused recipes.")
+    parser.add_argument("--model", help="Embedding model whose vector set to prune (default: LOCAL_EMBEDDING_MODEL)")
+    parser.add_argument("--all", action="store_true", help="Prune every vector set on disk")
+    parser.add_argument("--max-entries", type=int, help="Size cap (0 = unbounded)")
+    parser.add_argument("--threshold", type=float, help="Cosine similarity at which recipes are merged (0 = off)")
+    parser.add_argument("--policy", choices=EVICTION_POLICIES, help="Eviction order once over the cap")
+    args = parser.parse_args()
+
+    models = list(list_stores().keys()) if args.all else [args.model]
+    for model in models:
+        prune(model, args.max_entries, args.threshold, args.policy)
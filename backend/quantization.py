@@ -0,0 +1,74 @@
+import numpy as np
+
+# Supported storage types for recipe vectors. Vectors are unit length, so
+# float16 keeps ~3 significant digits; int8 stores round(v / scale) with one
+# float32 scale per vector (scale = max|v| / 127).
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Rows dequantised per step when scanning, bounds the temporary float32 copy
+SCAN_CHUNK = 4096
+
+
+def quantize(vectors, dtype):
+    """Returns (codes, scales); scales is None unless dtype is int8."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector dtype '{dtype}'. Use one of {STORAGE_DTYPES}.")
+
+
+class DequantizedView:
+    """
+    Read-only float32 view over quantised (possibly memory-mapped) codes.
+    Supports len(), .shape and row indexing, which is all the search code needs,
+    so quantised and float32 stores share the same search path.
+    """
+
+    def __init__(self, codes, scales=None):
+        self.codes = codes
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dot(self, query, start=0, stop=None):
+        """Scores rows [start, stop) against query; int8 scales are applied after the dot product."""
+        scores = np.asarray(self.codes[start:stop], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def __getitem__(self, key):
+        rows = np.asarray(self.codes[key], dtype=np.float32)
+        if self.scales is not None:
+            scales = np.asarray(self.scales[key], dtype=np.float32)
+            rows = rows * (scales[..., None] if rows.ndim > 1 else scales)
+        return rows
+
+
+def scan_scores(matrix, query):
+    """matrix @ query in chunks, so quantised matrices never get fully upcast in RAM."""
+    if isinstance(matrix, np.ndarray) and matrix.dtype == np.float32:
+        return matrix @ query
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SCAN_CHUNK):
+        if isinstance(matrix, DequantizedView):
+            scores[start:start + SCAN_CHUNK] = matrix.dot(query, start, start + SCAN_CHUNK)
+        else:
+            scores[start:start + SCAN_CHUNK] = matrix[start:start + SCAN_CHUNK] @ query
+    return scores
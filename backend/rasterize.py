@@ -0,0 +1,120 @@
+import os
+import numpy as np
+
+# Meshes with more triangles than this are drawn as an image (rasterize_mesh +
+# imshow) instead of one polygon per triangle: on large meshes most triangles are
+# smaller than a pixel, and tripcolor / tricontourf time and memory grow with the
+# mesh while the picture does not get any better.
+RASTER_MIN_TRIANGLES = int(os.getenv("RASTER_MIN_TRIANGLES", "200000"))
+RASTER_WIDTH = int(os.getenv("RASTER_WIDTH", "1200"))
+# Candidate (triangle, pixel) pairs tested per batch; bounds the temporary memory
+BATCH_PAIRS = 1_000_000
+
+
+def raster_shape(extent, width=RASTER_WIDTH):
+    """(height, width) in pixels for `extent` with square pixels."""
+    xmin, xmax, ymin, ymax = extent
+    span_x, span_y = max(xmax - xmin, 1e-12), max(ymax - ymin, 1e-12)
+    return max(1, int(round(width * span_y / span_x))), width
+
+
+def rasterize_mesh(x, y, triangles, values, width=RASTER_WIDTH, height=None, extent=None):
+    """
+    Samples a triangle mesh onto a regular pixel grid, all in vectorised NumPy.
+    - values: one per node (barycentric interpolation) or one per triangle (flat)
+    - Triangles covering at least one pixel centre are sampled there exactly.
+    - Triangles that cover no pixel centre (sub-pixel, or thin slivers between
+      centres) are averaged into the pixel holding their centroid (per-pixel
+      aggregation) where no triangle was sampled, so nothing is lost.
+    Returns (image, extent): a (height, width) float array with NaN outside the
+    mesh, row 0 at ymin (imshow(..., origin="lower", extent=extent)).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    triangles = np.asarray(triangles)
+    values = np.asarray(values, dtype=np.float64).ravel()
+    per_node = values.size == x.size
+    if not per_node and values.size != len(triangles):
+        raise ValueError(f"{values.size} values for {x.size} nodes / {len(triangles)} triangles")
+    if extent is None:
+        extent = (float(np.nanmin(x)), float(np.nanmax(x)), float(np.nanmin(y)), float(np.nanmax(y)))
+    if height is None:
+        height, width = raster_shape(extent, width)
+    xmin, xmax, ymin, ymax = extent
+
+    # Continuous pixel coordinates: pixel (i, j) has its centre at (i + 0.5, j + 0.5)
+    px = (x - xmin) / max(xmax - xmin, 1e-12) * width
+    py = (y - ymin) / max(ymax - ymin, 1e-12) * height
+    tx, ty = px[triangles], py[triangles]
+    tv = values[triangles] if per_node else values[:, None].repeat(3, axis=1)
+
+    # Pixel centres inside each triangle's bounding box
+    i0 = np.clip(np.ceil(tx.min(axis=1) - 0.5), 0, width).astype(np.int64)
+    i1 = np.clip(np.floor(tx.max(axis=1) - 0.5), -1, width - 1).astype(np.int64)
+    j0 = np.clip(np.ceil(ty.min(axis=1) - 0.5), 0, height).astype(np.int64)
+    j1 = np.clip(np.floor(ty.max(axis=1) - 0.5), -1, height - 1).astype(np.int64)
+    nx = np.maximum(i1 - i0 + 1, 0)
+    ny = np.maximum(j1 - j0 + 1, 0)
+    counts = nx * ny
+
+    image = np.full(height * width, np.nan)
+    # Triangles with at least one pixel centre inside (not just in their bounding box)
+    covered = np.zeros(len(triangles), dtype=bool)
+
+    # 1. Barycentric test / interpolation at every candidate pixel centre
+    large = np.flatnonzero(counts > 0)
+    bounds = np.cumsum(counts[large])
+    start = 0
+    while start < len(large):
+        stop = int(np.searchsorted(bounds, (bounds[start - 1] if start else 0) + BATCH_PAIRS, side="right"))
+        stop = max(stop, start + 1)
+        _sample_triangles(image, covered, large[start:stop], counts, i0, j0, nx, tx, ty, tv, width)
+        start = stop
+
+    # 2. Everything else: mean of their centroid values per pixel, in pixels left empty
+    rest = ~covered
+    cx = np.clip(tx[rest].mean(axis=1).astype(np.int64), 0, width - 1)
+    cy = np.clip(ty[rest].mean(axis=1).astype(np.int64), 0, height - 1)
+    cv = tv[rest].mean(axis=1)
+    ok = np.isfinite(cv)
+    cells = cy[ok] * width + cx[ok]
+    total = np.bincount(cells, weights=cv[ok], minlength=height * width)
+    hits = np.bincount(cells, minlength=height * width)
+    empty = np.isnan(image) & (hits > 0)
+    image[empty] = total[empty] / hits[empty]
+
+    return image.reshape(height, width), extent
+
+
+def _sample_triangles(image, covered, index, counts, i0, j0, nx, tx, ty, tv, width):
+    # One row per (triangle, candidate pixel) pair
+    owner = np.repeat(index, counts[index])
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(counts[index]) - counts[index], counts[index])
+    pi = i0[owner] + offsets % nx[owner]
+    pj = j0[owner] + offsets // nx[owner]
+    sx, sy = pi + 0.5, pj + 0.5
+
+    x0, x1, x2 = tx[owner, 0], tx[owner, 1], tx[owner, 2]
+    y0, y1, y2 = ty[owner, 0], ty[owner, 1], ty[owner, 2]
+    det = (y1 - y2) * (x0 - x2) + (x2 - x1) * (y0 - y2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w0 = ((y1 - y2) * (sx - x2) + (x2 - x1) * (sy - y2)) / det
+        w1 = ((y2 - y0) * (sx - x2) + (x0 - x2) * (sy - y2)) / det
+    w2 = 1 - w0 - w1
+    eps = -1e-9
+    inside = (w0 >= eps) & (w1 >= eps) & (w2 >= eps) & (det != 0)
+    value = w0 * tv[owner, 0] + w1 * tv[owner, 1] + w2 * tv[owner, 2]
+    image[(pj * width + pi)[inside]] = value[inside]
+    covered[owner[inside]] = True
+
+
+def draw_raster(ax, triangulation, values, cmap=None, vmin=None, vmax=None, width=RASTER_WIDTH):
+    """imshow of rasterize_mesh on `ax` (masked outside the mesh). Returns the AxesImage."""
+    image, extent = rasterize_mesh(triangulation.x, triangulation.y, triangulation.get_masked_triangles(),
+                                   values, width=width)
+    return ax.imshow(np.ma.masked_invalid(image), origin="lower", extent=extent, cmap=cmap,
+                     vmin=vmin, vmax=vmax, interpolation="nearest", aspect="equal")
+
+
+def use_raster(triangulation):
+    return triangulation is not None and len(triangulation.triangles) > RASTER_MIN_TRIANGLES
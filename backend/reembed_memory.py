@@ -0,0 +1,67 @@
+import argparse
+import os
+import time
+from memory_service import (
+    MEMORY_FILE, LEGACY_EMBEDDING_MODEL, get_embedding_model, get_embeddings, get_store, list_stores
+)
+from vector_store import make_key
+
+def reembed(target_model=None, source_models=None, batch_size=64, concurrency=4):
+    """
+    Re-embeds recipes from other models' vector sets into the target model's set.
+    Entries are streamed in chunks of batch_size * concurrency; each chunk is
+    committed before the next starts, so an interrupted run can simply be re-run.
+    Returns the number of recipes added.
+    """
+    target_model = target_model or get_embedding_model()
+    # Make sure code_memory.json has been imported so it can act as a source
+    if os.path.exists(MEMORY_FILE):
+        get_store(LEGACY_EMBEDDING_MODEL)
+
+    stores = list_stores()
+    target = get_store(target_model)
+    sources = [m for m in (source_models or stores.keys()) if m != target_model and m in stores]
+    if not sources:
+        print("Nothing to re-embed: no other vector sets found.")
+        return 0
+
+    # Collect recipes the target does not have yet (keys dedupe across sources)
+    todo, seen = [], set()
+    for model in sources:
+        for record in stores[model].all_records():
+            key = record.get("key") or make_key(record.get("query", ""), record.get("code", ""))
+            if key in seen or target.contains(key):
+                continue
+            seen.add(key)
+            todo.append(dict(record, key=key))
+
+    print(f"Re-embedding {len(todo)} recipes from {sources} into '{target_model}'...")
+    chunk_size = batch_size * max(1, concurrency)
+    added = 0
+    start = time.perf_counter()
+    for offset in range(0, len(todo), chunk_size):
+        chunk = todo[offset:offset + chunk_size]
+        vectors = get_embeddings([r["query"] for r in chunk], model=target_model,
+                                 batch_size=batch_size, concurrency=concurrency)
+        target.add_many(vectors, chunk, model=target_model)
+        added += len(chunk)
+        print(f"  {added}/{len(todo)} ({time.perf_counter() - start:.1f}s)")
+    return added
+
+def print_stores():
+    for model, store in list_stores().items():
+        print(f"- {model}: {len(store)} recipes, dim={store.dim}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk re-embed the code memory for a new embedding model.")
+    parser.add_argument("--model", help="Target embedding model (default: LOCAL_EMBEDDING_MODEL)")
+    parser.add_argument("--source", action="append", help="Source model(s) to read from (default: all others)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Inputs per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--list", action="store_true", help="List the vector sets on disk and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print_stores()
+    else:
+        reembed(args.model, args.source, args.batch_size, args.concurrency)
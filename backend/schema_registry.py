@@ -1,6 +1,13 @@
 import xarray as xr
 import numpy as np
 import json
+import hashlib
+import re
+from dataset_cache import open_cached_dataset
+from context_builder import (
+    PLANNER_CONTEXT_TOKENS, count_tokens, dimension_sizes, fit_lines, grouped_variable_lines,
+    memoize_context, query_terms, rank_names
+)
 
 def analyze_netcdf_schema(file_path: str) -> dict:
     """
@@ -8,47 +15,45 @@ def analyze_netcdf_schema(file_path: str) -> dict:
     It auto-detects potential vector pairs (x/y) to suggest derived variables.
     """
     try:
-        ds = xr.open_dataset(file_path)
-        
-        schema = {
-            "filename": file_path.split("/")[-1],
-            "time_horizon": _get_time_info(ds),
-            "variables": {},
-            "derived_concepts": [] # This is the "smart" part
-        }
-
-        # 1. Catalog all raw variables
-        var_names = list(ds.data_vars.keys())
-        for var_name in var_names:
-            da = ds[var_name]
-            schema["variables"][var_name] = {
-                "desc": da.attrs.get("long_name", "No description"),
-                "units": da.attrs.get("units", "N/A"),
-                "dims": list(da.dims),
-                "shape": list(da.shape)
+        with open_cached_dataset(file_path) as ds:
+            schema = {
+                "filename": file_path.split("/")[-1],
+                "time_horizon": _get_time_info(ds),
+                "variables": {},
+                "derived_concepts": [] # This is the "smart" part
             }
 
-        # 2. Auto-Detect Vector Pairs (The Logic from your user script)
-        # We look for pairs like 'hvel_x'/'hvel_y' or 'wsh_x'/'wsh_y'
-        processed_vectors = set()
+            # 1. Catalog all raw variables
+            var_names = list(ds.data_vars.keys())
+            for var_name in var_names:
+                da = ds[var_name]
+                schema["variables"][var_name] = {
+                    "desc": da.attrs.get("long_name", "No description"),
+                    "units": da.attrs.get("units", "N/A"),
+                    "dims": list(da.dims),
+                    "shape": list(da.shape)
+                }
+
+            # 2. Auto-Detect Vector Pairs (The Logic from your user script)
+            # We look for pairs like 'hvel_x'/'hvel_y' or 'wsh_x'/'wsh_y'
+            processed_vectors = set()
         
-        for var in var_names:
-            if var.endswith("_x") or var.endswith("-x"):
-                base = var[:-2] # e.g. "wsh"
-                y_variant = f"{base}_y"
+            for var in var_names:
+                if var.endswith("_x") or var.endswith("-x"):
+                    base = var[:-2] # e.g. "wsh"
+                    y_variant = f"{base}_y"
                 
-                if y_variant in var_names and base not in processed_vectors:
-                    # We found a pair! Register it as a concept.
-                    schema["derived_concepts"].append({
-                        "concept_name": f"{base}_magnitude",
-                        "components": [var, y_variant],
-                        "formula": f"np.sqrt(ds['{var}']**2 + ds['{y_variant}']**2)",
-                        "description": f"Calculated magnitude of {base} vector"
-                    })
-                    processed_vectors.add(base)
-
-        ds.close()
-        return schema
+                    if y_variant in var_names and base not in processed_vectors:
+                        # We found a pair! Register it as a concept.
+                        schema["derived_concepts"].append({
+                            "concept_name": f"{base}_magnitude",
+                            "components": [var, y_variant],
+                            "formula": f"np.sqrt(ds['{var}']**2 + ds['{y_variant}']**2)",
+                            "description": f"Calculated magnitude of {base} vector"
+                        })
+                        processed_vectors.add(base)
+
+            return schema
 
     except Exception as e:
         return {"error": f"Schema extraction failed: {str(e)}"}
@@ -66,30 +71,79 @@ def _get_time_info(ds):
             return "Time dimension present but unparseable"
     return "No time dimension"
 
-def format_context_for_planner(schemas: dict) -> str:
+def _unwrap_schema(schema):
+    # The app stores {'schema': ..., 'concepts': ...} wrappers; accept either form
+    if not schema:
+        return {}
+    return schema.get('schema', schema)
+
+def schema_fingerprint(schema, code=None) -> dict:
+    """
+    Compact identity of a schema for the code memory:
+    - hash: stable across files with the same variables / dims
+    - variables: sorted variable names
+    - used: the variables `code` actually references (if code is given)
+    """
+    schema = _unwrap_schema(schema)
+    variables = schema.get("variables", {})
+    signature = json.dumps(sorted((name, list(meta.get("dims", []))) for name, meta in variables.items()))
+    fingerprint = {
+        "hash": hashlib.sha256(signature.encode("utf-8")).hexdigest()[:16],
+        "variables": sorted(variables)
+    }
+    if code is not None:
+        fingerprint["used"] = [
+            name for name in fingerprint["variables"]
+            if re.search(r"(?<![\w-])" + re.escape(name) + r"(?![\w-])", code)
+        ]
+    return fingerprint
+
+def schema_overlap(fingerprint: dict, schema) -> float:
+    """
+    How well a recipe's schema fits the current one (0..1): the share of the
+    variables its code used that exist in `schema`, or the Jaccard overlap of
+    both variable sets when the used variables are unknown.
+    """
+    current = set(_unwrap_schema(schema).get("variables", {}))
+    if fingerprint.get("hash") == schema_fingerprint(schema)["hash"]:
+        return 1.0
+    used = set(fingerprint.get("used") or [])
+    if used:
+        return len(used & current) / len(used)
+    variables = set(fingerprint.get("variables", []))
+    if not variables and not current:
+        return 1.0
+    return len(variables & current) / len(variables | current)
+
+def format_context_for_planner(schemas: dict, query: str = "", token_budget: int = None) -> str:
     """
     Smartly formats context for 1 or 2 files.
     'schemas' is a dict: {'baseline': wrapper_dict, 'scenario': wrapper_dict (optional)}
+    Variables are ranked by relevance to `query` and admitted until `token_budget`
+    (default PLANNER_CONTEXT_TOKENS) is spent; the result is memoized per schema.
     """
-    # --- HELPER TO UNWRAP DATA ---
-    def get_real_schema(wrapper):
-        if not wrapper: return {}
-        # If the app passed the wrapper with 'schema' key, use that.
-        # Otherwise, assume it's the raw schema.
-        return wrapper.get('schema', wrapper)
-
-    base_wrapper = schemas.get('baseline')
-    scen_wrapper = schemas.get('scenario')
-    
-    base_schema = get_real_schema(base_wrapper)
-    scen_schema = get_real_schema(scen_wrapper)
-    
+    base_schema = _unwrap_schema(schemas.get('baseline'))
+    scen_schema = _unwrap_schema(schemas.get('scenario'))
+    budget = token_budget or PLANNER_CONTEXT_TOKENS
+    return memoize_context(
+        "planner", [base_schema, scen_schema], query, budget,
+        lambda: _build_planner_context(base_schema, scen_schema, query, budget)
+    )
+
+def _describe_variable(name, meta):
+    units = meta.get('units')
+    units = f" [{units}]" if units and units != "N/A" else ""
+    desc = meta.get('desc', '')
+    desc = "" if desc == "No description" else f": {desc}"
+    return f"- `{name}`{units}{desc}"
+
+def _build_planner_context(base_schema: dict, scen_schema: dict, query: str, budget: int) -> str:
     # Safety check for errors
     if "error" in base_schema:
         return f"Error reading baseline file: {base_schema['error']}"
     
     # --- HEADER GENERATION ---
-    if scen_wrapper and scen_schema:
+    if scen_schema:
         # COMPARISON MODE
         context = "### DATASET CONTEXT (COMPARISON MODE):\n"
         context += f"1. **Baseline File:** `{base_schema.get('filename', 'baseline.nc')}` (Loaded as `ds_base`)\n"
@@ -109,18 +163,33 @@ def format_context_for_planner(schemas: dict) -> str:
     # --- SHARED SCHEMA DETAILS ---
     # Safely access time_horizon
     th = base_schema.get('time_horizon', 'Unknown')
-    context += f"Time Horizon: {th}\n\n"
+    context += f"Time Horizon: {th}\n"
+
+    variables = base_schema.get("variables", {})
+    # Dimension sizes once, instead of repeating them on every variable
+    sizes = dimension_sizes(variables)
+    if sizes:
+        context += "Dimensions: " + ", ".join(f"{dim}={size}" for dim, size in sizes.items()) + "\n"
+    context += "\n"
+    budget -= count_tokens(context)
+    q_terms = query_terms(query)
     
-    # 1. Derived Concepts (Vectors)
-    if base_schema.get("derived_concepts"):
-        context += "### CALCULABLE CONCEPTS (Vectors):\n"
-        for con in base_schema["derived_concepts"]:
-            context += f"- **{con['concept_name']}**: Formula: `{con['formula']}`\n"
-        context += "\n"
-
-    # 2. Raw Variables
+    # 1. Derived Concepts (Vectors), most relevant first
+    concepts = base_schema.get("derived_concepts", [])
+    if concepts:
+        ranked = rank_names(q_terms, [(c['concept_name'], " ".join(c['components'])) for c in concepts])
+        by_name = {c['concept_name']: c for c in concepts}
+        lines, budget = fit_lines(
+            [f"- **{name}**: Formula: `{by_name[name]['formula']}`" for name in ranked],
+            budget - count_tokens("### CALCULABLE CONCEPTS (Vectors):")
+        )
+        if lines:
+            context += "### CALCULABLE CONCEPTS (Vectors):\n" + "\n".join(lines) + "\n\n"
+
+    # 2. Raw Variables, grouped by dims, most relevant first
     context += "### RAW VARIABLES:\n"
-    for name, meta in base_schema.get("variables", {}).items():
-        context += f"- `{name}` ({meta['dims']}): {meta['desc']}\n"
+    ranked = rank_names(q_terms, [(name, meta.get('desc', '')) for name, meta in variables.items()])
+    lines = grouped_variable_lines(ranked, variables, _describe_variable, budget - count_tokens("### RAW VARIABLES:"))
+    context += "\n".join(lines) + "\n"
 
     return context
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from ann_index import IVFIndex, select_top_k
+from vector_store import VectorStore
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def make_clustered_vectors(n, dim, n_clusters, rng):
+    centers = rng.standard_normal((n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.3 * rng.standard_normal((n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def test_ann_index():
+    print("Testing IVF Index...")
+    rng = np.random.default_rng(0)
+    vectors = make_clustered_vectors(20000, 64, 50, rng)
+    queries = vectors[rng.choice(len(vectors), 50, replace=False)] + 0.05 * rng.standard_normal((50, 64)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # 1. Recall@10 against exact search
+    print("\n--- Test Case 1: Recall vs Exact ---")
+    index = IVFIndex(n_probe=8)
+    index.train(vectors[:15000])
+    # 2. Incremental insertion of rows added after training
+    index.add(np.arange(15000, 20000), vectors[15000:])
+    assert index.count == 20000
+
+    for n_probe in (1, 4, 16):
+        recalls = []
+        start = time.perf_counter()
+        for q in queries:
+            approx = {row for row, _ in index.search(q, vectors, top_k=10, n_probe=n_probe)}
+            exact = {row for row, _ in select_top_k(vectors @ q, 10)}
+            recalls.append(len(approx & exact) / 10)
+        elapsed = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"n_probe={n_probe:>2}: recall@10={np.mean(recalls):.3f} ({elapsed:.2f} ms/query incl. exact)")
+    assert np.mean(recalls) > 0.9
+
+    # 3. Save / load round trip
+    print("\n--- Test Case 3: Persistence ---")
+    path = os.path.join(tempfile.mkdtemp(), "ivf.npz")
+    index.save(path, generation=3)
+    loaded, meta = IVFIndex.load(path)
+    assert meta["generation"] == 3 and loaded.count == index.count
+    assert loaded.search(queries[0], vectors, top_k=5) == index.search(queries[0], vectors, top_k=5)
+
+    # 4. Store integration: exact below the threshold, IVF above it
+    print("\n--- Test Case 4: Vector Store Integration ---")
+    store = VectorStore(tempfile.mkdtemp(), compact_threshold=0, ann_min_size=1000)
+    store.add_many(vectors[:500], [{"query": f"q{i}"} for i in range(500)])
+    assert store._current_index() is None
+    for i in range(500, 2000):
+        store.append(vectors[i], {"query": f"q{i}"})
+    store.compact()
+    assert store._index is not None and store._index.count == 2000
+    assert os.path.exists(store.index_path)
+    hit, score = store.search(vectors[1234], top_k=1)[0]
+    assert hit["query"] == "q1234" and score > 0.99
+
+    # 5. Searches never train: without a saved index they scan, and rows added
+    # after the index was saved are scanned exactly until the next rebuild
+    print("\n--- Test Case 5: Query Path ---")
+    os.remove(store.index_path)
+    reopened = VectorStore(store.directory, ann_min_size=1000)
+    hit, _ = reopened.search(vectors[1500], top_k=1)[0]
+    assert hit["query"] == "q1500" and reopened._index is None
+    assert not os.path.exists(store.index_path)
+    store._build_index()
+    assert reopened.search(vectors[1500], top_k=1)[0][0]["query"] == "q1500"
+    assert reopened._index is not None  # Picked up the saved index
+    # A writer with the index turned off leaves the saved one behind
+    VectorStore(store.directory, ann_min_size=0).add_many(
+        vectors[2000:2100], [{"query": f"q{i}"} for i in range(2000, 2100)])
+    assert reopened.search(vectors[2050], top_k=1)[0][0]["query"] == "q2050"
+    assert reopened._index.count == 2000
+    print("IVF index tests passed.")
+
+if __name__ == "__main__":
+    test_ann_index()
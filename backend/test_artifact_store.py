@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import xarray as xr
+import numpy as np
+import code_executor
+import figure_capture
+import artifact_store as artifact_store_module
+from artifact_store import ArtifactStore, is_ref
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class EvictingOs:
+    """os for artifact_store, where an eviction deletes every file right before utime() reaches it."""
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    def utime(self, path, *args):
+        if os.path.exists(path):
+            os.remove(path)
+        return os.utime(path, *args)
+
+def test_artifact_store():
+    print("Testing Artifact Store...")
+    store = ArtifactStore(tempfile.mkdtemp(), max_bytes=2500)
+
+    # 1. Content-addressed: same bytes, same reference, stored once
+    print("\n--- Test Case 1: Put / Get ---")
+    ref = store.put(b"x" * 1000)
+    assert is_ref(ref) and store.put(b"x" * 1000) == ref
+    assert store.get(ref) == b"x" * 1000
+    assert store.summary()["files"] == 1 and store.stats["dedup"] == 1
+    assert store.path("../../etc/passwd") is None and store.get("0" * 64 + ".png") is None
+
+    # 2. Least recently used artifacts go once the store is over its size
+    print("\n--- Test Case 2: Eviction ---")
+    refs = [ref]
+    for i in range(2):
+        time.sleep(0.02)
+        refs.append(store.put(bytes([i]) * 1000))
+    time.sleep(0.02)
+    store.touch(refs[0])  # Served again: now the most recent
+    store.evict()
+    print(store.summary())
+    assert store.path(refs[1]) is None
+    assert store.path(refs[0]) and store.path(refs[2])
+
+    # A file evicted between the lookup and the timestamp update is a miss, not an error
+    artifact_store_module.os = EvictingOs()
+    try:
+        assert store.touch(refs[0]) is False and store.get(refs[0]) is None
+        assert store.put(bytes([1]) * 1000) == refs[2]  # Rewritten
+    finally:
+        artifact_store_module.os = os
+    assert store.get(refs[2]) == bytes([1]) * 1000
+
+    # 3. Executed figures come back as references, not base64
+    print("\n--- Test Case 3: Execution ---")
+    nc_path = os.path.join(tempfile.mkdtemp(), "figures.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    original = figure_capture.artifact_store
+    figure_capture.artifact_store = ArtifactStore(tempfile.mkdtemp())
+    try:
+        code = "for i in range(3):\n    plt.plot([0, i])\n    plt.show()"
+        result = code_executor._execute_python_code(code, nc_path)
+        print(result["images"])
+        assert result["success"] and len(result["images"]) == 3
+        assert all(figure_capture.artifact_store.get(ref).startswith(b"\x89PNG") for ref in result["images"])
+        assert len(json.dumps(result)) < 500  # What session state / the API carry per answer
+    finally:
+        figure_capture.artifact_store = original
+    print("Artifact store tests passed.")
+
+if __name__ == "__main__":
+    test_artifact_store()
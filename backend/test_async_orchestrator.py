@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+import memory_service
+import llm_service
+import agents.planner, agents.evaluator, agents.executor, agents.synthesizer
+from llm_cache import AsyncCachedClient
+from embedding_cache import EmbeddingCache
+from orchestrator import run_orchestrator_async, run_orchestrator_stream_async
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+LLM_LATENCY = 0.2
+
+class OfflineEmbeddings:
+    """Fails fast so memory_service uses its deterministic offline vectors."""
+    def create(self, input, model):
+        raise ConnectionError("offline")
+
+class FakeAsyncCompletions:
+    """Stands in for AsyncOpenAI chat.completions: answers by agent role after a fixed delay."""
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, model, messages, stream=False, **params):
+        if stream:
+            return self._stream(model)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(LLM_LATENCY)
+        self.in_flight -= 1
+
+        system = messages[0]["content"]
+        if "Planner" in system:
+            content = '{"thought": "Average it.", "steps": ["Compute the mean temperature"]}'
+        elif "Lead Engineer" in system:
+            content = '{"approved": true, "feedback": "ok"}'
+        elif "Code Generator" in system:
+            content = "```python\nprint(float(ds['temperature'].mean()))\n```"
+        else:
+            content = "The mean temperature is shown above."
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+        })
+
+    async def _stream(self, model):
+        for word in ("The mean ", "temperature ", "is 1.0."):
+            await asyncio.sleep(LLM_LATENCY / 4)
+            yield ChatCompletionChunk.model_validate({
+                "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word}}]
+            })
+
+def test_async_orchestrator():
+    print("Testing Async Orchestrator...")
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
+
+    nc_path = os.path.join(tempfile.mkdtemp(), "async_test.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    metadata = {"baseline": {"schema": {"variables": {"temperature": {"dims": ["x", "y"], "desc": "T"}}}}}
+
+    fake = FakeAsyncCompletions()
+    fake_client = AsyncCachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+    agent_modules = (agents.planner, agents.evaluator, agents.executor, agents.synthesizer)
+    originals = [module.get_async_client for module in agent_modules]
+    for module in agent_modules:
+        module.get_async_client = lambda: fake_client
+    original_client, original_cache = memory_service.client, memory_service.embedding_cache
+    memory_service.client = SimpleNamespace(embeddings=OfflineEmbeddings())
+    memory_service.embedding_cache = EmbeddingCache(path=None)
+
+    try:
+        # 1. Many analyses share one event loop and overlap their LLM waits
+        print("\n--- Test Case 1: Concurrent Analyses ---")
+        async def run_all(n):
+            return await asyncio.gather(*[
+                run_orchestrator_async(f"Mean temperature #{i}", metadata, nc_path) for i in range(n)
+            ])
+
+        start = time.perf_counter()
+        results = asyncio.run(run_all(6))
+        elapsed = time.perf_counter() - start
+        sequential = 6 * 3 * LLM_LATENCY
+        print(f"6 analyses in {elapsed:.2f}s (sequential LLM time alone: {sequential:.1f}s), "
+              f"max {fake.max_in_flight} requests in flight")
+        assert elapsed < sequential / 2
+        # Each analysis evaluates its plan and generates code at the same time (speculation)
+        assert fake.max_in_flight == 12
+        for result in results:
+            stages = [step["stage"] for step in result["steps_log"]]
+            assert stages == ["Planning", "Evaluation", "Execution", "Learning", "Synthesis"], stages
+            assert result["steps_log"][2]["output"]["stdout"].strip().endswith("1.0")
+            assert result["response"] == "The mean temperature is 1.0."
+        assert len(memory_service.load_memory()) == 6
+
+        # 2. The answer streams: tokens arrive one by one, before the final result
+        print("\n--- Test Case 2: Streaming ---")
+        async def collect():
+            events = []
+            async for event in run_orchestrator_stream_async("Stream the mean", metadata, nc_path):
+                events.append(event)
+            return events
+        events = asyncio.run(collect())
+        kinds = [event["type"] for event in events]
+        assert kinds.count("token") == 3 and kinds[-1] == "done"
+        assert kinds.index("token") < kinds.index("done")
+        assert events[0]["step"]["stage"] == "Planning"
+    finally:
+        for module, original in zip(agent_modules, originals):
+            module.get_async_client = original
+        memory_service.client, memory_service.embedding_cache = original_client, original_cache
+
+    # 3. One pooled client per event loop
+    print("\n--- Test Case 3: Client per Loop ---")
+    async def same_client():
+        return llm_service.get_async_client() is llm_service.get_async_client()
+    assert asyncio.run(same_client())
+    print("Async orchestrator tests passed.")
+
+if __name__ == "__main__":
+    test_async_orchestrator()
@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import tempfile
+import memory_service
 from agents.planner import plan_task
 from memory_service import save_memory_entry, load_memory
 
@@ -10,9 +12,10 @@ sys.path.append(os.getcwd())
 def test_code_rag_flow():
     print("Testing Code RAG Flow...")
     
-    # Clear memory
-    if os.path.exists("backend/code_memory.json"):
-        os.remove("backend/code_memory.json")
+    # Use an empty, throwaway memory instead of the real recipe book
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
         
     # 1. Seed Memory with a "Previous Success"
     print("\n--- Step 1: Seeding Memory ---")
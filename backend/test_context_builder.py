@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import context_builder
+from context_builder import count_tokens, rank_names, query_terms
+from schema_registry import format_context_for_planner
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def make_schism_schema(n_extra=400):
+    """A SCHISM-like schema with hundreds of variables on the same few dims."""
+    node_dims, node_shape = ["time", "nSCHISM_hgrid_node"], [24, 50000]
+    variables = {
+        f"tracer_{i}": {"desc": f"Passive tracer concentration number {i}", "units": "kg/m3",
+                        "dims": node_dims, "shape": node_shape}
+        for i in range(n_extra)
+    }
+    variables["elev"] = {"desc": "Water surface elevation", "units": "m", "dims": node_dims, "shape": node_shape}
+    variables["depth"] = {"desc": "Bathymetry", "units": "m", "dims": ["nSCHISM_hgrid_node"], "shape": [50000]}
+    variables["temp"] = {"desc": "Water temperature", "units": "C", "dims": node_dims, "shape": node_shape}
+    return {"filename": "out2d_1.nc", "time_horizon": "No time dimension", "variables": variables,
+            "derived_concepts": []}
+
+def test_context_builder():
+    print("Testing Token-Budgeted Planner Context...")
+    schema = make_schism_schema()
+    bundle = {"baseline": {"schema": schema, "concepts": {}}}
+
+    # 1. Ranking by relevance to the query
+    print("\n--- Test Case 1: Relevance Ranking ---")
+    entries = [(name, meta["desc"]) for name, meta in schema["variables"].items()]
+    ranked = rank_names(query_terms("Plot the water temperature map"), entries)
+    print("Top 3:", ranked[:3])
+    assert ranked[0] == "temp"
+    assert ranked.index("elev") < ranked.index("tracer_0")  # 'water' matches its description
+
+    # 2. Budget is respected and the relevant variables make the cut
+    print("\n--- Test Case 2: Budget ---")
+    context = format_context_for_planner(bundle, query="maximum surface elevation over depth", token_budget=600)
+    print(context[:600])
+    print(f"... {count_tokens(context)} tokens")
+    assert count_tokens(context) <= 650
+    assert "`elev`" in context and "`depth`" in context
+    assert "more)" in context
+    # Dims are written once per group, not once per variable
+    assert context.count("nSCHISM_hgrid_node") <= 3
+
+    # 3. Memoized per schema + query
+    print("\n--- Test Case 3: Memoization ---")
+    context_builder._context_cache.clear()
+    start = time.perf_counter()
+    first = format_context_for_planner(bundle, query="temperature", token_budget=2000)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    second = format_context_for_planner(bundle, query="Temperature?", token_budget=2000)
+    warm = time.perf_counter() - start
+    print(f"cold {cold * 1000:.2f}ms, warm {warm * 1000:.2f}ms")
+    assert first is second
+    assert format_context_for_planner(bundle, query="elevation", token_budget=2000) is not first
+    print("Context builder tests passed.")
+
+if __name__ == "__main__":
+    test_context_builder()
@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from dataset_cache import DatasetCache
+import dataset_cache as dataset_cache_module
+import code_executor
+from schema_registry import analyze_netcdf_schema
+from profiling import generate_profile, check_compatibility
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def write_file(path, value=1.0):
+    xr.Dataset(
+        {"temperature": (("time", "node"), np.full((3, 4), value))},
+        coords={"time": np.arange(3)}
+    ).to_netcdf(path)
+
+def test_dataset_cache():
+    print("Testing Dataset Handle Cache...")
+    workdir = tempfile.mkdtemp()
+    paths = [os.path.join(workdir, f"file_{i}.nc") for i in range(3)]
+    for path in paths:
+        write_file(path)
+
+    # 1. Same file -> one handle, shallow copies per caller, refcounted
+    print("\n--- Test Case 1: Sharing ---")
+    cache = DatasetCache(max_open=2)
+    key_a, a = cache.acquire(paths[0])
+    key_b, b = cache.acquire(paths[0])
+    assert key_a == key_b and a is not b
+    a["doubled"] = a["temperature"] * 2  # Private to this caller
+    a.close()                            # Does not break the other caller
+    assert "doubled" not in b and float(b["temperature"].sum()) == 12.0
+    cache.release(key_a)
+    cache.release(key_b)
+    print(cache.summary())
+    assert cache.summary()["hits"] == 1 and cache.summary()["misses"] == 1
+
+    # 2. LRU closes idle handles only; handles in use survive
+    print("\n--- Test Case 2: LRU ---")
+    key_0, held = cache.acquire(paths[0])
+    for path in paths[1:]:
+        with cache.open(path):
+            pass
+    stats = cache.summary()
+    print(stats)
+    assert stats["open"] == 2 and stats["in_use"] == 1 and stats["evictions"] == 1
+    assert float(held["temperature"].sum()) == 12.0
+    cache.release(key_0)
+
+    # 3. A rewritten file gets a fresh handle
+    print("\n--- Test Case 3: File Changed ---")
+    with cache.open(paths[0]) as ds:
+        assert float(ds["temperature"].sum()) == 12.0
+    time.sleep(0.01)
+    write_file(paths[0] + ".new", value=2.0)  # e.g. a re-upload replacing the file
+    os.replace(paths[0] + ".new", paths[0])
+    with cache.open(paths[0]) as ds:
+        assert float(ds["temperature"].sum()) == 24.0
+    cache.clear()
+    assert cache.summary()["open"] == 0
+
+    # 4. Executions, retries, schema extraction and profiling reuse one handle
+    print("\n--- Test Case 4: Call Sites ---")
+    shared = DatasetCache()
+    original = dataset_cache_module.dataset_cache
+    for module in (dataset_cache_module, code_executor, sys.modules["profiling"]):
+        module.dataset_cache = shared
+    try:
+        analyze_netcdf_schema(paths[1])  # via open_cached_dataset
+        generate_profile(paths[1])
+        assert check_compatibility(paths[1], paths[2])[0]
+        code = "ds2 = xr.open_dataset(netcdf_path)\nprint(float(ds2['temperature'].mean()))"
+        for _ in range(3):  # Generated code reopening the file is served from the cache too
+            result = code_executor._execute_python_code(code, paths[1])
+            assert result["success"] and result["stdout"].strip() == "1.0", result
+        stats = shared.summary()
+        print(stats)
+        assert stats["misses"] == 2 and stats["in_use"] == 0
+        assert stats["hits"] == 2 + 3 * 2
+    finally:
+        for module in (dataset_cache_module, code_executor, sys.modules["profiling"]):
+            module.dataset_cache = original
+        shared.clear()
+
+    # 5. Opening happens outside the cache lock: other files don't wait, the same file opens once
+    print("\n--- Test Case 5: Concurrent Opens ---")
+    opened = []
+    def slow_open(path, **kwargs):
+        opened.append(path)
+        time.sleep(0.5)
+        return xr.open_dataset(path, **kwargs)
+    cache = DatasetCache()
+    dataset_cache_module.xr = SimpleNamespace(open_dataset=slow_open)
+    try:
+        def acquire(path):
+            key, ds = cache.acquire(path)
+            assert float(ds["temperature"].sum()) > 0
+            cache.release(key)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=acquire, args=(path,)) for path in (paths[1], paths[2], paths[2])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        dataset_cache_module.xr = xr
+    print(f"3 acquires of 2 files in {elapsed:.2f}s, {cache.summary()}")
+    assert elapsed < 0.9 and sorted(opened) == sorted(paths[1:])
+    assert cache.summary()["misses"] == 2 and cache.summary()["hits"] == 1
+    broken = os.path.join(workdir, "broken.nc")
+    with open(broken, "w") as f:
+        f.write("not netcdf")
+    for _ in range(2):  # Fails again instead of waiting on a dead entry
+        try:
+            cache.acquire(broken)
+            assert False, "expected an error"
+        except (OSError, ValueError) as e:
+            print(f"Broken file: {type(e).__name__}")
+    assert cache.summary()["open"] == 2  # A failed open leaves no entry behind
+
+    # 6. Coordinates and the SCHISM mesh are read once and shared by every caller
+    print("\n--- Test Case 6: Shared Coordinates ---")
+    mesh_path = os.path.join(workdir, "mesh.nc")
+    xr.Dataset(
+        {"SCHISM_hgrid_node_x": (("node",), np.arange(4.0)), "elev": (("time", "node"), np.ones((3, 4)))},
+        coords={"time": np.arange(3), "lon": (("node",), np.arange(4.0))}
+    ).to_netcdf(mesh_path)
+    key, ds = cache.acquire(mesh_path)
+    shared = [name for name in ("lon", "SCHISM_hgrid_node_x", "elev") if ds.variables[name]._in_memory]
+    print(f"In memory: {shared}")
+    assert shared == ["lon", "SCHISM_hgrid_node_x"]  # The data itself stays lazy
+    cache.release(key)
+    cache.clear()
+    print("Dataset cache tests passed.")
+
+if __name__ == "__main__":
+    test_dataset_cache()
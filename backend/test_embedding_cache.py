@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+from embedding_cache import EmbeddingCache
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def test_embedding_cache():
+    print("Testing Embedding Cache...")
+    db_path = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite")
+
+    # 1. Miss, then memory hit (whitespace-normalised key)
+    print("\n--- Test Case 1: Memory Tier ---")
+    cache = EmbeddingCache(db_path, max_items=2)
+    assert cache.get("model-a", "Plot the elevation") is None
+    cache.put("model-a", "Plot the elevation", [0.5, 0.25, 1.0])
+    assert cache.get("model-a", "  Plot   the elevation ") == [0.5, 0.25, 1.0]
+    print("Stats:", cache.stats)
+    assert cache.stats["memory_hits"] == 1 and cache.stats["misses"] == 1
+
+    # 2. Keys include the embedding model
+    print("\n--- Test Case 2: Model Isolation ---")
+    assert cache.get("model-b", "Plot the elevation") is None
+
+    # 3. LRU eviction falls back to the disk tier
+    print("\n--- Test Case 3: LRU Eviction ---")
+    cache.put("model-a", "q2", [2.0])
+    cache.put("model-a", "q3", [3.0])
+    assert cache.get("model-a", "Plot the elevation") == [0.5, 0.25, 1.0]
+    assert cache.stats["disk_hits"] == 1
+
+    # 4. Disk tier survives a restart (new process / worker)
+    print("\n--- Test Case 4: Persistence ---")
+    reopened = EmbeddingCache(db_path)
+    assert reopened.get("model-a", "q3") == [3.0]
+    assert reopened.stats["disk_hits"] == 1
+
+    # 5. Memory-only mode
+    memory_only = EmbeddingCache(path=None)
+    memory_only.put("m", "x", [1.0])
+    assert memory_only.get("m", "x") == [1.0]
+    print("Embedding cache tests passed.")
+
+if __name__ == "__main__":
+    test_embedding_cache()
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from openai.types.chat import ChatCompletion
+import agents.executor as executor
+import worker_pool
+from llm_cache import CachedClient
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class FixingCompletions:
+    """First answer is `program`; fix requests get `fixed`. Keeps the fix prompts."""
+    def __init__(self, program, fixed="print('fixed')"):
+        self.program = program
+        self.fixed = fixed
+        self.fix_prompts = []
+
+    def create(self, model, messages, **params):
+        if len(messages) > 2:
+            self.fix_prompts.append(messages[-1]["content"])
+            content = self.fixed
+        else:
+            content = self.program
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+        })
+
+def test_execution_limits():
+    print("Testing Execution Limits and Cancellation...")
+    nc_path = os.path.join(tempfile.mkdtemp(), "limits.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+
+    original_limits = worker_pool.EXEC_CPU_LIMIT, worker_pool.EXEC_MEMORY_LIMIT_MB
+    worker_pool.EXEC_CPU_LIMIT, worker_pool.EXEC_MEMORY_LIMIT_MB = 1, 256  # Sent to the workers when they start
+    pool = worker_pool.WorkerPool(size=1)
+    original_pool, worker_pool._pool = worker_pool._pool, pool
+    original_client = executor.client
+    try:
+        pool.wait_ready()
+
+        # 1. Wall clock: the worker is killed and replaced
+        print("\n--- Test Case 1: Timeout ---")
+        start = time.perf_counter()
+        result = pool.run("import time\ntime.sleep(30)", nc_path, timeout=0.5)
+        print(f"{time.perf_counter() - start:.2f}s: {result['stderr']}")
+        assert result["limit"] == "time" and time.perf_counter() - start < 5
+
+        # 2. CPU time: a busy loop is interrupted, even under `except Exception`
+        print("\n--- Test Case 2: CPU ---")
+        result = pool.run("while True:\n    try:\n        sum(range(10000))\n    except Exception:\n        pass",
+                          nc_path, timeout=20)
+        print(result["stderr"])
+        assert result["limit"] == "cpu"
+
+        # 3. Memory: the allocation fails inside the worker, which keeps serving
+        print("\n--- Test Case 3: Memory ---")
+        result = pool.run("big = np.ones((1024, 1024, 1024))\nprint(big.sum())", nc_path)
+        print(result["stderr"])
+        assert result["limit"] == "memory" and "chunk" in result["stderr"]
+        assert pool.run("print(float(ds['temperature'].mean()))", nc_path)["stdout"].strip() == "1.0"
+        stats = pool.summary()
+        print(stats)
+        assert stats["timed_out"] == 1 and stats["limited"] == 2 and stats["crashed"] == 0
+
+        # 4. The limit hint reaches the fixer prompt
+        print("\n--- Test Case 4: Fixer Hint ---")
+        fake = FixingCompletions("big = np.ones((1024, 1024, 1024))")
+        executor.client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+        result = executor.generate_and_execute_code("Load everything", {"steps": ["Load"]}, nc_path)
+        assert result["success"] and result["stdout"].strip() == "fixed"
+        assert "use chunking" in fake.fix_prompts[0]
+
+        # 5. Cancelling stops the running code
+        print("\n--- Test Case 5: Cancel ---")
+        fake = FixingCompletions("import time\ntime.sleep(30)")
+        executor.client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+        cancel = threading.Event()
+        threading.Timer(0.3, cancel.set).start()
+        start = time.perf_counter()
+        result = executor.generate_and_execute_code("Wait", {"steps": ["Wait"]}, nc_path, cancel_event=cancel)
+        print(f"Cancelled after {time.perf_counter() - start:.2f}s")
+        assert result.get("cancelled") and not fake.fix_prompts
+        assert time.perf_counter() - start < 5
+    finally:
+        executor.client = original_client
+        worker_pool.EXEC_CPU_LIMIT, worker_pool.EXEC_MEMORY_LIMIT_MB = original_limits
+        worker_pool._pool = original_pool
+        pool.shutdown()
+    print("Execution limit tests passed.")
+
+if __name__ == "__main__":
+    test_execution_limits()
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+import threading
+import numpy as np
+import matplotlib.image as mpimg
+import matplotlib.pyplot as plt
+import code_executor
+from artifact_store import artifact_store
+from test_mesh import schism_like_file
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+COLORS = ["#ff0000", "#00ff00", "#0000ff", "#ffff00", "#ff00ff", "#00ffff"]
+
+# Several figures per run, with pauses so the threads interleave their pyplot calls
+PROGRAM = """
+import sys
+import time
+import matplotlib.pyplot as pyplot
+from matplotlib import pyplot as p2
+for k in range(2):
+    fig = pyplot.figure(figsize=(2, 2))
+    time.sleep(0.01)
+    ds["elev"].isel(time=0).plot()  # xarray draws through pyplot.gca()
+    pyplot.title("run {run}")
+    fig.patch.set_facecolor("{color}")
+    time.sleep(0.01)
+    sys.stdout.write("run {run} figure " + str(k) + "\\n")  # Not the local print: goes through sys.stdout
+    p2.show() if k else plt.savefig("run{run}.png")
+"""
+
+def corner_color(ref):
+    image = mpimg.imread(artifact_store.path(ref))
+    return tuple(np.round(image[2, 2, :3], 2))
+
+def drawn_fraction(ref):
+    """Share of pixels that are not background white (a blank figure has 0)."""
+    image = mpimg.imread(artifact_store.path(ref))[..., :3]
+    return float(np.mean(np.any(image < 0.9, axis=-1)))
+
+def test_figure_capture():
+    print("Testing Per-Execution Figure Capture...")
+    nc_path = os.path.join(tempfile.mkdtemp(), "figures.nc")
+    schism_like_file(nc_path, nx=20, ny=10)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(nc_path))
+    try:
+        # 1. Concurrent in-process executions keep their figures and output apart
+        print("\n--- Test Case 1: Concurrent Attribution ---")
+        results = [None] * len(COLORS)
+        def run(i):
+            results[i] = code_executor._execute_python_code(PROGRAM.format(run=i, color=COLORS[i]), nc_path)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(COLORS))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i, result in enumerate(results):
+            expected = tuple(int(COLORS[i][k:k + 2], 16) / 255 for k in (1, 3, 5))
+            print(f"run {i}: {len(result['images'])} images, stdout {result['stdout'].split()}")
+            assert result["success"], result["stderr"]
+            assert len(result["images"]) == 2
+            assert all(corner_color(ref) == expected for ref in result["images"])
+            assert result["stdout"].count(f"run {i} figure") == 2 and "run" not in result["stdout"].replace(f"run {i}", "")
+        # Nothing leaked into pyplot's own state, nothing written to disk
+        assert plt.get_fignums() == [] and not os.path.exists("run0.png")
+
+        # 2. pyplot-style calls: colorbar of the current image, subplots, savefig then show
+        print("\n--- Test Case 2: pyplot API ---")
+        result = code_executor._execute_python_code(
+            "fig, (a, b) = plt.subplots(1, 2, figsize=(4, 2))\n"
+            "plt.sca(a)\nplt.tripcolor(ds.SCHISM_hgrid_node_x.values, ds.SCHISM_hgrid_node_y.values, ds.depth.values)\n"
+            "plt.colorbar()\nplt.xlim(0, 5)\nplt.xticks(rotation=45)\nprint([float(v) for v in plt.xlim()], plt.get_fignums())\n"
+            "plt.savefig('x.png', bbox_inches='tight')\nplt.show()", nc_path)
+        print(result["stdout"].strip(), result["stderr"])
+        assert result["success"] and len(result["images"]) == 1  # show() after savefig adds no blank figure
+        assert "[0.0, 5.0] [1]" in result["stdout"]
+
+        # 3. plot_unstructured draws through the run's capture too
+        print("\n--- Test Case 3: plot_unstructured ---")
+        result = code_executor._execute_python_code(
+            "buf = plot_unstructured(ds.depth, ds.SCHISM_hgrid_node_x, ds.SCHISM_hgrid_node_y)\n"
+            "print(len(buf.getvalue()) > 0)", nc_path)
+        print(result["stdout"].strip(), result["images"])
+        assert result["success"] and len(result["images"]) == 1 and "True" in result["stdout"]
+        assert plt.get_fignums() == []
+
+        # 4. Plots made by xarray / pandas (and any pyplot function) land in the run's capture
+        print("\n--- Test Case 4: xarray / pandas plotting ---")
+        programs = {
+            "ds.plot + show": "ds['elev'].plot()\nplt.show()",
+            "isel.plot + savefig": "ds['elev'].isel(time=0).plot()\nplt.savefig('x.png')",
+            "2D ds.plot + show": "ds['elev'].plot(x='nSCHISM_hgrid_node')\nplt.show()",
+            "pandas + show": "import pandas as pd\npd.DataFrame({'a': [1, 3, 2]}).plot()\nplt.show()",
+            "matshow + subplot2grid": "plt.matshow(np.eye(5))\nplt.subplot2grid((2, 2), (0, 0)).plot([0, 1])\nplt.show()",
+        }
+        for name, code in programs.items():
+            result = code_executor._execute_python_code(code, nc_path)
+            fractions = [round(drawn_fraction(ref), 3) for ref in result["images"]]
+            print(f"{name}: {fractions} {result['stderr']}")
+            assert result["success"], result["stderr"]
+            assert result["images"] and all(f > 0.01 for f in fractions)
+        assert plt.get_fignums() == []
+
+        # 5. Outside an execution pyplot is untouched
+        print("\n--- Test Case 5: Other Threads ---")
+        fig = plt.figure()
+        assert plt.get_fignums() == [fig.number] and plt.gcf() is fig
+        plt.close(fig)
+    finally:
+        os.chdir(cwd)
+
+    print("\nFigure Capture Tests Completed Successfully!")
+
+if __name__ == "__main__":
+    test_figure_capture()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import tempfile
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from llm_cache import ResponseCache, CachedClient
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class FakeCompletions:
+    """Stands in for client.chat.completions: echoes the last message, counts calls."""
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, messages, stream=False, **params):
+        self.calls += 1
+        time.sleep(0.01)
+        if stream:
+            return (ChatCompletionChunk.model_validate({
+                "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}}]
+            }) for piece in ("echo: ", messages[-1]["content"]))
+        return ChatCompletion.model_validate({
+            "id": f"call-{self.calls}", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"echo: {messages[-1]['content']}"}}]
+        })
+
+def test_llm_cache():
+    print("Testing LLM Response Cache...")
+    db_path = os.path.join(tempfile.mkdtemp(), "llm_responses.sqlite")
+    fake = FakeCompletions()
+    raw = SimpleNamespace(chat=SimpleNamespace(completions=fake), base_url="http://fake/v1")
+    client = CachedClient(raw, ResponseCache(db_path))
+    messages = [{"role": "user", "content": "Plot the elevation"}]
+
+    # 1. Miss, then hit with an identical response object
+    print("\n--- Test Case 1: Hit / Miss ---")
+    first = client.chat.completions.create(model="m", messages=messages)
+    second = client.chat.completions.create(model="m", messages=messages)
+    assert fake.calls == 1
+    assert second.choices[0].message.content == first.choices[0].message.content == "echo: Plot the elevation"
+    stats = client.cache.summary()
+    print("Stats:", stats)
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["saved_seconds"] > 0
+
+    # 2. Model and sampling params are part of the key; stream / cache=False bypass it
+    print("\n--- Test Case 2: Key & Bypass ---")
+    client.chat.completions.create(model="m", messages=messages, temperature=0.2)
+    client.chat.completions.create(model="other", messages=messages)
+    client.chat.completions.create(model="m", messages=messages, cache=False)
+    assert fake.calls == 4
+    assert client.base_url == "http://fake/v1"  # Other attributes pass through
+
+    # 3. Shared across processes via the file; invalidate() forgets one answer
+    print("\n--- Test Case 3: Persistence & Invalidate ---")
+    other_worker = CachedClient(raw, ResponseCache(db_path))
+    other_worker.chat.completions.create(model="m", messages=messages)
+    assert fake.calls == 4
+    other_worker.chat.completions.invalidate(model="m", messages=messages)
+    client.chat.completions.create(model="m", messages=messages)
+    assert fake.calls == 5
+
+    # 4. TTL expiry and size cap
+    print("\n--- Test Case 4: TTL & Eviction ---")
+    capped = ResponseCache(db_path, max_entries=2)
+    capped.purge()
+    assert len(capped) == 2
+    expired = CachedClient(raw, ResponseCache(db_path, ttl=1e-9))
+    expired.chat.completions.create(model="m", messages=messages)
+    assert fake.calls == 6
+
+    # 5. Streaming yields chunks, then shares the cache entry with create()
+    print("\n--- Test Case 5: Streaming ---")
+    stream_messages = [{"role": "user", "content": "Stream me"}]
+    chunks = list(client.chat.completions.stream_text(model="m", messages=stream_messages))
+    assert chunks == ["echo: ", "Stream me"] and fake.calls == 7
+    assert client.chat.completions.create(model="m", messages=stream_messages).choices[0].message.content == "echo: Stream me"
+    assert list(client.chat.completions.stream_text(model="m", messages=stream_messages)) == ["echo: Stream me"]
+    assert fake.calls == 7
+    print("LLM cache tests passed.")
+
+if __name__ == "__main__":
+    test_llm_cache()
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from llm_scheduler import (
+    LLMScheduler, ScheduledClient, AsyncScheduledClient, SchedulerBusy,
+    PRIORITY_INTERACTIVE, PRIORITY_AGENT, PRIORITY_BACKGROUND
+)
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class SlowCompletions:
+    """Stands in for chat.completions: records how many calls overlap."""
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def create(self, model, messages, stream=False, **params):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return iter(["a", "b"]) if stream else messages[-1]["content"]
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+def test_llm_scheduler():
+    print("Testing LLM Scheduler...")
+
+    # 1. No more than max_in_flight requests reach the provider
+    print("\n--- Test Case 1: Max In Flight ---")
+    fake = SlowCompletions()
+    raw = SimpleNamespace(chat=SimpleNamespace(completions=fake), embeddings=SimpleNamespace(create=None))
+    client = ScheduledClient(raw, LLMScheduler(2))
+    threads = [threading.Thread(target=client.chat.completions.create,
+                                kwargs={"model": "m", "messages": [{"role": "user", "content": str(i)}]})
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(client.scheduler.summary())
+    assert fake.max_in_flight == 2
+    assert client.scheduler.summary()["completed"] == 8
+
+    # 2. Waiters are served by priority, then arrival
+    print("\n--- Test Case 2: Priority Order ---")
+    scheduler = LLMScheduler(1)
+    scheduler.acquire()
+    served = []
+    def request(name, priority):
+        scheduler.acquire(priority)
+        served.append(name)
+        scheduler.release()
+    order = [("background", PRIORITY_BACKGROUND), ("agent-1", PRIORITY_AGENT),
+             ("interactive", PRIORITY_INTERACTIVE), ("agent-2", PRIORITY_AGENT)]
+    threads = []
+    for i, (name, priority) in enumerate(order):
+        threads.append(threading.Thread(target=request, args=(name, priority)))
+        threads[-1].start()
+        wait_for(lambda: scheduler.summary()["queued"] == i + 1)
+    scheduler.release()
+    for t in threads:
+        t.join()
+    print(served)
+    assert served == ["interactive", "agent-1", "agent-2", "background"]
+
+    # 3. Backpressure: a full queue rejects equal/lower priority work and sheds for higher
+    print("\n--- Test Case 3: Backpressure ---")
+    scheduler = LLMScheduler(1, max_queue=2)
+    scheduler.acquire()
+    outcomes = {}
+    def queued(name, priority):
+        try:
+            scheduler.acquire(priority)
+            outcomes[name] = "served"
+            scheduler.release()
+        except SchedulerBusy:
+            outcomes[name] = "shed"
+    threads = [threading.Thread(target=queued, args=("background", PRIORITY_BACKGROUND)),
+               threading.Thread(target=queued, args=("agent", PRIORITY_AGENT))]
+    for i, t in enumerate(threads):
+        t.start()
+        wait_for(lambda: scheduler.summary()["queued"] == i + 1)
+    try:
+        scheduler.acquire(PRIORITY_BACKGROUND)
+        assert False, "Expected SchedulerBusy"
+    except SchedulerBusy as e:
+        print(f"Rejected: {e}")
+    threads.append(threading.Thread(target=queued, args=("interactive", PRIORITY_INTERACTIVE)))
+    threads[-1].start()
+    wait_for(lambda: "background" in outcomes)
+    scheduler.release()
+    for t in threads:
+        t.join()
+    print(outcomes, scheduler.summary())
+    assert outcomes == {"background": "shed", "agent": "served", "interactive": "served"}
+    assert scheduler.summary()["rejected"] == 2
+
+    # 4. Async: cancelled waiters and streams never leak slots
+    print("\n--- Test Case 4: Async ---")
+    scheduler = LLMScheduler(1)
+
+    async def scenario():
+        await scheduler.acquire_async()
+        waiting = asyncio.ensure_future(scheduler.acquire_async(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        scheduler.release()
+
+        class Streaming:
+            async def create(self, stream=False, **kwargs):
+                async def chunks():
+                    for piece in ("a", "b"):
+                        yield piece
+                return chunks()
+        client = AsyncScheduledClient(SimpleNamespace(chat=SimpleNamespace(completions=Streaming()),
+                                                      embeddings=Streaming()), scheduler)
+        stream = await client.chat.completions.create(model="m", stream=True, priority=PRIORITY_INTERACTIVE)
+        assert scheduler.summary()["in_flight"] == 1  # Held while the stream is open
+        assert [piece async for piece in stream] == ["a", "b"]
+
+    asyncio.run(scenario())
+    stats = scheduler.summary()
+    print(stats)
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+    assert stats["wait_ms_p95"] >= 0
+    print("LLM scheduler tests passed.")
+
+if __name__ == "__main__":
+    test_llm_scheduler()
@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import tempfile
+import memory_service
 from memory_service import save_memory_entry, find_similar_code, load_memory
 
 # Add current directory to path
@@ -9,9 +11,10 @@ sys.path.append(os.getcwd())
 def test_memory_service():
     print("Testing Memory Service...")
     
-    # Clear memory file for testing
-    if os.path.exists("backend/code_memory.json"):
-        os.remove("backend/code_memory.json")
+    # Use an empty, throwaway memory instead of the real recipe book
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
     
     # 1. Test Saving
     print("\n--- Test Case 1: Saving Memory ---")
@@ -47,5 +50,39 @@ def test_memory_service():
     else:
         print("No match found (Might be due to mock embeddings or low threshold).")
 
+    # 4. Test Schema-Aware Retrieval
+    print("\n--- Test Case 4: Retrieval (Schema Fingerprint) ---")
+    def make_schema(*names):
+        return {"schema": {"variables": {n: {"dims": ["time", "nSCHISM_hgrid_node"]} for n in names}}}
+    elev_file, zeta_file = make_schema("elev", "depth"), make_schema("zeta", "depth")
+    query = "Plot the water level at the first node"
+    save_memory_entry(query, "ds['elev'].isel(nSCHISM_hgrid_node=0).plot()", plan, schema=elev_file)
+    save_memory_entry(query, "ds['zeta'].isel(nSCHISM_hgrid_node=0).plot()", plan, schema=zeta_file)
+
+    match = find_similar_code(query, schema=zeta_file)
+    print(f"Recipe for zeta file: {match['code']}")
+    assert "zeta" in match["code"] and match["schema"]["used"] == ["zeta"]
+    assert "elev" in find_similar_code(query, schema=elev_file)["code"]
+    # No compatible recipe at all -> nothing is injected
+    assert find_similar_code(query, schema=make_schema("hvel_x", "hvel_y")) is None
+
+    # Pruning merges near-duplicates of the same schema only: both recipes survive
+    stats = memory_service.get_store().prune(threshold=0.9)
+    print(f"Prune: {stats}")
+    assert stats["merged"] == 0
+    assert "zeta" in find_similar_code(query, schema=zeta_file)["code"]
+    assert "elev" in find_similar_code(query, schema=elev_file)["code"]
+
+    # 5. Lookups don't count as use; only the recipe that gets used does, once
+    print("\n--- Test Case 5: Hit Counting ---")
+    store = memory_service.get_store()
+    before = sum(stats["hits"] for stats in store.usage().values())
+    recipe = find_similar_code(query, schema=zeta_file)
+    assert memory_service.find_replayable_recipe(query, zeta_file, threshold=0.5)
+    assert sum(stats["hits"] for stats in store.usage().values()) == before
+    memory_service.record_recipe_use(recipe)
+    print(f"Usage: {store.usage().get(recipe['key'])}")
+    assert store.usage()[recipe["key"]]["hits"] == 1
+
 if __name__ == "__main__":
     test_memory_service()
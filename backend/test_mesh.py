@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import tempfile
+import xarray as xr
+import numpy as np
+import code_executor
+import mesh
+from mesh import faces_to_triangles, mesh_triangulation, TriangulationCache
+from profiling import generate_profile
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def schism_like_file(path, nx=60, ny=40, hole=True):
+    """Quad mesh on a nx x ny node grid (1-based, -999 filled 4th node for triangles), with a notch cut out."""
+    gx, gy = np.meshgrid(np.arange(nx, dtype=float), np.arange(ny, dtype=float))
+    node = lambda i, j: j * nx + i + 1
+    faces = []
+    for j in range(ny - 1):
+        for i in range(nx - 1):
+            if hole and i > nx // 3 and j < ny // 2:
+                continue  # Concave coastline: a bay Delaunay would fill in
+            if (i + j) % 7 == 0:  # Some elements are triangles
+                faces.append([node(i, j), node(i + 1, j), node(i + 1, j + 1), -999])
+                faces.append([node(i, j), node(i + 1, j + 1), node(i, j + 1), -999])
+            else:
+                faces.append([node(i, j), node(i + 1, j), node(i + 1, j + 1), node(i, j + 1)])
+    faces = np.array(faces, dtype=np.int32)
+    ds = xr.Dataset({
+        "SCHISM_hgrid_node_x": (("nSCHISM_hgrid_node",), gx.ravel()),
+        "SCHISM_hgrid_node_y": (("nSCHISM_hgrid_node",), gy.ravel()),
+        "SCHISM_hgrid_face_nodes": (("nSCHISM_hgrid_face", "nMaxSCHISM_hgrid_face_nodes"), faces,
+                                    {"start_index": 1}),
+        "depth": (("nSCHISM_hgrid_node",), gx.ravel() + gy.ravel()),
+        "elev": (("time", "nSCHISM_hgrid_node"), np.random.rand(2, nx * ny)),
+    })
+    ds.to_netcdf(path, encoding={"SCHISM_hgrid_face_nodes": {"_FillValue": -999}})
+    return faces
+
+def test_mesh():
+    print("Testing Cached Mesh Triangulation...")
+
+    # 1. Quads are split, fill values masked, 1-based indices detected
+    print("\n--- Test Case 1: Connectivity ---")
+    faces = np.array([[1, 2, 3, np.nan], [2, 4, 5, 3]])
+    triangles = faces_to_triangles(faces, n_nodes=5)
+    print(triangles.tolist())
+    assert triangles.tolist() == [[0, 1, 2], [1, 3, 4], [1, 4, 2]]
+
+    # 2. The file's mesh, not Delaunay: the bay stays open
+    print("\n--- Test Case 2: Concave Mesh ---")
+    path = os.path.join(tempfile.mkdtemp(), "mesh.nc")
+    faces = schism_like_file(path)
+    ds = xr.open_dataset(path)
+    cache = TriangulationCache()
+    original_cache, mesh.triangulation_cache = mesh.triangulation_cache, cache
+    try:
+        x, y = ds["SCHISM_hgrid_node_x"].values, ds["SCHISM_hgrid_node_y"].values
+        triangulation = mesh_triangulation(x, y, ds=ds)
+        expected = int((faces[:, 3] != -999).sum() + len(faces))
+        delaunay = mesh.tri.Triangulation(x, y)
+        print(f"{len(triangulation.triangles)} triangles from the file, {len(delaunay.triangles)} from Delaunay")
+        assert len(triangulation.triangles) == expected < len(delaunay.triangles)
+        assert mesh_triangulation(x, y, ds=ds) is triangulation
+        assert mesh_triangulation(x[:10], y[:10], ds=ds) is None  # Not this mesh
+
+        # 3. Maps, difference plots and the profile preview share one triangulation
+        print("\n--- Test Case 3: Reuse ---")
+        code = ("plot_unstructured(ds['elev'][-1], ds['SCHISM_hgrid_node_x'], ds['SCHISM_hgrid_node_y'])\n"
+                "plot_unstructured(ds['elev'][1] - ds['elev'][0], ds['SCHISM_hgrid_node_x'], "
+                "ds['SCHISM_hgrid_node_y'], title='Difference')")
+        start = time.perf_counter()
+        result = code_executor._execute_python_code(code, path)
+        print(f"2 plots in {time.perf_counter() - start:.2f}s; {result['stderr']}")
+        assert result["success"]
+        profile = generate_profile(path)
+        assert "preview_image" in profile, profile.get("preview_error")
+        stats = cache.summary()
+        print(stats)
+        assert stats["meshes"] == 1 and stats["triangulations"] == 1 and stats["hits"] >= 3
+    finally:
+        mesh.triangulation_cache = original_cache
+        ds.close()
+    print("Mesh triangulation tests passed.")
+
+if __name__ == "__main__":
+    test_mesh()
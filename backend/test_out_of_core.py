@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import tempfile
+import xarray as xr
+import numpy as np
+import worker_pool
+import out_of_core
+import code_executor
+from dataset_cache import dataset_cache
+from out_of_core import choose_chunks
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+SCHISM_DIMS = ("time", "nSCHISM_hgrid_node", "nSCHISM_vgrid_layers")
+MB = 1024 * 1024
+
+def test_out_of_core():
+    print("Testing Out-of-Core Loading...")
+
+    # 1. Chunks: time steps first, then nodes; layers stay whole
+    print("\n--- Test Case 1: Chunk Choice ---")
+    shape = (24, 200000, 20)  # float32: 16 MB per time step
+    ds = xr.Dataset({
+        "temp": (SCHISM_DIMS, np.broadcast_to(np.float32(0), shape)),
+        "depth": (("nSCHISM_hgrid_node",), np.zeros(200000)),
+    })
+    print(choose_chunks(ds, 64 * MB), choose_chunks(ds, 8 * MB))
+    assert choose_chunks(ds, 64 * MB) == {"time": 4}
+    assert choose_chunks(ds, 8 * MB) == {"time": 1, "nSCHISM_hgrid_node": 104857}
+    assert choose_chunks(ds, 1024 * MB) == {}
+
+    # 2. A file bigger than the memory budget: eager fails, out-of-core streams through it
+    print("\n--- Test Case 2: Bounded Memory ---")
+    path = os.path.join(tempfile.mkdtemp(), "big.nc")
+    xr.Dataset({"temp": (SCHISM_DIMS, np.random.rand(40, 100000, 5))}).to_netcdf(path)  # 160 MB
+    code = "print(float(ds['temp'].max()))"
+    original = worker_pool.EXEC_MEMORY_LIMIT_MB, out_of_core.OUT_OF_CORE
+    worker_pool.EXEC_MEMORY_LIMIT_MB = 100  # Sent to the workers when they start
+    try:
+        results = {}
+        for mode in ("0", "auto"):
+            out_of_core.OUT_OF_CORE = mode
+            pool = worker_pool.WorkerPool(size=1)
+            try:
+                pool.wait_ready()
+                start = time.perf_counter()
+                results[mode] = pool.run(code, path)
+                print(f"OUT_OF_CORE={mode}: {time.perf_counter() - start:.2f}s, success={results[mode]['success']}")
+            finally:
+                pool.shutdown()
+        assert results["0"]["limit"] == "memory"
+        assert results["auto"]["success"] and "out-of-core" in results["auto"]["stdout"]
+        assert 0.99 < float(results["auto"]["stdout"].split()[-1]) <= 1.0
+
+        # 3. A file going out-of-core is opened once, chunked (no plain handle in the cache)
+        print("\n--- Test Case 3: Single Open ---")
+        out_of_core.OUT_OF_CORE = "1"
+        misses = dataset_cache.summary()["misses"]
+        result = code_executor._execute_python_code(code, path)
+        keys = [key for key in dataset_cache._entries if key[0] == os.path.realpath(path)]
+        print(f"{result['stdout'].strip()!r}, cached: {[key[3] for key in keys]}")
+        assert result["success"] and "out-of-core" in result["stdout"]
+        assert dataset_cache.summary()["misses"] == misses + 1
+        assert len(keys) == 1 and keys[0][3] is not None
+    finally:
+        worker_pool.EXEC_MEMORY_LIMIT_MB, out_of_core.OUT_OF_CORE = original
+    print("Out-of-core tests passed.")
+
+if __name__ == "__main__":
+    test_out_of_core()
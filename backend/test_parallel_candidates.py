@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from openai.types.chat import ChatCompletion
+import agents.executor as executor
+import worker_pool
+from llm_cache import CachedClient, AsyncCachedClient
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def completion(model, contents):
+    return ChatCompletion.model_validate({
+        "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                    for i, content in enumerate(contents)]
+    })
+
+class CandidateCompletions:
+    """Hands out the next program from `programs` per call; fix requests get `fixed`."""
+    def __init__(self, programs, fixed="print('fixed')"):
+        self.programs = programs
+        self.fixed = fixed
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def next_content(self, messages):
+        with self.lock:
+            self.calls += 1
+            if len(messages) > 2:
+                return self.fixed
+            return self.programs[(self.calls - 1) % len(self.programs)]
+
+    def create(self, model, messages, n=1, **params):
+        time.sleep(0.05)
+        return completion(model, [self.next_content(messages)])
+
+class AsyncCandidateCompletions(CandidateCompletions):
+    async def create(self, model, messages, n=1, **params):
+        await asyncio.sleep(0.05)
+        return completion(model, [self.next_content(messages)])
+
+def test_parallel_candidates():
+    print("Testing Parallel Candidate Code Generation...")
+    workdir = tempfile.mkdtemp()
+    nc_path = os.path.join(workdir, "candidates.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    marker = os.path.join(workdir, "slow_finished.txt")
+    plan = {"steps": ["Compute the mean temperature"]}
+    failing = "raise ValueError('bad candidate')"
+    slow = f"import time\ntime.sleep(2)\nopen({marker!r}, 'w').write('slow')\nprint('slow')"
+    fast = "print(float(ds['temperature'].mean()))"
+
+    original = executor.client, executor.get_async_client, executor.CODEGEN_CANDIDATES
+    executor.CODEGEN_CANDIDATES = 3
+    original_pool = worker_pool._pool
+    worker_pool._pool = worker_pool.WorkerPool(3)  # One worker per candidate
+    worker_pool._pool.wait_ready()  # Like the servers at start-up
+    try:
+        # 1. First clean run wins; the slow candidate is terminated
+        print("\n--- Test Case 1: First Success Wins ---")
+        fake = CandidateCompletions([failing, slow, fast])
+        executor.client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+        start = time.perf_counter()
+        result = executor.generate_and_execute_code("Mean", plan, nc_path)
+        elapsed = time.perf_counter() - start
+        print(f"Winner in {elapsed:.2f}s: {result['stdout'].strip()}")
+        assert result["success"] and result["stdout"].strip() == "1.0"
+        assert result["code_generated"] == fast
+        assert fake.calls == 3 and elapsed < 2
+        time.sleep(2.2)
+        assert not os.path.exists(marker)
+
+        # 2. All candidates fail: the first failure goes through the fix loop
+        print("\n--- Test Case 2: Fix Loop Fallback ---")
+        fake = CandidateCompletions([failing])
+        executor.client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+        result = executor.generate_and_execute_code("Mean", plan, nc_path)
+        assert result["success"] and result["stdout"].strip() == "fixed"
+        assert fake.calls == 4
+
+        # 3. Async path
+        print("\n--- Test Case 3: Async ---")
+        async_fake = AsyncCandidateCompletions([failing, fast, fast])
+        async_client = AsyncCachedClient(SimpleNamespace(chat=SimpleNamespace(completions=async_fake)), None)
+        executor.get_async_client = lambda: async_client
+        result = asyncio.run(executor.generate_and_execute_code_async("Mean", plan, nc_path))
+        assert result["success"] and result["code_generated"] == fast
+    finally:
+        executor.client, executor.get_async_client, executor.CODEGEN_CANDIDATES = original
+        worker_pool._pool.shutdown()
+        worker_pool._pool = original_pool
+    print("Parallel candidate tests passed.")
+
+if __name__ == "__main__":
+    test_parallel_candidates()
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from quantization import quantize, DequantizedView, scan_scores
+from vector_store import VectorStore
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def test_quantization():
+    print("Testing Quantised Vector Storage...")
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[42]
+
+    # 1. Round trip error is small for both storage types
+    print("\n--- Test Case 1: Round Trip ---")
+    for dtype, tolerance in (("float16", 1e-3), ("int8", 1e-2)):
+        view = DequantizedView(*quantize(vectors, dtype))
+        error = np.abs(view[:] - vectors).max()
+        print(f"{dtype}: max abs error {error:.5f}, {view.nbytes} bytes vs {vectors.nbytes}")
+        assert error < tolerance
+        assert view.nbytes < vectors.nbytes
+        # Chunked scan (scales applied after the dot) matches the dequantised matmul
+        assert np.allclose(scan_scores(view, query), view[:] @ query, atol=1e-5)
+
+    # 2. Quantised stores find the right neighbour; rescoring restores exact scores
+    print("\n--- Test Case 2: Store Search ---")
+    for dtype in ("float16", "int8"):
+        store = VectorStore(tempfile.mkdtemp(), dtype=dtype, ann_min_size=0)
+        store.add_many(vectors, [{"query": str(i)} for i in range(len(vectors))])
+        assert store.dtype == dtype and len(store) == 300
+
+        record, score = store.search(query, exact=True, rescore=False)[0]
+        assert record["query"] == "42" and abs(score - 1.0) < 1e-2
+
+        record, score = store.search(query, exact=True)[0]
+        assert record["query"] == "42" and abs(score - 1.0) < 1e-5
+
+    # 3. Unknown storage types are rejected up front
+    print("\n--- Test Case 3: Bad dtype ---")
+    try:
+        VectorStore(tempfile.mkdtemp(), dtype="int4")
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+    print("Quantisation tests passed.")
+
+if __name__ == "__main__":
+    test_quantization()
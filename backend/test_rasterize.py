@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import matplotlib.tri as tri
+import rasterize
+import code_executor
+from rasterize import rasterize_mesh
+from test_mesh import schism_like_file
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def grid_mesh(nx, ny):
+    gx, gy = np.meshgrid(np.linspace(0, 2, nx), np.linspace(0, 1, ny))
+    idx = np.arange(nx * ny).reshape(ny, nx)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, 1:].ravel(), idx[1:, :-1].ravel()
+    return gx.ravel(), gy.ravel(), np.concatenate([np.stack([a, b, c], 1), np.stack([a, c, d], 1)])
+
+def test_rasterize():
+    print("Testing Mesh Rasterizer...")
+
+    # 1. Node values: same as matplotlib's linear interpolation at the pixel centres
+    print("\n--- Test Case 1: Barycentric Interpolation ---")
+    x, y, triangles = grid_mesh(60, 30)
+    values = np.sin(3 * x) + y ** 2
+    image, extent = rasterize_mesh(x, y, triangles, values, width=200)
+    height, width = image.shape
+    px = extent[0] + (np.arange(width) + 0.5) / width * (extent[1] - extent[0])
+    py = extent[2] + (np.arange(height) + 0.5) / height * (extent[3] - extent[2])
+    expected = tri.LinearTriInterpolator(tri.Triangulation(x, y, triangles), values)(*np.meshgrid(px, py))
+    print(f"{image.shape}, max error {np.nanmax(np.abs(image - expected.filled(np.nan))):.2e}")
+    assert image.shape == (100, 200)
+    assert np.allclose(image, expected.filled(np.nan), equal_nan=True)
+
+    # 2. Triangles smaller than a pixel are aggregated, not dropped; holes stay empty
+    print("\n--- Test Case 2: Sub-pixel Aggregation ---")
+    x, y, triangles = grid_mesh(400, 200)
+    keep = x[triangles].mean(axis=1) < 1.5  # Right quarter of the domain has no elements
+    image, _ = rasterize_mesh(x, y, triangles[keep], np.ones_like(x), width=40)
+    print(f"{np.isnan(image).mean():.0%} of pixels empty")
+    assert np.allclose(image[:, :30], 1) and np.isnan(image[:, 30:]).all()
+    flat, _ = rasterize_mesh(x, y, triangles, np.arange(len(triangles), dtype=float), width=40)
+    assert np.isfinite(flat).all()  # One value per triangle
+    # A thin diagonal sliver spans pixel centres with its bounding box but covers none
+    sliver, _ = rasterize_mesh([0, 10, 0.02], [0.3, 10.3, 0.3], [[0, 1, 2]], [1, 2, 3],
+                               width=10, height=10, extent=(0, 10, 0, 10.5))
+    print(f"Sliver: {np.isfinite(sliver).sum()} pixel(s)")
+    assert np.isfinite(sliver).sum() == 1 and np.nanmax(sliver) == 2
+
+    # 3. plot_unstructured rasterizes large meshes
+    print("\n--- Test Case 3: plot_unstructured ---")
+    path = os.path.join(tempfile.mkdtemp(), "mesh.nc")
+    schism_like_file(path)
+    code = "plot_unstructured(ds['depth'], ds['SCHISM_hgrid_node_x'], ds['SCHISM_hgrid_node_y'])"
+    original = rasterize.RASTER_MIN_TRIANGLES
+    rasterize.RASTER_MIN_TRIANGLES = 0
+    try:
+        start = time.perf_counter()
+        result = code_executor._execute_python_code(code, path)
+        print(f"Rasterized plot in {time.perf_counter() - start:.2f}s")
+        assert result["success"] and len(result["images"]) == 1, result["stderr"]
+    finally:
+        rasterize.RASTER_MIN_TRIANGLES = original
+    print("Rasterizer tests passed.")
+
+if __name__ == "__main__":
+    test_rasterize()
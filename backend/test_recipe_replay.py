@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from openai.types.chat import ChatCompletion
+import memory_service
+import agents.planner, agents.evaluator, agents.executor, agents.synthesizer
+from llm_cache import CachedClient
+from embedding_cache import EmbeddingCache
+from memory_service import find_replayable_recipe
+from orchestrator import run_orchestrator, run_orchestrator_async
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class OfflineEmbeddings:
+    """Fails fast so memory_service uses its deterministic offline vectors."""
+    def create(self, input, model):
+        raise ConnectionError("offline")
+
+class CountingCompletions:
+    """Answers by agent role and counts the calls."""
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, messages, stream=False, **params):
+        self.calls += 1
+        system = messages[0]["content"]
+        if "Planner" in system:
+            content = '{"thought": "Average it.", "steps": ["Compute the mean temperature"]}'
+        elif "Lead Engineer" in system:
+            content = '{"approved": true, "feedback": "ok"}'
+        elif "Code Generator" in system:
+            content = "```python\nprint(float(ds['temperature'].mean()))\n```"
+        else:
+            content = "The mean temperature is 1.0."
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])])
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+        })
+
+def test_recipe_replay():
+    print("Testing Recipe Replay Fast Path...")
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
+    workdir = tempfile.mkdtemp()
+    nc_path = os.path.join(workdir, "replay.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    metadata = {"baseline": {"schema": {"variables": {"temperature": {"dims": ["x", "y"], "desc": "T"}}}}}
+
+    fake = CountingCompletions()
+    fake_client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+    agent_modules = (agents.planner, agents.evaluator, agents.executor, agents.synthesizer)
+    originals = [module.client for module in agent_modules]
+    for module in agent_modules:
+        module.client = fake_client
+    original_memory = memory_service.client, memory_service.embedding_cache
+    memory_service.client = SimpleNamespace(embeddings=OfflineEmbeddings())
+    memory_service.embedding_cache = EmbeddingCache(path=None)
+
+    try:
+        # 1. First time: full chain, recipe saved
+        print("\n--- Test Case 1: Cold Question ---")
+        result = run_orchestrator("Mean temperature", metadata, nc_path)
+        stages = [step["stage"] for step in result["steps_log"]]
+        assert stages == ["Planning", "Evaluation", "Execution", "Learning", "Synthesis"], stages
+        cold_calls = fake.calls
+
+        # 2. Repeat: the recipe is re-run directly, no LLM calls
+        print("\n--- Test Case 2: Replay ---")
+        start = time.perf_counter()
+        result = run_orchestrator("Mean temperature", metadata, nc_path)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed in {elapsed * 1000:.0f}ms: {result['response']}")
+        assert [step["stage"] for step in result["steps_log"]] == ["Recipe Replay"]
+        assert fake.calls == cold_calls
+        assert "1.0" in result["response"]
+        result = asyncio.run(run_orchestrator_async("Mean temperature", metadata, nc_path))
+        assert [step["stage"] for step in result["steps_log"]] == ["Recipe Replay"]
+
+        # 3. Not replayed when the file lacks a variable the recipe uses
+        print("\n--- Test Case 3: Schema Mismatch ---")
+        other = {"schema": {"variables": {"salt": {"dims": ["x", "y"], "desc": "S"}}}}
+        assert find_replayable_recipe("Mean temperature", other) is None
+        assert find_replayable_recipe("Mean temperature", metadata["baseline"]) is not None
+
+        # 4. A replay that fails falls back to the agent chain
+        print("\n--- Test Case 4: Fallback ---")
+        broken_path = os.path.join(workdir, "broken.nc")
+        xr.Dataset({"salt": (("x", "y"), np.ones((4, 4)))}).to_netcdf(broken_path)
+        result = run_orchestrator("Mean temperature", metadata, broken_path)
+        stages = [step["stage"] for step in result["steps_log"]]
+        print(stages)
+        assert stages[:2] == ["Recipe Replay", "Planning"]
+        assert result["steps_log"][0]["status"] == "failed"
+        assert fake.calls > cold_calls
+    finally:
+        for module, original in zip(agent_modules, originals):
+            module.client = original
+        memory_service.client, memory_service.embedding_cache = original_memory
+    print("Recipe replay tests passed.")
+
+if __name__ == "__main__":
+    test_recipe_replay()
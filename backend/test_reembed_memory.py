@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import hashlib
+import threading
+from types import SimpleNamespace
+import numpy as np
+import memory_service
+from embedding_cache import EmbeddingCache
+from vector_store import make_key
+from reembed_memory import reembed
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+class FakeEmbeddings:
+    """Stands in for client.embeddings: deterministic 8-dim vectors, records batch sizes."""
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def create(self, input, model):
+        with self.lock:
+            self.batches.append(len(input))
+        data = []
+        for i, text in enumerate(input):
+            seed = int(hashlib.sha256(f"{model}:{text}".encode()).hexdigest(), 16) % 2**32
+            data.append(SimpleNamespace(index=i, embedding=np.random.default_rng(seed).random(8).tolist()))
+        return SimpleNamespace(data=list(reversed(data)))  # Out of order on purpose
+
+def test_reembed_memory():
+    print("Testing Batch Re-Embedding...")
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
+    original_client, original_cache = memory_service.client, memory_service.embedding_cache
+    memory_service.embedding_cache = EmbeddingCache(path=None)
+    fake = FakeEmbeddings()
+    memory_service.client = SimpleNamespace(embeddings=fake)
+    try:
+        _run_reembed_checks(fake)
+    finally:
+        memory_service.client, memory_service.embedding_cache = original_client, original_cache
+
+def _run_reembed_checks(fake):
+    # 1. Seed an "old model" vector set (4-dim, incompatible with the new model)
+    print("\n--- Test Case 1: Seed Old Model ---")
+    old = memory_service.get_store("old-model")
+    queries = [f"question {i}" for i in range(25)]
+    old.add_many(np.random.default_rng(0).random((25, 4)),
+                 [{"key": make_key(q, "code"), "query": q, "code": "code", "plan": ""} for q in queries])
+
+    # 2. Re-embed into the new model with batched requests
+    print("\n--- Test Case 2: Re-Embed ---")
+    added = reembed("new-model", batch_size=10, concurrency=2)
+    print("Batch sizes:", fake.batches)
+    assert added == 25
+    assert sorted(fake.batches) == [5, 10, 10]
+
+    new = memory_service.get_store("new-model")
+    assert len(new) == 25 and new.dim == 8 and new.model == "new-model"
+    assert len(old) == 25 and old.dim == 4  # Old vector set is left side by side
+
+    # Vectors match what a single get_embeddings call would produce (order preserved)
+    expected = fake.create([queries[7]], "new-model").data[0].embedding
+    hit, score = new.search(expected)[0]
+    assert hit["query"] == queries[7] and score > 0.999
+
+    # 3. Re-running is a no-op
+    print("\n--- Test Case 3: Idempotent ---")
+    assert reembed("new-model", batch_size=10) == 0
+    print("Stores:", sorted(memory_service.list_stores().keys()))
+    print("Re-embedding tests passed.")
+
+if __name__ == "__main__":
+    test_reembed_memory()
@@ -0,0 +1,187 @@
+import os
+import sys
+import threading
+import time
+import asyncio
+import tempfile
+from types import SimpleNamespace
+import xarray as xr
+import numpy as np
+from openai.types.chat import ChatCompletion
+import memory_service
+import orchestrator
+import agents.planner, agents.evaluator, agents.executor, agents.synthesizer
+from llm_cache import CachedClient, AsyncCachedClient
+from embedding_cache import EmbeddingCache
+from orchestrator import run_orchestrator, run_orchestrator_async
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+LLM_LATENCY = 0.3
+
+class OfflineEmbeddings:
+    """Fails fast so memory_service uses its deterministic offline vectors."""
+    def create(self, input, model):
+        raise ConnectionError("offline")
+
+class RoleCompletions:
+    """Answers by agent role after LLM_LATENCY; the evaluator's verdict is configurable."""
+    def __init__(self, marker_path):
+        self.marker_path = marker_path
+        self.approve = True
+
+    def answer(self, model, messages):
+        system = messages[0]["content"]
+        if "Planner" in system:
+            content = '{"thought": "Average it.", "steps": ["Compute the mean temperature"]}'
+        elif "Lead Engineer" in system:
+            content = '{"approved": %s, "feedback": "Step 1 is unsafe."}' % ("true" if self.approve else "false")
+        elif "Code Generator" in system:
+            content = f"```python\nopen({self.marker_path!r}, 'a').write('ran')\nprint(float(ds['temperature'].mean()))\n```"
+        else:
+            content = "The mean temperature is 1.0."
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+        })
+
+    def create(self, model, messages, stream=False, **params):
+        time.sleep(LLM_LATENCY)
+        response = self.answer(model, messages)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(
+            content=response.choices[0].message.content))])]) if stream else response
+
+class AsyncRoleCompletions(RoleCompletions):
+    async def create(self, model, messages, stream=False, **params):
+        await asyncio.sleep(LLM_LATENCY)
+        response = self.answer(model, messages)
+        if not stream:
+            return response
+        async def chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(
+                content=response.choices[0].message.content))])
+        return chunks()
+
+def test_speculative_execution():
+    print("Testing Speculative Code Generation...")
+    memory_service.MEMORY_STORE_DIR = tempfile.mkdtemp()
+    memory_service.MEMORY_FILE = os.path.join(memory_service.MEMORY_STORE_DIR, "code_memory.json")
+    memory_service._stores.clear()
+    workdir = tempfile.mkdtemp()
+    nc_path = os.path.join(workdir, "speculative.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    metadata = {"baseline": {"schema": {"variables": {"temperature": {"dims": ["x", "y"], "desc": "T"}}}}}
+    marker = os.path.join(workdir, "executed.txt")
+
+    fake, async_fake = RoleCompletions(marker), AsyncRoleCompletions(marker)
+    sync_client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=fake)), None)
+    async_client = AsyncCachedClient(SimpleNamespace(chat=SimpleNamespace(completions=async_fake)), None)
+    agent_modules = (agents.planner, agents.evaluator, agents.executor, agents.synthesizer)
+    originals = [(module.client, module.get_async_client) for module in agent_modules]
+    for module in agent_modules:
+        module.client = sync_client
+        module.get_async_client = lambda: async_client
+    original_memory = memory_service.client, memory_service.embedding_cache
+    memory_service.client = SimpleNamespace(embeddings=OfflineEmbeddings())
+    memory_service.embedding_cache = EmbeddingCache(path=None)
+    original_policy = orchestrator.SPECULATIVE_CODEGEN, orchestrator.PLAN_APPROVAL
+
+    def timed(speculative, query, cancel_event=None):
+        orchestrator.SPECULATIVE_CODEGEN = speculative
+        start = time.perf_counter()
+        result = run_orchestrator(query, metadata, nc_path, cancel_event=cancel_event)
+        return result, time.perf_counter() - start
+
+    try:
+        # 1. Code generation overlaps evaluation: one LLM round trip saved
+        print("\n--- Test Case 1: Overlap ---")
+        result, sequential = timed(False, "Mean temperature (sequential)")
+        result, speculative = timed(True, "Mean temperature (speculative)")
+        print(f"sequential {sequential:.2f}s, speculative {speculative:.2f}s")
+        assert result["response"] == "The mean temperature is 1.0."
+        assert result["steps_log"][2]["output"]["stdout"].strip().endswith("1.0")
+        assert sequential - speculative > LLM_LATENCY * 0.7
+
+        # 2. Advisory policy: a rejection only warns, the speculative result is used
+        print("\n--- Test Case 2: Advisory Rejection ---")
+        fake.approve = False
+        orchestrator.PLAN_APPROVAL = "advisory"
+        result, _ = timed(True, "Mean temperature (advisory)")
+        stages = [step["stage"] for step in result["steps_log"]]
+        assert "Warning" in stages and "Execution" in stages
+
+        # 3. Strict policy: a rejection cancels the speculative code before it runs
+        print("\n--- Test Case 3: Strict Rejection ---")
+        os.remove(marker)
+        orchestrator.PLAN_APPROVAL = "strict"
+        caller_cancel = threading.Event()  # The UI / API one: only the speculation is stopped
+        result, _ = timed(True, "Mean temperature (strict)", caller_cancel)
+        print(result["response"])
+        assert not caller_cancel.is_set()
+        assert result["steps_log"][-1] == {"stage": "Evaluation", "status": "rejected",
+                                           "output": {"approved": False, "feedback": "Step 1 is unsafe."}}
+        assert "rejected" in result["response"]
+        time.sleep(LLM_LATENCY * 2)  # Let the discarded speculation reach its approval check
+        assert not os.path.exists(marker)
+
+        # 4. Async path: same overlap, same strict cancellation
+        print("\n--- Test Case 4: Async ---")
+        async_fake.approve = False
+        result = asyncio.run(run_orchestrator_async("Mean temperature (async strict)", metadata, nc_path,
+                                                    cancel_event=caller_cancel))
+        assert "rejected" in result["response"] and not os.path.exists(marker)
+        assert not caller_cancel.is_set()
+        async_fake.approve = True
+        orchestrator.PLAN_APPROVAL = "advisory"
+        start = time.perf_counter()
+        result = asyncio.run(run_orchestrator_async("Mean temperature (async)", metadata, nc_path))
+        elapsed = time.perf_counter() - start
+        print(f"async speculative {elapsed:.2f}s")
+        assert os.path.exists(marker) and result["response"] == "The mean temperature is 1.0."
+        assert elapsed < sequential - LLM_LATENCY * 0.7
+
+        # 5. A crashing evaluation still releases (and stops) the waiting speculation
+        print("\n--- Test Case 5: Evaluation Errors ---")
+        try:
+            agents.evaluator.parse_evaluation("true")
+            assert False, "non-object verdict accepted"
+        except ValueError as e:
+            print(f"parse_evaluation: {e}")
+        os.remove(marker)
+        orchestrator.PLAN_APPROVAL = "strict"
+        futures = []
+        def submit(*args, **kwargs):
+            futures.append(pool.submit(*args, **kwargs))
+            return futures[-1]
+        def broken(*args):
+            raise RuntimeError("evaluator crashed")
+        async def broken_async(*args):
+            broken()
+        pool = orchestrator._speculation_pool
+        orchestrator._speculation_pool = SimpleNamespace(submit=submit)
+        orchestrator.evaluate_plan, orchestrator.evaluate_plan_async = broken, broken_async
+        try:
+            for run in (lambda: timed(True, "Mean temperature (crash)"),
+                        lambda: asyncio.run(run_orchestrator_async("Mean temperature (async crash)", metadata, nc_path))):
+                try:
+                    run()
+                    assert False, "evaluation error swallowed"
+                except RuntimeError:
+                    pass
+            assert futures[0].result(timeout=5)["success"] is False  # Not stuck on the verdict
+        finally:
+            orchestrator._speculation_pool = pool
+            orchestrator.evaluate_plan = agents.evaluator.evaluate_plan
+            orchestrator.evaluate_plan_async = agents.evaluator.evaluate_plan_async
+        time.sleep(LLM_LATENCY * 2)
+        assert not os.path.exists(marker)
+    finally:
+        orchestrator.SPECULATIVE_CODEGEN, orchestrator.PLAN_APPROVAL = original_policy
+        for module, (client, get_async_client) in zip(agent_modules, originals):
+            module.client, module.get_async_client = client, get_async_client
+        memory_service.client, memory_service.embedding_cache = original_memory
+    print("Speculative execution tests passed.")
+
+if __name__ == "__main__":
+    test_speculative_execution()
@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+from vector_store import VectorStore, make_key
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def test_vector_store():
+    print("Testing Vector Store...")
+    store_dir = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+
+    # 1. Append + Search
+    print("\n--- Test Case 1: Append & Search ---")
+    store = VectorStore(store_dir)
+    vectors = rng.standard_normal((50, 16)).astype(np.float32)
+    records = [{"query": f"q{i}", "code": f"print({i})", "plan": ""} for i in range(50)]
+    store.add_many(vectors, records, model="test-model")
+    assert len(store) == 50
+
+    hits = store.search(vectors[7], top_k=3)
+    print("Top hits:", [(r["query"], round(s, 3)) for r, s in hits])
+    assert len(hits) == 3
+    assert hits[0][0]["query"] == "q7"
+    assert abs(hits[0][1] - 1.0) < 1e-5
+
+    # 2. Growth beyond the pre-allocated capacity
+    print("\n--- Test Case 2: Capacity Growth ---")
+    import vector_store
+    original_capacity = vector_store.INITIAL_CAPACITY
+    try:
+        vector_store.INITIAL_CAPACITY = 4
+        small = VectorStore(tempfile.mkdtemp())
+        for i in range(10):
+            small.add(vectors[i], records[i])
+        assert len(small) == 10
+        assert small.search(vectors[9])[0][0]["query"] == "q9"
+    finally:
+        vector_store.INITIAL_CAPACITY = original_capacity
+
+    # 3. A second handle sees committed rows (e.g. another worker)
+    print("\n--- Test Case 3: Reopen ---")
+    reopened = VectorStore(store_dir)
+    assert len(reopened) == 50
+    assert reopened.model == "test-model"
+    store.add(vectors[0] * 2, {"query": "dup", "code": "", "plan": ""})
+    assert len(reopened) == 51
+
+    # 4. Dimension mismatch is rejected, not silently stored
+    print("\n--- Test Case 4: Dimension Mismatch ---")
+    try:
+        store.add(np.ones(8), {"query": "bad"})
+        assert False, "Expected ValueError"
+    except ValueError as e:
+        print("Rejected:", e)
+    assert store.search(np.ones(8)) == []
+
+    # 5. Migration from the legacy JSON list
+    print("\n--- Test Case 5: JSON Migration ---")
+    legacy_path = os.path.join(tempfile.mkdtemp(), "code_memory.json")
+    with open(legacy_path, "w") as f:
+        json.dump([
+            {"query": "a", "code": "x", "plan": "p", "embedding": vectors[1].tolist()},
+            {"query": "b", "code": "y", "plan": "p", "embedding": vectors[2].tolist()},
+            {"query": "no vector", "code": "z", "plan": "p"},
+        ], f)
+    migrated = VectorStore(tempfile.mkdtemp())
+    assert migrated.import_json(legacy_path) == 2
+    assert migrated.search(vectors[2])[0][0]["query"] == "b"
+    assert migrated.import_json(legacy_path) == 0  # Idempotent
+    print("Vector store tests passed.")
+
+def _append_worker(store_dir, worker_id, count):
+    store = VectorStore(store_dir, compact_threshold=8)
+    rng = np.random.default_rng(worker_id)
+    for i in range(count):
+        query = f"worker{worker_id}-{i}"
+        store.append(rng.standard_normal(16), {"key": make_key(query, ""), "query": query, "code": "", "plan": ""})
+
+def test_append_log():
+    print("Testing Append Log & Compaction...")
+    store_dir = tempfile.mkdtemp()
+    store = VectorStore(store_dir, compact_threshold=0)  # Manual compaction only
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((5, 16)).astype(np.float32)
+
+    # 1. Appends land in the log and are searchable right away
+    print("\n--- Test Case 1: Append & Search Pending ---")
+    for i in range(5):
+        record = {"key": make_key(f"q{i}", "code"), "query": f"q{i}", "code": "code", "plan": ""}
+        assert store.append(vectors[i], record)
+    assert store.pending == 5
+    assert store.search(vectors[3])[0][0]["query"] == "q3"
+
+    # 2. Hash index rejects duplicates
+    print("\n--- Test Case 2: Duplicate Check ---")
+    assert store.contains(make_key("q0", "code"))
+    assert not store.append(vectors[0], {"key": make_key("q0", "code"), "query": "q0", "code": "code"})
+
+    # 3. Compaction folds the log into the matrix
+    print("\n--- Test Case 3: Compaction ---")
+    assert store.compact() == 5
+    assert store.pending == 0
+    assert len(store.matrix()) == 5
+    assert [r["query"] for r in store.all_records()] == [f"q{i}" for i in range(5)]
+    assert not store.append(vectors[0], {"key": make_key("q0", "code"), "query": "q0", "code": "code"})
+
+    # 4. Concurrent writers (threads and processes) lose nothing
+    print("\n--- Test Case 4: Concurrent Writers ---")
+    shared_dir = tempfile.mkdtemp()
+    threads = [threading.Thread(target=_append_worker, args=(shared_dir, i, 20)) for i in range(4)]
+    processes = [multiprocessing.Process(target=_append_worker, args=(shared_dir, 10 + i, 20)) for i in range(2)]
+    for worker in threads + processes:
+        worker.start()
+    for worker in threads + processes:
+        worker.join()
+
+    shared = VectorStore(shared_dir)
+    shared.compact()
+    queries = [r["query"] for r in shared.all_records()]
+    print(f"Stored {len(queries)} entries from 6 writers.")
+    assert len(queries) == 120
+    assert len(set(queries)) == 120
+
+    # 5. Searches don't wait for a compaction running in another thread
+    print("\n--- Test Case 5: Search During Compaction ---")
+    slow = VectorStore(tempfile.mkdtemp(), compact_threshold=0)
+    for i in range(5):
+        slow.append(vectors[i], {"key": make_key(f"s{i}", ""), "query": f"s{i}", "code": "", "plan": ""})
+    started, release = threading.Event(), threading.Event()
+    build_index = VectorStore._build_index
+    def blocked_build(store):
+        started.set()
+        release.wait(5)
+        return build_index(store)
+    VectorStore._build_index = blocked_build
+    try:
+        compaction = slow.compact_in_background()
+        assert started.wait(5)
+        # Answered from the last commit while the compaction is still stuck
+        assert slow.search(vectors[2])[0][0]["query"] == "s2" and len(slow) == 5
+        assert compaction.is_alive()
+        release.set()
+        compaction.join()
+    finally:
+        VectorStore._build_index = build_index
+    assert slow.pending == 0 and slow.search(vectors[2])[0][0]["query"] == "s2"
+    print("Append log tests passed.")
+
+def test_prune():
+    print("Testing Near-Duplicate Compaction & Eviction...")
+    rng = np.random.default_rng(2)
+    base = rng.standard_normal((10, 16)).astype(np.float32)
+    # Three near-copies of every base recipe (e.g. repeated "open the dataset" entries)
+    vectors = np.concatenate([base + 0.01 * rng.standard_normal((10, 16)).astype(np.float32) for _ in range(3)])
+    records = [{"key": make_key(f"q{i}", ""), "query": f"q{i}", "code": "", "plan": "", "created": float(i)}
+               for i in range(30)]
+
+    # 1. Hits are logged and folded per key
+    print("\n--- Test Case 1: Usage Tracking ---")
+    store = VectorStore(tempfile.mkdtemp(), compact_threshold=0, max_entries=0)
+    store.add_many(vectors, records)
+    store.record_hits([records[3]["key"], records[3]["key"], None], now=100.0)
+    store.record_hits([records[13]["key"]], now=200.0)
+    usage = store.usage()
+    assert usage[records[3]["key"]] == {"hits": 2, "last_used": 100.0}
+    assert usage[records[13]["key"]]["hits"] == 1
+
+    # 2. Near-duplicates collapse to the most used recipe per cluster
+    print("\n--- Test Case 2: Near-Duplicate Merge ---")
+    stats = store.prune(threshold=0.95)
+    print("Prune stats:", stats)
+    assert stats == {"merged": 20, "evicted": 0, "kept": 10}
+    assert len(store) == 10
+    queries = {r["query"] for r in store.all_records()}
+    assert "q3" in queries and "q13" not in queries and "q23" not in queries
+    assert store.usage()[records[3]["key"]]["hits"] == 3  # Merged usage moves to the keeper
+    assert store.search(base[5])[0][0]["query"] == "q25"  # Unused clusters keep the newest
+    assert not store.contains(records[15]["key"])
+
+    # A second handle (another worker) follows the rewrite
+    reopened = VectorStore(store.directory)
+    assert len(reopened) == 10 and reopened.search(base[3])[0][0]["query"] == "q3"
+
+    # 3. Size cap evicts least recently used first
+    print("\n--- Test Case 3: LRU Cap ---")
+    stats = store.prune(max_entries=4, threshold=0)
+    assert stats["evicted"] == 6 and len(store) == 4
+    # q3 was used; the rest are aged by "created", so the newest three survive
+    assert {r["query"] for r in store.all_records()} == {"q3", "q29", "q28", "q27"}
+
+    # 4. Compaction enforces the configured cap on its own (LFU here)
+    print("\n--- Test Case 4: Cap on Compaction ---")
+    capped = VectorStore(tempfile.mkdtemp(), compact_threshold=0, max_entries=5,
+                         dedupe_threshold=0, eviction_policy="lfu")
+    for i in range(8):
+        capped.append(base[i % 10], records[i])
+    capped.record_hits([records[0]["key"]] * 3 + [records[1]["key"]])
+    capped.compact()
+    kept = {r["query"] for r in capped.all_records()}
+    print("Kept:", sorted(kept))
+    assert len(kept) == 5 and {"q0", "q1"} <= kept
+    assert capped.search(base[1])[0][0]["query"] == "q1"
+    print("Prune tests passed.")
+
+if __name__ == "__main__":
+    test_vector_store()
+    test_append_log()
+    test_prune()
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import xarray as xr
+import numpy as np
+from dataset_cache import dataset_cache
+from worker_pool import WorkerPool
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+def test_worker_pool():
+    print("Testing Warm Worker Pool...")
+    nc_path = os.path.join(tempfile.mkdtemp(), "pool.nc")
+    xr.Dataset({"temperature": (("x", "y"), np.ones((4, 4)))}).to_netcdf(nc_path)
+    pool = WorkerPool(size=2, max_jobs=3)
+    try:
+        start = time.perf_counter()
+        assert pool.wait_ready()
+        print(f"Pool warm in {time.perf_counter() - start:.2f}s")
+
+        # 1. Results (stdout + figures) come back over the pipe; workers are reused warm
+        print("\n--- Test Case 1: Warm Reuse ---")
+        code = "import os\nprint(os.getpid(), float(ds['temperature'].mean()))\nplt.plot([1, 2])\nplt.show()"
+        timings, pids = [], set()
+        for _ in range(3):
+            start = time.perf_counter()
+            result = pool.run(code, nc_path)
+            timings.append(time.perf_counter() - start)
+            pid, value = result["stdout"].split()
+            pids.add(int(pid))
+            assert value == "1.0" and len(result["images"]) == 1
+        print(f"Jobs took {[round(t * 1000) for t in timings]}ms on workers {pids}")
+        assert os.getpid() not in pids
+        assert max(timings) < 1.0  # No interpreter start-up / xarray import per job
+
+        # 2. Jobs run in parallel, one per worker
+        print("\n--- Test Case 2: Concurrency ---")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(2) as threads:
+            results = list(threads.map(lambda _: pool.run("import time\ntime.sleep(0.5)", nc_path), range(2)))
+        elapsed = time.perf_counter() - start
+        print(f"2 x 0.5s jobs in {elapsed:.2f}s")
+        assert all(r["success"] for r in results) and elapsed < 0.9
+
+        # 3. Cancelling or crashing a job replaces its worker; the pool keeps serving
+        print("\n--- Test Case 3: Cancel / Crash ---")
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        result = pool.run("import time\ntime.sleep(30)", nc_path, cancel_event=cancel)
+        assert result.get("cancelled")
+        result = pool.run("import os\nos._exit(7)", nc_path)
+        print(result["stderr"])
+        assert not result["success"] and "code 7" in result["stderr"]
+        assert pool.run("print('still here')", nc_path)["stdout"].strip() == "still here"
+        stats = pool.summary()
+        print(stats)
+        assert stats["cancelled"] == 1 and stats["crashed"] == 1
+        assert stats["restarts"] >= 2 and stats["workers"] == 2
+
+        # 4. Replacements don't inherit server state: a lock held by another thread
+        # (dataset_cache while it opens a file) doesn't hang the new worker
+        print("\n--- Test Case 4: Replacement While a Lock Is Held ---")
+        with dataset_cache._lock:
+            for _ in range(pool.size):  # Every worker is replaced while the lock is held
+                pool.run("import os\nos._exit(1)", nc_path)
+            results = [pool.run("print(float(ds['temperature'].sum()))", nc_path, timeout=10)
+                       for _ in range(pool.size)]
+        print([(r["stdout"].strip(), r["stderr"]) for r in results])
+        assert all(r["success"] and r["stdout"].strip() == "16.0" for r in results)
+    finally:
+        pool.shutdown()
+    print("Worker pool tests passed.")
+
+if __name__ == "__main__":
+    test_worker_pool()
@@ -0,0 +1,929 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from file_lock import file_lock
+from ann_index import IVFIndex, ANN_MIN_SIZE, select_top_k
+from quantization import STORAGE_DTYPES, DequantizedView, quantize, scan_scores
+
+# On-disk layout of a store directory:
+#   embeddings.npy  -> contiguous matrix (capacity x dim), memory-mapped for search;
+#                      float32, or float16/int8 codes when MEMORY_VECTOR_DTYPE asks for it
+#   scales.npy      -> per-vector float32 scale factors (int8 stores only)
+#   embeddings_f32.npy -> full-precision copy used only to rescore top candidates (quantised stores)
+#   records.jsonl   -> metadata table, one JSON line per matrix row (query / code / plan)
+#   store.json      -> header with the committed row count, vector dim, embedding model
+#                      and the current log generation (the single commit point)
+#   log.<gen>.jsonl -> append-only write log, folded into the matrix by compaction
+#   ivf.npz         -> approximate nearest-neighbour index over the matrix rows
+#   usage.jsonl     -> append-only hit log (key, hits, last_used) feeding eviction
+#   store.lock      -> inter-process write lock
+# prune() rewrites the row-aligned files (and usage) under a new generation,
+# e.g. embeddings.3.npy; generation 0 keeps the plain names above.
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+FULL_PRECISION_FILE = "embeddings_f32.npy"
+RECORDS_FILE = "records.jsonl"
+HEADER_FILE = "store.json"
+LOG_FILE = "log.{}.jsonl"
+USAGE_FILE = "usage.jsonl"
+LOCK_FILE = "store.lock"
+INDEX_FILE = "ivf.npz"
+
+INITIAL_CAPACITY = 1024
+# Pending log entries that trigger a background compaction
+COMPACT_THRESHOLD = int(os.getenv("MEMORY_COMPACT_THRESHOLD", "64"))
+# Storage type for new stores: float32, float16 or int8
+VECTOR_DTYPE = os.getenv("MEMORY_VECTOR_DTYPE", "float32")
+# Quantised stores rescore top_k * factor candidates at full precision (0 = off)
+RESCORE_FACTOR = int(os.getenv("MEMORY_RESCORE_FACTOR", "4"))
+# MEMORY_MAX_ENTRIES: size cap enforced when compaction pushes the store past it.
+# Evicted recipes (MEMORY_EVICTION_POLICY order) are deleted for good, so the
+# default is 0 = unbounded: the store is built to hold hundreds of thousands of
+# recipes behind the IVF index. Set it on disk-constrained deployments (e.g.
+# 200000), or run prune_memory.py --max-entries N by hand.
+MAX_ENTRIES = int(os.getenv("MEMORY_MAX_ENTRIES", "0"))
+# Recipes at least this similar are merged into one cluster by prune() (0 = off)
+DEDUPE_THRESHOLD = float(os.getenv("MEMORY_DEDUPE_THRESHOLD", "0.95"))
+# Which recipes the size cap evicts first: "lru" (least recently used) or "lfu" (least hits)
+EVICTION_POLICY = os.getenv("MEMORY_EVICTION_POLICY", "lru")
+EVICTION_POLICIES = ("lru", "lfu")
+# Rows compared per matrix product while clustering near-duplicates
+DEDUPE_BLOCK = 256
+
+def cluster_group(record):
+    """
+    Recipes are only merged with near-duplicates of the same group: the schema
+    fingerprint hash they were saved with (None for recipes without one), so the
+    same question answered for files with different variables stays separate.
+    """
+    return (record.get("schema") or {}).get("hash")
+
+def make_key(*parts):
+    """Content hash used for the duplicate check (e.g. make_key(query, code))."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class VectorStore:
+    """
+    Append-friendly vector store for the code memory.
+    Vectors are L2-normalised on insert so cosine similarity is a single
+    matrix-vector product over the memory-mapped matrix.
+
+    Writers only append one line to log.jsonl under a file lock (constant cost);
+    compaction later folds the log into the matrix. Searches cover both.
+    """
+
+    def __init__(self, directory, model=None, dtype=VECTOR_DTYPE, compact_threshold=COMPACT_THRESHOLD,
+                 ann_min_size=ANN_MIN_SIZE, rescore_factor=RESCORE_FACTOR, max_entries=MAX_ENTRIES,
+                 dedupe_threshold=DEDUPE_THRESHOLD, eviction_policy=EVICTION_POLICY):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}'. Use one of {STORAGE_DTYPES}.")
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unsupported eviction policy '{eviction_policy}'. Use one of {EVICTION_POLICIES}.")
+        self.directory = directory
+        # Recorded in the header when the store is created
+        self.default_model = model
+        self.default_dtype = dtype
+        self.header_path = os.path.join(directory, HEADER_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.compact_threshold = compact_threshold
+        self.ann_min_size = ann_min_size
+        self.rescore_factor = rescore_factor
+        self.max_entries = max_entries
+        self.dedupe_threshold = dedupe_threshold
+        self.eviction_policy = eviction_policy
+
+        # Guards the in-process caches below (Streamlit serves sessions from threads)
+        self._lock = threading.RLock()
+        self._compacting = False
+
+        self._header = None
+        self._matrix = None
+        self._full_matrix = None
+        self._records = None
+        self._records_bytes = 0
+        self._keys = None
+        self._index = None
+        self._index_generation = None
+        self._index_mtime = None
+
+        self._log_generation = None
+        self._log_offset = 0
+        self._log_vectors = []
+        self._log_records = []
+
+        self._usage = None
+        self._usage_generation = None
+        self._usage_offset = 0
+
+    # --- HEADER ---
+    def _read_header(self):
+        """
+        Reloads the header and drops cached views if another writer committed.
+        The header is a few bytes, so it is re-read on every access rather than
+        trusting file timestamps (too coarse to order concurrent commits).
+        """
+        try:
+            with open(self.header_path, "r") as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            # Nothing committed yet (or the store was wiped)
+            header = {"count": 0, "dim": None, "model": None, "records_bytes": 0, "generation": 0, "log_generation": 0}
+
+        previous = self._header
+        if header == previous:
+            return self._header
+
+        self._header = header
+        self._matrix = None
+        self._full_matrix = None
+        # Rows are append-only within a generation: read just the new metadata lines
+        if (self._records is not None and previous is not None
+                and header.get("generation", 0) == previous.get("generation", 0)
+                and header["records_bytes"] >= self._records_bytes):
+            self._load_records_tail(header["records_bytes"])
+        else:
+            self._records = None
+            self._keys = None
+        return self._header
+
+    def _write_header(self, header):
+        # Atomic replace so readers never see a half-written header
+        tmp_path = self.header_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self.header_path)
+        self._header = header
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, LOG_FILE.format(generation))
+
+    def _data_path(self, filename, generation=None):
+        """Path of a row-aligned file for a rewrite generation (default: the committed one)."""
+        if generation is None:
+            generation = (self._header or {}).get("generation", 0)
+        if not generation:
+            return os.path.join(self.directory, filename)
+        stem, ext = os.path.splitext(filename)
+        return os.path.join(self.directory, f"{stem}.{generation}{ext}")
+
+    @property
+    def embeddings_path(self):
+        return self._data_path(EMBEDDINGS_FILE)
+
+    @property
+    def scales_path(self):
+        return self._data_path(SCALES_FILE)
+
+    @property
+    def full_path(self):
+        return self._data_path(FULL_PRECISION_FILE)
+
+    @property
+    def records_path(self):
+        return self._data_path(RECORDS_FILE)
+
+    @property
+    def dim(self):
+        with self._lock:
+            self._refresh()
+            if self._header["dim"] is not None:
+                return self._header["dim"]
+            return len(self._log_vectors[0]) if self._log_vectors else None
+
+    @property
+    def model(self):
+        with self._lock:
+            return self._read_header()["model"]
+
+    @property
+    def dtype(self):
+        with self._lock:
+            return self._read_header().get("dtype") or self.default_dtype
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._header["count"] + len(self._log_records)
+
+    @property
+    def pending(self):
+        """Number of log entries not yet folded into the matrix."""
+        with self._lock:
+            self._refresh()
+            return len(self._log_records)
+
+    # --- APPEND LOG ---
+    def _reset_log_cache(self, generation=None):
+        self._log_generation = generation
+        self._log_offset = 0
+        self._log_vectors = []
+        self._log_records = []
+
+    def _read_log(self):
+        """Picks up log lines appended since the last read (by any process)."""
+        generation = self._header.get("log_generation", 0)
+        # Compaction commits a new log generation together with the rows it folded in
+        if generation != self._log_generation:
+            self._reset_log_cache(generation)
+
+        try:
+            with open(self._log_path(generation), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except OSError:
+            return
+
+        # Ignore a trailing partial line; it will be complete on the next read
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            self._log_vectors.append(np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32))
+            self._log_records.append(entry["record"])
+            if self._keys is not None and entry["record"].get("key"):
+                self._keys.add(entry["record"]["key"])
+        self._log_offset += end
+
+    def _refresh(self):
+        self._read_header()
+        self._read_log()
+
+    def _key_index(self):
+        if self._keys is None:
+            keys = {r.get("key") for r in self.records() if r.get("key")}
+            keys.update(r.get("key") for r in self._log_records if r.get("key"))
+            self._keys = keys
+        return self._keys
+
+    def contains(self, key):
+        """O(1) duplicate check against committed rows and the pending log."""
+        with self._lock:
+            self._refresh()
+            return key in self._key_index()
+
+    def append(self, vector, record):
+        """
+        Appends one entry to the write log. Cost does not depend on store size.
+        Returns False if an entry with the same record['key'] already exists.
+        Raises ValueError on a dimension mismatch.
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        key = record.get("key")
+
+        with file_lock(self.lock_path), self._lock:
+            self._refresh()
+            if key and key in self._key_index():
+                return False
+
+            dim = self._header["dim"]
+            if dim is None and self._log_vectors:
+                dim = len(self._log_vectors[0])
+            if dim is not None and len(vector) != dim:
+                raise ValueError(f"Embedding dimension mismatch ({len(vector)} vs {dim}).")
+
+            line = json.dumps({
+                "record": record,
+                "vector": base64.b64encode(vector.tobytes()).decode("ascii")
+            }) + "\n"
+            with open(self._log_path(self._header.get("log_generation", 0)), "ab") as f:
+                f.write(line.encode("utf-8"))
+            self._read_log()
+            pending = len(self._log_records)
+
+        if self.compact_threshold and pending >= self.compact_threshold:
+            self.compact_in_background()
+        return True
+
+    # --- COMPACTION ---
+    def _compact_locked(self):
+        self._refresh()
+        if not self._log_records:
+            return 0
+
+        # append() already rejected duplicates under this lock, so the log folds in as-is.
+        # Rows and the switch to a fresh log are committed by the same header write.
+        old_generation = self._header.get("log_generation", 0)
+        records = list(self._log_records)
+        self._add_many_locked(np.stack(self._log_vectors), records, log_generation=old_generation + 1)
+        try:
+            os.remove(self._log_path(old_generation))
+        except OSError:
+            pass
+        self._refresh()
+        return len(records)
+
+    def compact(self):
+        """
+        Folds the pending log into the memory-mapped matrix. Returns rows added.
+        If that pushes the store past max_entries, prune() runs under the same lock.
+        """
+        def work(store):
+            added = store._compact_locked()
+            if added and store.max_entries and store._header["count"] > store.max_entries:
+                store._prune_locked(store.max_entries, store.dedupe_threshold, store.eviction_policy)
+            # Keep the ANN index (and its on-disk copy) current off the query path
+            store._build_index()
+            return added
+        return self._write(work)
+
+    # --- WRITE PATH ---
+    def _write(self, work):
+        """
+        Runs work(store) under the file lock on a private handle of this
+        directory, then switches this handle over to what it committed. Folding
+        the log, pruning and index training never hold self._lock: searches in
+        this process keep scanning the last commit and only wait for the swap.
+        """
+        with file_lock(self.lock_path):
+            store = self._private_handle()
+            result = work(store)
+            store._refresh()
+            store.records()
+            with self._lock:
+                self._adopt(store)
+            return result
+
+    def _private_handle(self):
+        """A handle with the same settings, seeded with this one's metadata cache."""
+        store = VectorStore(self.directory, model=self.default_model, dtype=self.default_dtype,
+                            compact_threshold=0, ann_min_size=self.ann_min_size,
+                            rescore_factor=self.rescore_factor, max_entries=self.max_entries,
+                            dedupe_threshold=self.dedupe_threshold, eviction_policy=self.eviction_policy)
+        with self._lock:
+            store._header = self._read_header()
+            if self._records is not None:
+                store._records = list(self._records)
+                store._records_bytes = self._records_bytes
+                store._keys = set(self._keys) if self._keys is not None else None
+        return store
+
+    def _adopt(self, store):
+        """Takes over the committed state (and caches) of a private handle."""
+        self._header = store._header
+        self._records, self._records_bytes, self._keys = store._records, store._records_bytes, store._keys
+        self._matrix, self._full_matrix = store._matrix, store._full_matrix
+        self._index, self._index_generation, self._index_mtime = (
+            store._index, store._index_generation, store._index_mtime)
+        self._read_log()
+
+    def compact_in_background(self):
+        """Runs compact() on a daemon thread unless one is already running."""
+        with self._lock:
+            if self._compacting:
+                return None
+            self._compacting = True
+
+        def _run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Memory compaction failed: {e}")
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        thread = threading.Thread(target=_run, name="memory-compaction", daemon=True)
+        thread.start()
+        return thread
+
+    # --- USAGE ---
+    def _usage_path(self, generation):
+        return self._data_path(USAGE_FILE, generation)
+
+    def _read_usage(self):
+        """Folds hit log lines appended since the last read into {key: {hits, last_used}}."""
+        generation = self._header.get("generation", 0)
+        if self._usage is None or generation != self._usage_generation:
+            self._usage = {}
+            self._usage_generation = generation
+            self._usage_offset = 0
+
+        try:
+            with open(self._usage_path(generation), "rb") as f:
+                f.seek(self._usage_offset)
+                data = f.read()
+        except OSError:
+            return self._usage
+
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            stats = self._usage.setdefault(entry["key"], {"hits": 0, "last_used": 0.0})
+            stats["hits"] += entry["hits"]
+            stats["last_used"] = max(stats["last_used"], entry["last_used"])
+        self._usage_offset += end
+        return self._usage
+
+    def usage(self):
+        """Returns {key: {"hits": n, "last_used": unix time}} for recipes that were retrieved."""
+        with self._lock:
+            self._read_header()
+            return {key: dict(stats) for key, stats in self._read_usage().items()}
+
+    def record_hits(self, keys, now=None):
+        """Logs a retrieval of each record key (one locked append, like append())."""
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        now = now or time.time()
+        payload = "".join(json.dumps({"key": key, "hits": 1, "last_used": now}) + "\n" for key in keys)
+        with file_lock(self.lock_path), self._lock:
+            header = self._read_header()
+            with open(self._usage_path(header.get("generation", 0)), "ab") as f:
+                f.write(payload.encode("utf-8"))
+
+    # --- PRUNING ---
+    def prune(self, max_entries=None, threshold=None, policy=None):
+        """
+        Merges near-duplicate recipes and enforces the size cap (defaults: the
+        store's settings). Returns {"merged": n, "evicted": n, "kept": n}.
+        """
+        policy = policy or self.eviction_policy
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unsupported eviction policy '{policy}'. Use one of {EVICTION_POLICIES}.")
+        def work(store):
+            store._compact_locked()
+            stats = store._prune_locked(
+                store.max_entries if max_entries is None else max_entries,
+                store.dedupe_threshold if threshold is None else threshold,
+                policy
+            )
+            store._build_index()
+            return stats
+        return self._write(work)
+
+    def _prune_locked(self, max_entries, threshold, policy):
+        """
+        1. Clusters rows greedily by cosine similarity: rows are visited best first
+           (most hits, then most recently used, then newest) and every row of the
+           same cluster_group() at least `threshold` similar to a kept row is
+           merged into it (usage is summed).
+        2. If more than max_entries rows survive, the least recently used (lru) or
+           least hit (lfu) ones are evicted.
+        3. The survivors are rewritten under a new generation; the header switch
+           commits them, so readers see either the old or the new set.
+        """
+        header = self._read_header()
+        count = header["count"]
+        if count == 0:
+            return {"merged": 0, "evicted": 0, "kept": 0}
+
+        records = self.records()
+        full = self.full_matrix()
+        usage = self._read_usage()
+        hits = np.zeros(count, dtype=np.int64)
+        last_used = np.zeros(count)
+        for row, record in enumerate(records):
+            stats = usage.get(record.get("key"))
+            if stats:
+                hits[row], last_used[row] = stats["hits"], stats["last_used"]
+            else:
+                # Never retrieved: age from when it was saved (legacy rows count as oldest)
+                last_used[row] = record.get("created", 0.0)
+
+        alive = np.ones(count, dtype=bool)
+        merged = 0
+        if threshold and threshold > 0:
+            group_ids = {}
+            groups = np.array([group_ids.setdefault(cluster_group(record), len(group_ids)) for record in records])
+            # Best rows first (np.lexsort sorts by the last key first)
+            order = np.lexsort((-np.arange(count), -last_used, -hits))
+            for start in range(0, count, DEDUPE_BLOCK):
+                block = order[start:start + DEDUPE_BLOCK]
+                block = block[alive[block]]
+                if not len(block):
+                    continue
+                similarities = np.asarray(full[block], dtype=np.float32) @ np.asarray(full, dtype=np.float32).T
+                for i, row in enumerate(block):
+                    if not alive[row]:
+                        continue
+                    duplicates = np.flatnonzero(alive & (groups == groups[row]) & (similarities[i] >= threshold))
+                    duplicates = duplicates[duplicates != row]
+                    if len(duplicates):
+                        alive[duplicates] = False
+                        hits[row] += hits[duplicates].sum()
+                        last_used[row] = max(last_used[row], last_used[duplicates].max())
+                        merged += len(duplicates)
+
+        survivors = np.flatnonzero(alive)
+        evicted = 0
+        if max_entries and len(survivors) > max_entries:
+            if policy == "lfu":
+                ranking = np.lexsort((last_used[survivors], hits[survivors]))
+            else:
+                ranking = np.lexsort((hits[survivors], last_used[survivors]))
+            evicted = len(survivors) - max_entries
+            survivors = np.sort(survivors[ranking[evicted:]])
+
+        if merged or evicted:
+            self._rewrite_locked(survivors, hits, last_used)
+            print(f"Memory: Pruned {merged} near-duplicate and {evicted} evicted recipes ({len(survivors)} kept).")
+        return {"merged": merged, "evicted": evicted, "kept": int(len(survivors))}
+
+    def _rewrite_locked(self, rows, hits, last_used):
+        """Writes the given rows (and their usage) as the next generation and commits it."""
+        header = dict(self._read_header())
+        old_generation = header.get("generation", 0)
+        generation = old_generation + 1
+        dtype = header.get("dtype", "float32")
+        records = self.records()
+        full = self.full_matrix()
+
+        # Stale files from an interrupted rewrite of this generation
+        for path, _, _ in self._row_files(header["dim"], dtype, generation):
+            if os.path.exists(path):
+                os.remove(path)
+        for start in range(0, len(rows), INITIAL_CAPACITY):
+            chunk = rows[start:start + INITIAL_CAPACITY]
+            self._write_rows(start, np.asarray(full[chunk], dtype=np.float32), dtype, generation)
+
+        payload = "".join(json.dumps(records[row]) + "\n" for row in rows).encode("utf-8")
+        with open(self._data_path(RECORDS_FILE, generation), "wb") as f:
+            f.write(payload)
+        with open(self._usage_path(generation), "w") as f:
+            for row in rows:
+                key = records[row].get("key")
+                if key and hits[row]:
+                    f.write(json.dumps({"key": key, "hits": int(hits[row]), "last_used": float(last_used[row])}) + "\n")
+
+        old_files = [path for path, _, _ in self._row_files(header["dim"], dtype, old_generation)]
+        old_files += [self._data_path(RECORDS_FILE, old_generation), self._usage_path(old_generation)]
+
+        header["count"] = int(len(rows))
+        header["records_bytes"] = len(payload)
+        header["generation"] = generation
+        self._write_header(header)
+
+        # Open memory maps keep the old inodes alive, so removal is safe for concurrent readers
+        # (on Windows it fails while they are mapped; the leftovers are never read again)
+        for path in old_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._records = None
+        self._keys = None
+        self._matrix = None
+        self._full_matrix = None
+
+    # --- ANN INDEX ---
+    def _build_index(self):
+        """
+        Brings the IVF index up to date with the committed rows and saves it
+        (write path: called under the file lock by compaction, prune and bulk
+        adds). New rows are inserted incrementally; the index is re-clustered
+        once the store outgrows it. None while the store is small enough for
+        exact search.
+        """
+        header = self._read_header()
+        count = header["count"]
+        if not self.ann_min_size or count < self.ann_min_size:
+            self._index = None
+            return None
+
+        generation = header.get("generation", 0)
+        index = self._index
+        if index is None or self._index_generation != generation or index.count > count:
+            index, meta = IVFIndex.load(self.index_path)
+            if index is not None and (meta.get("generation") != generation or index.count > count):
+                index = None  # Stale file (rows rewritten since it was built)
+
+        matrix = self.matrix()
+        changed = False
+        if index is None or index.needs_retrain(count):
+            index = IVFIndex()
+            index.train(matrix)
+            changed = True
+        elif index.count < count:
+            index.add(np.arange(index.count, count), matrix[index.count:count])
+            changed = True
+
+        self._index, self._index_generation = index, generation
+        if changed or not os.path.exists(self.index_path):
+            index.save(self.index_path, generation=generation)
+            self._index_mtime = self._file_mtime(self.index_path)
+        return index
+
+    @staticmethod
+    def _file_mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _current_index(self):
+        """
+        Query path: the saved IVF index of the current generation, or None (exact
+        scan) while there is none. Never trains; rows committed after the index
+        was saved are scanned exactly by search().
+        """
+        header = self._read_header()
+        count = header["count"]
+        if not self.ann_min_size or count < self.ann_min_size:
+            return None
+
+        generation = header.get("generation", 0)
+        mtime = self._file_mtime(self.index_path)
+        index = self._index
+        stale = index is None or self._index_generation != generation or index.count > count
+        if stale or (index.count < count and mtime != self._index_mtime):
+            # Another handle (or process) may have saved a newer index
+            index, meta = IVFIndex.load(self.index_path) if mtime is not None else (None, None)
+            if index is not None and (meta.get("generation") != generation or index.count > count):
+                index = None
+            self._index, self._index_generation, self._index_mtime = index, generation, mtime
+        return index
+
+    # --- READ PATH ---
+    def matrix(self):
+        """
+        Returns a read-only view of the committed rows: the float32 memory map, or
+        a DequantizedView over float16/int8 codes (dequantised per accessed row).
+        """
+        with self._lock:
+            header = self._read_header()
+            if header["count"] == 0:
+                return np.zeros((0, header["dim"] or 0), dtype=np.float32)
+            if self._matrix is None:
+                count = header["count"]
+                codes = np.load(self.embeddings_path, mmap_mode="r")[:count]
+                dtype = header.get("dtype", "float32")
+                if dtype == "float32":
+                    self._matrix = codes
+                else:
+                    scales = np.load(self.scales_path, mmap_mode="r")[:count] if dtype == "int8" else None
+                    self._matrix = DequantizedView(codes, scales)
+            return self._matrix
+
+    def full_matrix(self):
+        """Full-precision rows (the matrix itself for float32 stores)."""
+        with self._lock:
+            header = self._read_header()
+            if header.get("dtype", "float32") == "float32" or header["count"] == 0:
+                return self.matrix()
+            if self._full_matrix is None:
+                self._full_matrix = np.load(self.full_path, mmap_mode="r")[:header["count"]]
+            return self._full_matrix
+
+    def _load_records_tail(self, end_bytes):
+        with open(self.records_path, "rb") as f:
+            f.seek(self._records_bytes)
+            data = f.read(end_bytes - self._records_bytes)
+        for line in data.decode("utf-8").splitlines():
+            record = json.loads(line)
+            self._records.append(record)
+            if self._keys is not None and record.get("key"):
+                self._keys.add(record["key"])
+        self._records_bytes = end_bytes
+
+    def records(self):
+        """Returns the committed metadata table as a list of dicts (row i <-> matrix row i)."""
+        with self._lock:
+            header = self._read_header()
+            if self._records is None:
+                self._records = []
+                self._records_bytes = 0
+                if header["count"] and os.path.exists(self.records_path):
+                    # Only read up to the committed offset; anything past it is an unfinished write
+                    self._load_records_tail(header["records_bytes"])
+            return self._records
+
+    def all_records(self):
+        """Committed rows followed by entries still waiting in the log."""
+        with self._lock:
+            self._refresh()
+            return list(self.records()) + list(self._log_records)
+
+    def get(self, row):
+        return self.records()[row]
+
+    def search(self, vector, top_k=1, n_probe=None, exact=False, rescore=None):
+        """
+        Cosine similarity search over all committed rows and pending log entries.
+        Large stores go through the IVF index (n_probe trades recall for speed);
+        exact=True forces a full scan. Quantised stores are searched on their
+        codes and, unless rescore=False, the best top_k * rescore_factor
+        candidates are re-ranked at full precision.
+        Returns (record, score) tuples, best first.
+        """
+        with self._lock:
+            self._refresh()
+            matrix = self.matrix()
+            records = self.records()
+            index = None if exact else self._current_index()
+            quantized = self.dtype != "float32" and len(matrix) > 0
+            full_matrix = self.full_matrix() if quantized else None
+            log_vectors = list(self._log_vectors)
+            log_records = list(self._log_records)
+
+        dim = matrix.shape[1] if len(matrix) else (len(log_vectors[0]) if log_vectors else None)
+        if dim is None:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (dim,):
+            print(f"Warning: Embedding dimension mismatch ({query.shape} vs ({dim},)). Skipping memory search.")
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        rescore = quantized and self.rescore_factor > 0 and rescore is not False
+        fetch = top_k * self.rescore_factor if rescore else top_k
+
+        # The matrix and the log never overlap (compaction switches both in one commit)
+        if index is not None:
+            rows = index.search(query, matrix, fetch, n_probe=n_probe)
+            if index.count < len(matrix):
+                # Rows added since the index was saved: exact scan until the next rebuild
+                if isinstance(matrix, DequantizedView):
+                    tail = matrix.dot(query, index.count, len(matrix))
+                else:
+                    tail = scan_scores(matrix[index.count:], query)
+                rows += [(index.count + row, score) for row, score in select_top_k(tail, fetch)]
+                rows = sorted(rows, key=lambda hit: -hit[1])[:fetch]
+        elif len(matrix):
+            rows = select_top_k(scan_scores(matrix, query), fetch)
+        else:
+            rows = []
+
+        if rescore and rows:
+            ids = np.sort([row for row, _ in rows])
+            exact_scores = np.asarray(full_matrix[ids], dtype=np.float32) @ query
+            rows = [(int(ids[i]), score) for i, score in select_top_k(exact_scores, top_k)]
+
+        hits = [(records[row], score) for row, score in rows[:top_k]]
+        if log_records:
+            log_scores = np.stack(log_vectors) @ query
+            hits.extend((log_records[i], score) for i, score in select_top_k(log_scores, top_k))
+
+        hits.sort(key=lambda hit: -hit[1])
+        return hits[:top_k]
+
+    # --- BULK WRITE PATH ---
+    def _ensure_file(self, path, dtype, row_shape, needed):
+        """Creates or grows (by doubling) one pre-allocated, row-aligned .npy file."""
+        if os.path.exists(path):
+            current = np.load(path, mmap_mode="r")
+            capacity = current.shape[0]
+            if needed <= capacity:
+                return
+            new_capacity = max(capacity * 2, needed)
+            tmp_path = path + ".tmp.npy"
+            grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(new_capacity,) + row_shape)
+            grown[:capacity] = current
+            grown.flush()
+            del grown, current
+            os.replace(tmp_path, path)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            capacity = max(INITIAL_CAPACITY, needed)
+            created = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(capacity,) + row_shape)
+            created.flush()
+            del created
+
+    def _row_files(self, dim, dtype, generation=None):
+        """(path, numpy dtype, row shape) of every row-aligned file for a storage type."""
+        files = [(self._data_path(EMBEDDINGS_FILE, generation), dtype, (dim,))]
+        if dtype == "int8":
+            files.append((self._data_path(SCALES_FILE, generation), "float32", ()))
+        if dtype != "float32":
+            files.append((self._data_path(FULL_PRECISION_FILE, generation), "float32", (dim,)))
+        return files
+
+    def _write_rows(self, start, vectors, dtype, generation=None):
+        codes, scales = quantize(vectors, dtype)
+        columns = dict(zip(
+            (self._data_path(name, generation) for name in (EMBEDDINGS_FILE, SCALES_FILE, FULL_PRECISION_FILE)),
+            (codes, scales, vectors)
+        ))
+        for path, file_dtype, row_shape in self._row_files(vectors.shape[1], dtype, generation):
+            self._ensure_file(path, file_dtype, row_shape, start + len(vectors))
+            mapped = np.lib.format.open_memmap(path, mode="r+")
+            mapped[start:start + len(vectors)] = columns[path]
+            mapped.flush()
+            del mapped
+        self._matrix = None
+        self._full_matrix = None
+
+    def _add_many_locked(self, vectors, records, model=None, log_generation=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected a 2D batch of vectors, got shape {vectors.shape}")
+
+        self.records()  # Make sure the metadata cache is in sync before appending to it
+        header = dict(self._read_header())
+        header.setdefault("generation", 0)
+        if header["dim"] is None:
+            header["dim"] = int(vectors.shape[1])
+            header["model"] = model or self.default_model
+            header["dtype"] = self.default_dtype
+        elif vectors.shape[1] != header["dim"]:
+            raise ValueError(f"Embedding dimension mismatch ({vectors.shape[1]} vs {header['dim']}).")
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        start = header["count"]
+        end = start + len(vectors)
+
+        # 1. Vectors first, 2. metadata, 3. header (the commit point)
+        self._write_rows(start, vectors, header.get("dtype", "float32"))
+
+        payload = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self.records_path, "ab") as f:
+            # Drop metadata left behind by an interrupted write past the committed offset
+            f.truncate(header["records_bytes"])
+            f.write(payload)
+
+        header["count"] = end
+        header["records_bytes"] += len(payload)
+        if log_generation is not None:
+            header["log_generation"] = log_generation
+        self._write_header(header)
+
+        # Keep the cached metadata table and key index warm instead of re-reading the file
+        self._records.extend(records)
+        self._records_bytes = header["records_bytes"]
+        if self._keys is not None:
+            self._keys.update(r.get("key") for r in records if r.get("key"))
+        return list(range(start, end))
+
+    def add_many(self, vectors, records, model=None):
+        """
+        Appends rows straight into the matrix (bulk loads and migrations).
+        Returns the row ids assigned. Raises ValueError on a dimension mismatch.
+        """
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records must have the same length")
+        if not records:
+            return []
+        def work(store):
+            rows = store._add_many_locked(vectors, records, model=model)
+            store._build_index()
+            return rows
+        return self._write(work)
+
+    def add(self, vector, record, model=None):
+        return self.add_many([vector], [record], model=model)[0]
+
+    # --- MIGRATION ---
+    def import_json(self, json_path, model=None):
+        """
+        One-off migration from the legacy code_memory.json list.
+        Entries without an embedding (or with a different dimension than the
+        first usable one) are skipped. Returns the number of imported rows.
+        """
+        with open(json_path, "r") as f:
+            try:
+                entries = json.load(f)
+            except json.JSONDecodeError:
+                return 0
+
+        def work(store):
+            # Another worker may have migrated concurrently; the key index makes this idempotent
+            store._refresh()
+            existing = store._key_index()
+            vectors, records = [], []
+            dim = store._header["dim"]
+            for entry in entries:
+                embedding = entry.get("embedding")
+                if not embedding:
+                    continue
+                if dim is None:
+                    dim = len(embedding)
+                if len(embedding) != dim:
+                    print(f"Warning: Skipping legacy memory entry with dimension {len(embedding)} (store uses {dim}).")
+                    continue
+                query, code = entry.get("query", ""), entry.get("code", "")
+                key = make_key(query, code)
+                if key in existing:
+                    continue
+                vectors.append(embedding)
+                records.append({
+                    "key": key,
+                    "query": query,
+                    "code": code,
+                    "plan": entry.get("plan", "")
+                })
+
+            if records:
+                store._add_many_locked(vectors, records, model=model)
+                store._build_index()
+            return len(records)
+        return self._write(work)
+
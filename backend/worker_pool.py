@@ -0,0 +1,327 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: only the wall-clock limit applies
+    resource = None
+
+# Generated code runs in these worker processes instead of the server process.
+# Workers are forked by multiprocessing's forkserver (POSIX), a single-threaded
+# process that has already imported xarray, numpy, scipy and matplotlib, so a job
+# pays neither interpreter start-up nor import time, and a worker never inherits
+# the server's threads, held locks or open files (even when it is replaced from a
+# request thread). Several jobs run at once on separate cores. 0 = execute_python_code
+# runs generated code in the server process (candidate runs still use one worker).
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Workers are replaced after this many jobs (leaked figures, caches, fragmentation)
+MAX_JOBS_PER_WORKER = int(os.getenv("EXECUTOR_MAX_JOBS_PER_WORKER", "50"))
+POLL_INTERVAL = 0.05
+
+# Per-execution limits (0 = unlimited). One runaway program, e.g. ds['temp'].values
+# on a multi-GB 3D file, fails with a hint for the fixer instead of pinning a core
+# or exhausting the server's memory.
+EXEC_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "300"))            # wall clock, seconds
+EXEC_CPU_LIMIT = int(os.getenv("EXEC_CPU_LIMIT", "300"))          # CPU time, seconds
+EXEC_MEMORY_LIMIT_MB = int(os.getenv("EXEC_MEMORY_LIMIT_MB", "4096"))  # extra address space per job
+
+# Module settings a worker takes over from the server when it starts: workers
+# don't share the server's memory, so values changed at runtime are sent along.
+WORKER_SETTINGS = {
+    "worker_pool": ("EXECUTOR_WORKERS", "EXEC_CPU_LIMIT", "EXEC_MEMORY_LIMIT_MB"),
+    "out_of_core": ("OUT_OF_CORE", "OUT_OF_CORE_FRACTION", "DASK_CHUNK_MB", "DASK_THREADS"),
+    "rasterize": ("RASTER_MIN_TRIANGLES", "RASTER_WIDTH"),
+}
+# Imported once by the forkserver, before any worker is forked
+PRELOAD = ["code_executor"]
+
+LIMIT_HINTS = {
+    "time": "The code took too long. Work on a subset (a time slice, a region, a single layer) "
+            "or reduce with .mean()/.max() along a dimension before loading values.",
+    "cpu": "The code used too much CPU time. Avoid Python loops over nodes or time steps; "
+           "use vectorised xarray/numpy operations on a subset of the data.",
+    "memory": "The code ran out of memory. Do not load whole variables with .values; use chunking "
+              "(loop over time steps or layers with .isel() and accumulate), select a subset with "
+              ".isel()/.sel(), or reduce along a dimension first.",
+}
+
+
+def limit_result(kind, detail, stdout=""):
+    """Failed execution result for a limit that was hit, with a hint the fixer prompt can act on."""
+    return {"stdout": stdout, "stderr": f"{detail}\n{LIMIT_HINTS[kind]}", "images": [],
+            "success": False, "limit": kind}
+
+
+class CPULimitExceeded(BaseException):
+    # BaseException so that a bare `except Exception` in generated code cannot swallow it
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _vm_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _apply_limits():
+    """Soft rlimits for the next job, relative to what the worker has used so far."""
+    if resource is None:
+        return
+    if EXEC_CPU_LIMIT > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _set_soft_limit(resource.RLIMIT_CPU, used + EXEC_CPU_LIMIT)
+    vm = _vm_bytes()
+    if EXEC_MEMORY_LIMIT_MB > 0 and vm is not None:
+        _set_soft_limit(resource.RLIMIT_AS, vm + EXEC_MEMORY_LIMIT_MB * 1024 * 1024)
+
+
+def _clear_limits():
+    if resource is None:
+        return
+    for limit in (resource.RLIMIT_CPU, resource.RLIMIT_AS):
+        _set_soft_limit(limit, resource.getrlimit(limit)[1])
+
+
+def _set_soft_limit(limit, value):
+    hard = resource.getrlimit(limit)[1]
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    try:
+        resource.setrlimit(limit, (value, hard))
+    except (ValueError, OSError) as e:
+        print(f"Warning: could not set resource limit: {e}")
+
+
+def _warm_up():
+    # First-use costs that would otherwise land on the first job: xarray's backend
+    # entry-point scan, matplotlib's font loading / first PNG render, and dask's
+    # thread pool (its stacks and malloc arenas would count against the job's
+    # memory limit)
+    import io
+    import xarray as xr
+    import matplotlib.pyplot as plt
+    from out_of_core import dask, dask_scheduler
+
+    xr.backends.list_engines()
+    fig = plt.figure(figsize=(1, 1))
+    plt.plot([0, 1])
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+    if dask is not None:
+        import dask.array as da
+        with dask_scheduler():
+            da.ones(64, chunks=1).sum().compute()
+
+
+def _current_settings():
+    return {name: {key: getattr(sys.modules[name], key) for key in keys}
+            for name, keys in WORKER_SETTINGS.items() if name in sys.modules}
+
+
+def _apply_settings(settings):
+    for name, values in settings.items():
+        module = importlib.import_module(name)
+        for key, value in values.items():
+            setattr(module, key, value)
+
+
+def _worker_main(conn, settings):
+    """Worker loop: receive (code, netcdf_path, scenario_path), send back the result dict."""
+    import matplotlib.pyplot as plt
+    from code_executor import _execute_python_code
+    from dataset_cache import dataset_cache
+    from mesh import triangulation_cache
+
+    _apply_settings(settings)
+    # Start from empty caches: nothing opened before this process existed is ours
+    dataset_cache.reset()
+    triangulation_cache.reset()
+    plt.switch_backend("Agg")
+    try:
+        _warm_up()
+    except Exception as e:
+        print(f"Worker warm-up failed: {e}")
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    conn.send("ready")
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        try:
+            _apply_limits()
+            result = _execute_python_code(*job)
+        except CPULimitExceeded:
+            result = limit_result("cpu", f"Execution exceeded the {EXEC_CPU_LIMIT}s CPU time limit.")
+        except Exception as e:
+            result = {"stdout": "", "stderr": f"Worker error: {e}", "images": [], "success": False}
+        finally:
+            _clear_limits()
+        plt.close("all")
+        conn.send(result)
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, _current_settings()), daemon=True,
+                                   name="code-worker")
+        self.process.start()
+        child.close()
+        self.jobs = 0
+        self.ready = False
+        self._ready_lock = threading.Lock()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the worker has finished importing / warming up."""
+        with self._ready_lock:
+            if not self.ready and self.conn.poll(timeout):
+                self.ready = self.conn.recv() == "ready"
+        return self.ready
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.terminate()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            self.process.terminate()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of warm worker processes. run() borrows an idle worker,
+    sends it the job over a pipe and waits for the result. A cancelled job or a
+    crashed worker costs one worker, which is replaced straight away.
+    """
+
+    def __init__(self, size=EXECUTOR_WORKERS, max_jobs=MAX_JOBS_PER_WORKER):
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(PRELOAD)
+        else:  # Windows
+            self._ctx = multiprocessing.get_context("spawn")
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"jobs": 0, "cancelled": 0, "crashed": 0, "restarts": 0, "timed_out": 0, "limited": 0}
+        for _ in range(self.size):
+            self._idle.put(_Worker(self._ctx))
+
+    def wait_ready(self, timeout=30):
+        """Waits for every idle worker to be warm (call at start-up, after get_worker_pool)."""
+        deadline = time.time() + timeout
+        return all(worker.wait_ready(max(0, deadline - time.time())) for worker in list(self._idle.queue))
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _give_back(self, worker, replace=False):
+        if replace or (self.max_jobs and worker.jobs >= self.max_jobs):
+            worker.stop(kill=replace)
+            if self._closed:
+                return
+            worker = _Worker(self._ctx)
+            self._count("restarts")
+        self._idle.put(worker)
+
+    def _borrow(self, cancel_event):
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            try:
+                return self._idle.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def run(self, code_string, netcdf_path, scenario_path=None, cancel_event=None, timeout=EXEC_TIMEOUT):
+        """
+        Runs one program on a worker. Returns the execute_python_code result dict.
+        A job still running after `timeout` seconds (0 = none) has its worker killed
+        and comes back as a limit_result("time", ...).
+        """
+        if self._closed:
+            raise RuntimeError("Worker pool is shut down")
+        worker = self._borrow(cancel_event)
+        if worker is None:
+            self._count("cancelled")
+            return {"stdout": "", "stderr": "Cancelled.", "images": [], "success": False, "cancelled": True}
+
+        try:
+            worker.wait_ready()
+            worker.conn.send((code_string, netcdf_path, scenario_path))
+            worker.jobs += 1
+            self._count("jobs")
+            deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+            while not worker.conn.poll(POLL_INTERVAL):
+                if cancel_event is not None and cancel_event.is_set():
+                    self._count("cancelled")
+                    self._give_back(worker, replace=True)
+                    return {"stdout": "", "stderr": "Cancelled.", "images": [], "success": False, "cancelled": True}
+                if deadline is not None and time.monotonic() > deadline:
+                    self._count("timed_out")
+                    self._give_back(worker, replace=True)
+                    return limit_result("time", f"Execution exceeded the {timeout:g}s time limit.")
+                if not worker.process.is_alive():
+                    break
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            self._count("crashed")
+            worker.process.join(timeout=1)
+            exitcode = worker.process.exitcode
+            self._give_back(worker, replace=True)
+            return {"stdout": "", "stderr": f"Worker process exited with code {exitcode}",
+                    "images": [], "success": False}
+        if result.get("limit"):
+            self._count("limited")
+        self._give_back(worker)
+        return result
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, workers=self.size, idle=self._idle.qsize())
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """The process-wide pool, started on first use (call early to start the workers at start-up)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+    return _pool